@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量格式化工具
+功能：对目录或通配符匹配到的所有.docx文档并行执行 清理 → 应用 → 验证 流水线
+每个工作进程在初始化时只加载一次格式信息和格式模板，处理结果汇总为批处理清单
+"""
+
+import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from config import config
+from format_pipeline import FormatPipeline, write_plan_records
+from template_profile_cache import TemplateProfileCache
+from stage_metrics import StageMetrics
+from format_logging import get_logger, configure_logging, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('batch_format_runner')
+
+# 工作进程内的流水线实例，由_init_worker创建，进程内所有文档共用
+_worker_pipeline = None
+
+def _init_worker(format_info_path, template_path, log_level='WARNING', log_json=False,
+                 coalesce_runs=None, slim_xml=None, used_styles_only=None):
+    """
+    工作进程初始化：配置日志，加载格式信息和格式模板（每个进程只执行一次）
+    """
+    global _worker_pipeline
+    configure_logging(log_level, json_format=log_json)
+    _worker_pipeline = FormatPipeline(format_info_path, template_path, metrics=StageMetrics(),
+                                      coalesce_runs=coalesce_runs, slim_xml=slim_xml,
+                                      used_styles_only=used_styles_only)
+    if not _worker_pipeline.load():
+        _worker_pipeline = None
+
+def _process_one(input_path, output_path, report_path, validate):
+    """
+    在工作进程中处理单个文档，返回清单条目
+    """
+    entry = {
+        'input': input_path,
+        'output': output_path,
+        'report': report_path if validate else None,
+        'status': 'failed'
+    }
+    start = time.perf_counter()
+    
+    if _worker_pipeline is None:
+        entry['error'] = '工作进程未能加载格式信息'
+        return entry
+    
+    report = _worker_pipeline.process_document(input_path, output_path, report_path, validate=validate)
+    entry['duration_seconds'] = round(time.perf_counter() - start, 3)
+    
+    if report is None:
+        entry['error'] = '流水线处理失败'
+        return entry
+    
+    entry['status'] = 'ok'
+    entry['cleaned_runs'] = _worker_pipeline.cleaner.cleaned_runs
+    entry['total_runs'] = _worker_pipeline.cleaner.total_runs
+    entry['metrics'] = _worker_pipeline.metrics_path
+    if report:
+        entry['validation'] = summarize_validation(report)
+    return entry
+
+def _plan_one(input_path):
+    """
+    在工作进程中计划单个文档的格式修改，返回JSONL记录
+    """
+    if _worker_pipeline is None:
+        return {'doc': input_path, 'error': '工作进程未能加载格式信息'}
+    
+    start = time.perf_counter()
+    record = _worker_pipeline.plan_document(input_path, doc_id=input_path)
+    if record is None:
+        return {'doc': input_path, 'error': '计划失败'}
+    record['duration_seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+def summarize_validation(report):
+    """
+    从完整验证报告中提取清单所需的摘要
+    """
+    counts = {'matched': 0, 'different': 0, 'missing': 0}
+    for comparison in report.get('style_comparison', {}).values():
+        counts[comparison['status']] = counts.get(comparison['status'], 0) + 1
+    
+    total = sum(counts.values())
+    counts['match_rate'] = round(counts['matched'] / total * 100, 1) if total else None
+    return counts
+
+def collect_input_documents(inputs):
+    """
+    展开输入目录和通配符，返回去重后的.docx文件列表（忽略Word临时文件~$*.docx）
+    """
+    documents = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, '*.docx'))
+        else:
+            candidates = glob.glob(item)
+        
+        for path in sorted(candidates):
+            name = os.path.basename(path)
+            if name.lower().endswith('.docx') and not name.startswith('~$') and path not in documents:
+                documents.append(path)
+    
+    return documents
+
+class BatchFormatRunner:
+    def __init__(self, format_info_path=None, template_path=None, output_dir=None, workers=None, validate=True,
+                 worker_log_level='WARNING', log_json=False, coalesce_runs=None, slim_xml=None,
+                 used_styles_only=None):
+        """
+        worker_log_level: 工作进程的日志级别（默认只输出警告和错误，避免逐文档的明细刷屏）
+        coalesce_runs、slim_xml、used_styles_only: 传给每个工作进程的流水线，未指定时按配置
+        """
+        if format_info_path is None and template_path is None:
+            format_info_path = config.DYNAMIC_FORMAT_INFO
+        self.format_info_path = format_info_path
+        self.template_path = template_path
+        self.output_dir = output_dir or config.BATCH_OUTPUT_DIR
+        self.workers = workers or os.cpu_count() or 1
+        self.validate = validate
+        self.worker_log_level = worker_log_level
+        self.log_json = log_json
+        self.coalesce_runs = coalesce_runs
+        self.slim_xml = slim_xml
+        self.used_styles_only = used_styles_only
+    
+    def _plan_outputs(self, documents):
+        """
+        为每个输入文档分配输出文档和验证报告路径，同名文档自动加序号
+        """
+        planned = []
+        used_stems = {}
+        for input_path in documents:
+            stem = os.path.splitext(os.path.basename(input_path))[0]
+            used_stems[stem] = used_stems.get(stem, 0) + 1
+            if used_stems[stem] > 1:
+                stem = f"{stem}_{used_stems[stem]}"
+            
+            output_path = os.path.join(self.output_dir, f"{stem}_格式化后.docx")
+            report_path = os.path.join(self.output_dir, f"{stem}_验证报告.json")
+            planned.append((input_path, output_path, report_path))
+        return planned
+    
+    def _warm_profile_cache(self):
+        """
+        只指定模板时在主进程中预热模板格式缓存，工作进程初始化时直接命中缓存
+        返回模板内容摘要（使用格式信息文件时为None），失败时返回False
+        """
+        if not self.template_path or self.format_info_path:
+            return None
+        profile = TemplateProfileCache().get_profile(self.template_path)
+        if profile is None:
+            logger.error(f"错误：无法获取模板格式信息: {self.template_path}")
+            return False
+        return profile.get('template_sha256')
+    
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_init_worker,
+                                   initargs=(self.format_info_path, self.template_path,
+                                             self.worker_log_level, self.log_json,
+                                             self.coalesce_runs, self.slim_xml, self.used_styles_only))
+    
+    def plan(self, inputs, plan_path):
+        """
+        计划模式：并行计算每个文档将要进行的修改（样式属性、run级别直接格式、页眉页脚），
+        每个文档一行写入JSONL，不保存任何文档，返回汇总统计
+        """
+        documents = collect_input_documents(inputs)
+        if not documents:
+            logger.error("错误：未找到需要处理的.docx文档")
+            return None
+        
+        if self._warm_profile_cache() is False:
+            return None
+        
+        logger.info(f"计划 {len(documents)} 个文档的格式修改，工作进程数: {self.workers}")
+        start = time.perf_counter()
+        
+        records = []
+        with self._executor() as executor:
+            futures = {executor.submit(_plan_one, input_path): input_path for input_path in documents}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {'doc': futures[future], 'error': str(e)}
+                records.append(record)
+        
+        order = {path: index for index, path in enumerate(documents)}
+        records.sort(key=lambda item: order[item['doc']])
+        
+        summary = write_plan_records(records, plan_path)
+        summary['duration_seconds'] = round(time.perf_counter() - start, 3)
+        logger.summary('format_plan', f"格式修改计划完成: {summary['documents']} 个文档，需要修改 {summary['changed']} 个，"
+                       f"已符合模板 {summary['unchanged']} 个，失败 {summary['failed']} 个，耗时 {summary['duration_seconds']}s",
+                       **summary)
+        logger.info(f"格式修改计划已保存到: {plan_path}")
+        return summary
+    
+    def run(self, inputs, manifest_path=None):
+        """
+        并行处理所有输入文档，写出批处理清单并返回
+        """
+        documents = collect_input_documents(inputs)
+        if not documents:
+            logger.error("错误：未找到需要处理的.docx文档")
+            return None
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        if manifest_path is None:
+            manifest_path = os.path.join(self.output_dir, config.BATCH_MANIFEST_NAME)
+        
+        template_digest = self._warm_profile_cache()
+        if template_digest is False:
+            return None
+        
+        logger.info(f"批量格式化 {len(documents)} 个文档，工作进程数: {self.workers}")
+        start = time.perf_counter()
+        
+        entries = []
+        with self._executor() as executor:
+            futures = {
+                executor.submit(_process_one, input_path, output_path, report_path, self.validate): input_path
+                for input_path, output_path, report_path in self._plan_outputs(documents)
+            }
+            for future in as_completed(futures):
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    entry = {'input': futures[future], 'status': 'failed', 'error': str(e)}
+                entries.append(entry)
+                logger.info(f"[{len(entries)}/{len(documents)}] {entry['status']}: {entry['input']}",
+                            fields={'doc_id': os.path.basename(entry['input']), 'status': entry['status']})
+        
+        order = {path: index for index, path in enumerate(documents)}
+        entries.sort(key=lambda item: order[item['input']])
+        succeeded = sum(1 for entry in entries if entry['status'] == 'ok')
+        
+        manifest = {
+            'created_at': datetime.now().isoformat(),
+            'format_info': self.format_info_path,
+            'template_file': self.template_path,
+            'template_sha256': template_digest,
+            'workers': self.workers,
+            'total_documents': len(entries),
+            'succeeded': succeeded,
+            'failed': len(entries) - succeeded,
+            'duration_seconds': round(time.perf_counter() - start, 3),
+            'documents': entries
+        }
+        
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        
+        logger.summary('batch', f"批量格式化完成: 成功 {succeeded}，失败 {len(entries) - succeeded}，耗时 {manifest['duration_seconds']}s",
+                       documents=len(entries), succeeded=succeeded, failed=len(entries) - succeeded)
+        logger.info(f"批处理清单已保存到: {manifest_path}")
+        return manifest
+
+def main():
+    """
+    主函数：批量格式化目录或通配符匹配的文档
+    """
+    parser = argparse.ArgumentParser(description="使用进程池批量格式化.docx文档")
+    parser.add_argument('inputs', nargs='+', help="输入目录或通配符（如 submissions/*.docx）")
+    parser.add_argument('--template', default=None, help="格式模板文档（默认使用格式信息中记录的模板）")
+    parser.add_argument('--format-info', default=None, help="格式信息文件（只指定模板时使用模板格式缓存）")
+    parser.add_argument('-o', '--output-dir', default=config.BATCH_OUTPUT_DIR, help="输出目录")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument('--manifest', default=None, help="批处理清单路径（默认输出目录下的batch_manifest.json）")
+    parser.add_argument('--no-validate', action='store_true', help="跳过格式验证")
+    parser.add_argument('--coalesce-runs', action='store_true', default=None,
+                        help="清理后合并格式相同的相邻run")
+    parser.add_argument('--slim-xml', action='store_true', default=None,
+                        help="加载前删除修订标识、校对标记等不影响排版的XML")
+    parser.add_argument('--used-styles-only', action='store_true', default=None,
+                        help="只应用文档实际使用的样式（及其基础样式链）")
+    parser.add_argument('--plan', default=None, metavar='JSONL',
+                        help="只计划将要进行的修改并写入JSONL，不保存任何文档")
+    parser.add_argument('--worker-log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="工作进程的日志级别")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    if args.format_info and not os.path.exists(args.format_info):
+        print(f"错误：找不到格式信息文件 {args.format_info}")
+        print("请先运行 dynamic_format_extractor.py 提取格式信息")
+        return
+    
+    runner = BatchFormatRunner(args.format_info, args.template, args.output_dir,
+                               args.workers, validate=not args.no_validate,
+                               worker_log_level=args.worker_log_level, log_json=args.log_json,
+                               coalesce_runs=args.coalesce_runs, slim_xml=args.slim_xml,
+                               used_styles_only=args.used_styles_only)
+    if args.plan:
+        runner.plan(args.inputs, args.plan)
+    else:
+        runner.run(args.inputs, args.manifest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+格式化流水线基准测试
+功能：生成规模可控的合成.docx文档（段落数、每段run数、直接格式比例、表格、分节、页眉页脚、
+嵌入图片大小、样式数），按规模梯度运行真实的清理器、应用器和验证器，记录各阶段耗时，
+并将结果追加到历史记录文件，与上一次相同规模的结果比较以发现性能回退
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import struct
+import zlib
+import random
+import platform
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Pt, Inches
+from config import config
+from format_pipeline import FormatPipeline
+from run_format_cleaner import RunFormatCleaner
+from dynamic_format_applier import DynamicFormatApplier
+from format_validator import FormatValidator
+from stage_metrics import StageMetrics
+
+# 合成文本使用的中英文词汇
+CHINESE_WORDS = ['研究', '方法', '实验', '结果', '分析', '模型', '数据', '系统', '设计', '表明',
+                 '基于', '提出', '性能', '算法', '结构', '影响', '因素', '显著', '验证', '优化']
+ENGLISH_WORDS = ['model', 'data', 'analysis', 'method', 'result', 'system', 'network', 'design',
+                 'performance', 'algorithm', 'structure', 'significant', 'validation', 'optimization']
+
+# 直接格式可能使用的字体和字号
+DIRECT_FONTS = [('Times New Roman', '宋体'), ('Arial', '黑体'), ('Calibri', '楷体'), ('Cambria', '仿宋')]
+DIRECT_SIZES = [9, 10.5, 12, 14, 16]
+
+# 性能回退判定阈值：总耗时比上一次相同规模的结果慢20%以上
+REGRESSION_THRESHOLD = 0.2
+
+def make_noise_png(size_bytes, seed=0):
+    """
+    生成随机噪声PNG图片（不可压缩，文件大小约为size_bytes）
+    """
+    rng = random.Random(seed)
+    pixels = max(size_bytes // 3, 1)
+    width = max(int(pixels ** 0.5), 1)
+    height = max(pixels // width, 1)
+    
+    row_bytes = width * 3
+    raw = b''.join(b'\x00' + rng.getrandbits(row_bytes * 8).to_bytes(row_bytes, 'little')
+                   for _ in range(height))
+    
+    def chunk(chunk_type, data):
+        body = chunk_type + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+    
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b''))
+
+class SyntheticDocumentGenerator:
+    def __init__(self, paragraphs=200, runs_per_paragraph=4, direct_format_ratio=0.5, tables=0,
+                 sections=1, headers_footers=True, media_kb=0, style_count=None, style_names=None, seed=0):
+        """
+        paragraphs: 正文段落数
+        runs_per_paragraph: 每个段落的run数
+        direct_format_ratio: 带直接格式（字体、字号、加粗等）的run所占比例
+        tables: 表格数（每个表格4行3列）
+        sections: 分节数
+        headers_footers: 每节是否设置独立的页眉页脚
+        media_kb: 嵌入的随机噪声图片大小（KB），0表示不嵌入
+        style_count: 段落使用的样式数（默认使用style_names中的全部样式）
+        style_names: 段落样式名称，文档中不存在时新建；默认使用python-docx默认模板中的段落样式
+        """
+        self.paragraphs = paragraphs
+        self.runs_per_paragraph = runs_per_paragraph
+        self.direct_format_ratio = direct_format_ratio
+        self.tables = tables
+        self.sections = max(sections, 1)
+        self.headers_footers = headers_footers
+        self.media_kb = media_kb
+        self.style_count = style_count
+        self.style_names = style_names
+        self.seed = seed
+    
+    def parameters(self):
+        """
+        生成参数（记录在基准测试结果中）
+        """
+        return {
+            'paragraphs': self.paragraphs,
+            'runs_per_paragraph': self.runs_per_paragraph,
+            'direct_format_ratio': self.direct_format_ratio,
+            'tables': self.tables,
+            'sections': self.sections,
+            'headers_footers': self.headers_footers,
+            'media_kb': self.media_kb,
+            'style_count': self.style_count,
+            'seed': self.seed
+        }
+    
+    def _text(self, rng, words):
+        chinese = ''.join(rng.choice(CHINESE_WORDS) for _ in range(words))
+        english = ' '.join(rng.choice(ENGLISH_WORDS) for _ in range(max(words // 3, 1)))
+        return f"{chinese} {english} "
+    
+    def _prepare_styles(self, doc):
+        """
+        确定段落使用的样式，文档中不存在的样式按正文样式新建
+        """
+        existing = {style.name: style for style in doc.styles if style.type == WD_STYLE_TYPE.PARAGRAPH}
+        names = list(self.style_names) if self.style_names else list(existing)
+        
+        count = self.style_count or len(names)
+        # 需要的样式数多于给定名称时补充自定义样式
+        for index in range(len(names), count):
+            names.append(f"基准样式{index + 1}")
+        names = names[:count]
+        
+        styles = []
+        for name in names:
+            style = existing.get(name)
+            if style is None:
+                style = doc.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+                style.base_style = existing.get('Normal')
+                existing[name] = style
+            styles.append(style)
+        return styles
+    
+    def _apply_direct_format(self, run, rng):
+        """
+        给run设置直接格式（与真实稿件中手工设置的字体、字号、加粗类似）
+        """
+        english_font, chinese_font = rng.choice(DIRECT_FONTS)
+        run.font.name = english_font
+        run._element.get_or_add_rPr().get_or_add_rFonts().set(qn('w:eastAsia'), chinese_font)
+        run.font.size = Pt(rng.choice(DIRECT_SIZES))
+        if rng.random() < 0.3:
+            run.font.bold = True
+        if rng.random() < 0.1:
+            run.font.italic = True
+    
+    def _add_table(self, doc, rng):
+        table = doc.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = self._text(rng, 3)
+    
+    def _set_header_footer(self, section, index):
+        section.header.is_linked_to_previous = False
+        section.footer.is_linked_to_previous = False
+        section.header.paragraphs[0].text = f"合成文档 第{index + 1}节 页眉"
+        section.footer.paragraphs[0].text = f"第{index + 1}节 页脚"
+    
+    def generate(self, output_path=None):
+        """
+        生成合成文档；output_path为None时返回docx字节，否则保存到该路径并返回路径
+        """
+        rng = random.Random(self.seed)
+        doc = Document()
+        styles = self._prepare_styles(doc)
+        
+        # 表格、分节和图片均匀分布在正文段落之间
+        table_every = self.paragraphs // (self.tables + 1) if self.tables else 0
+        section_every = self.paragraphs // self.sections if self.sections > 1 else 0
+        
+        if self.headers_footers:
+            self._set_header_footer(doc.sections[0], 0)
+        
+        if self.media_kb:
+            doc.add_picture(io.BytesIO(make_noise_png(self.media_kb * 1024, self.seed)), width=Inches(3))
+        
+        added_tables = 0
+        for index in range(self.paragraphs):
+            if section_every and index and index % section_every == 0 and len(doc.sections) < self.sections:
+                section = doc.add_section(WD_SECTION.NEW_PAGE)
+                if self.headers_footers:
+                    self._set_header_footer(section, len(doc.sections) - 1)
+            
+            paragraph = doc.add_paragraph(style=styles[index % len(styles)])
+            for _ in range(self.runs_per_paragraph):
+                run = paragraph.add_run(self._text(rng, rng.randint(2, 8)))
+                if rng.random() < self.direct_format_ratio:
+                    self._apply_direct_format(run, rng)
+            
+            # 段落标记的字体设置（应用器会清除）
+            if rng.random() < self.direct_format_ratio:
+                ppr = paragraph._p.get_or_add_pPr()
+                rpr = OxmlElement('w:rPr')
+                rfonts = OxmlElement('w:rFonts')
+                rfonts.set(qn('w:eastAsia'), rng.choice(DIRECT_FONTS)[1])
+                rpr.append(rfonts)
+                ppr.append(rpr)
+            
+            if table_every and (index + 1) % table_every == 0 and added_tables < self.tables:
+                self._add_table(doc, rng)
+                added_tables += 1
+        
+        if output_path is None:
+            buffer = io.BytesIO()
+            doc.save(buffer)
+            return buffer.getvalue()
+        
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        doc.save(output_path)
+        return output_path
+
+def _git_commit():
+    """
+    当前代码的git提交（不在git仓库中时返回None）
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except Exception:
+        return None
+
+class PipelineBenchmark:
+    def __init__(self, format_info_path=None, template_path=None, work_dir=None, history_path=None,
+                 mode='pipeline', repeat=1, trace_memory=False, verbose=False):
+        """
+        mode: pipeline 使用单次加载流水线；separate 依次调用各组件基于文件的入口
+        （RunFormatCleaner.clean_document_runs → DynamicFormatApplier.apply_formats_to_document →
+        FormatValidator.generate_validation_report）
+        repeat: 每个规模重复次数，记录总耗时最短的一次
+        """
+        self.format_info_path = format_info_path
+        self.template_path = template_path
+        self.work_dir = work_dir or config.BENCHMARK_DIR
+        self.history_path = history_path or config.BENCHMARK_HISTORY
+        self.mode = mode
+        self.repeat = max(repeat, 1)
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+    
+    def _quiet(self):
+        """
+        非verbose模式下屏蔽各组件的控制台输出
+        """
+        if self.verbose:
+            return redirect_stdout(sys.stdout)
+        return redirect_stdout(io.StringIO())
+    
+    def _run_pipeline(self, input_path, output_path, report_path, metrics):
+        pipeline = FormatPipeline(self.format_info_path, self.template_path, metrics=metrics)
+        if not pipeline.load():
+            return False
+        return pipeline.process_document(input_path, output_path, report_path) is not None
+    
+    def _run_separate(self, input_path, output_path, report_path, metrics):
+        cleaned_path = f"{os.path.splitext(output_path)[0]}_清理后.docx"
+        
+        cleaner = RunFormatCleaner(metrics)
+        if not cleaner.clean_document_runs(input_path, cleaned_path):
+            return False
+        
+        applier = DynamicFormatApplier(self.format_info_path, metrics)
+        if self.template_path and not self.format_info_path:
+            loaded = applier.load_profile_for_template(self.template_path)
+        else:
+            loaded = applier.load_format_info()
+        if not loaded or not applier.apply_formats_to_document(cleaned_path, output_path):
+            return False
+        
+        template_doc = applier.load_template_document()
+        validator = FormatValidator(metrics)
+        return validator.generate_validation_report(template_doc, output_path, report_path) is not None
+    
+    def _style_names(self):
+        """
+        合成文档使用格式信息中的样式名称，使应用器和验证器处理与真实稿件相同的样式
+        """
+        applier = DynamicFormatApplier(self.format_info_path)
+        with self._quiet():
+            if self.template_path and not self.format_info_path:
+                loaded = applier.load_profile_for_template(self.template_path)
+            else:
+                loaded = applier.load_format_info()
+        if not loaded:
+            return None
+        return list(applier.format_info.get('styles', {}))
+    
+    def run_case(self, generator, label):
+        """
+        生成一个规模的合成文档并运行基准测试，返回结果记录
+        """
+        input_path = os.path.join(self.work_dir, f"{label}.docx")
+        output_path = os.path.join(self.work_dir, f"{label}_格式化后.docx")
+        report_path = os.path.join(self.work_dir, f"{label}_验证报告.json")
+        
+        generate_start = time.perf_counter()
+        generator.generate(input_path)
+        generate_seconds = time.perf_counter() - generate_start
+        
+        runner = self._run_pipeline if self.mode == 'pipeline' else self._run_separate
+        best = None
+        for _ in range(self.repeat):
+            metrics = StageMetrics(trace_memory=self.trace_memory)
+            with self._quiet():
+                ok = runner(input_path, output_path, report_path, metrics)
+            metrics.close()
+            if not ok:
+                print(f"基准测试 {label} 运行失败")
+                return None
+            if best is None or metrics.totals()['wall_seconds'] < best.totals()['wall_seconds']:
+                best = metrics
+        
+        return {
+            'label': label,
+            'parameters': generator.parameters(),
+            'input_bytes': os.path.getsize(input_path),
+            'generate_seconds': round(generate_seconds, 3),
+            'totals': best.totals(),
+            'stages': {
+                stage['name']: {key: stage[key] for key in ('wall_seconds', 'cpu_seconds', 'peak_memory_bytes', 'counts')
+                                if key in stage}
+                for stage in best.stages
+            }
+        }
+    
+    def run(self, sizes, **generator_options):
+        """
+        按段落数梯度运行基准测试，结果追加到历史记录并与上一次结果比较
+        """
+        style_names = self._style_names()
+        if style_names is None:
+            print("错误：无法加载格式信息")
+            return None
+        
+        run_info = {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mode': self.mode,
+            'repeat': self.repeat,
+            'trace_memory': self.trace_memory
+        }
+        previous = self.load_history()
+        
+        results = []
+        for paragraphs in sizes:
+            generator = SyntheticDocumentGenerator(paragraphs=paragraphs, style_names=style_names,
+                                                   **generator_options)
+            label = f"bench_{paragraphs}"
+            print(f"\n=== 基准测试: {paragraphs} 个段落 ===")
+            result = self.run_case(generator, label)
+            if result is None:
+                continue
+            
+            result.update(run_info)
+            result['regressions'] = self._compare(result, previous)
+            results.append(result)
+            self._print_result(result)
+        
+        self._append_history(results)
+        return results
+    
+    def load_history(self):
+        """
+        读取历史记录（每行一个结果）
+        """
+        if not os.path.exists(self.history_path):
+            return []
+        
+        history = []
+        with open(self.history_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        history.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        return history
+    
+    def _compare(self, result, history):
+        """
+        与历史记录中相同参数和模式的上一次结果比较，返回变慢超过阈值的阶段
+        """
+        baseline = None
+        for entry in reversed(history):
+            if entry.get('parameters') == result['parameters'] and entry.get('mode') == result['mode']:
+                baseline = entry
+                break
+        if baseline is None:
+            return []
+        
+        regressions = []
+        pairs = [('total', baseline['totals'], result['totals'])]
+        pairs += [(name, baseline['stages'].get(name), stage) for name, stage in result['stages'].items()]
+        for name, before, after in pairs:
+            if not before or before['wall_seconds'] <= 0:
+                continue
+            ratio = after['wall_seconds'] / before['wall_seconds'] - 1
+            if ratio > REGRESSION_THRESHOLD:
+                regressions.append({
+                    'stage': name,
+                    'baseline_seconds': before['wall_seconds'],
+                    'current_seconds': after['wall_seconds'],
+                    'baseline_commit': baseline.get('git_commit'),
+                    'slowdown': round(ratio, 3)
+                })
+        return regressions
+    
+    def _append_history(self, results):
+        if not results:
+            return
+        history_dir = os.path.dirname(self.history_path)
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        with open(self.history_path, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        print(f"\n基准测试结果已追加到: {self.history_path}")
+    
+    def _print_result(self, result):
+        totals = result['totals']
+        print(f"输入大小: {result['input_bytes'] / 1024:.0f}KB，总耗时: 墙钟 {totals['wall_seconds']:.3f}s, CPU {totals['cpu_seconds']:.3f}s")
+        for name, stage in result['stages'].items():
+            line = f"  {name}: {stage['wall_seconds']:.3f}s"
+            if 'peak_memory_bytes' in stage:
+                line += f", 峰值内存 {stage['peak_memory_bytes'] / 1024 / 1024:.1f}MB"
+            print(line)
+        for regression in result['regressions']:
+            print(f"⚠️ 性能回退: {regression['stage']} {regression['baseline_seconds']:.3f}s → "
+                  f"{regression['current_seconds']:.3f}s（+{regression['slowdown'] * 100:.0f}%）")
+
+def main():
+    """
+    主函数：按规模梯度运行格式化流水线基准测试
+    """
+    parser = argparse.ArgumentParser(description="格式化流水线基准测试（合成文档 + 规模梯度）")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000], help="段落数梯度")
+    parser.add_argument('--runs-per-paragraph', type=int, default=4, help="每个段落的run数")
+    parser.add_argument('--direct-format-ratio', type=float, default=0.5, help="带直接格式的run比例")
+    parser.add_argument('--tables', type=int, default=10, help="表格数")
+    parser.add_argument('--sections', type=int, default=3, help="分节数")
+    parser.add_argument('--no-headers-footers', action='store_true', help="不设置页眉页脚")
+    parser.add_argument('--media-kb', type=int, default=512, help="嵌入图片大小（KB），0表示不嵌入")
+    parser.add_argument('--style-count', type=int, default=None, help="使用的段落样式数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--mode', choices=['pipeline', 'separate'], default='pipeline',
+                        help="pipeline: 单次加载流水线；separate: 依次调用各组件基于文件的入口")
+    parser.add_argument('--repeat', type=int, default=1, help="每个规模的重复次数（取最快一次）")
+    parser.add_argument('--trace-memory', action='store_true', help="记录各阶段峰值内存（处理会变慢）")
+    parser.add_argument('--format-info', default=None, help="格式信息文件")
+    parser.add_argument('--template', default=None, help="格式模板文档（只指定模板时使用模板格式缓存）")
+    parser.add_argument('--work-dir', default=config.BENCHMARK_DIR, help="合成文档和输出目录")
+    parser.add_argument('--history', default=config.BENCHMARK_HISTORY, help="历史记录文件")
+    parser.add_argument('-v', '--verbose', action='store_true', help="显示各组件的详细输出")
+    args = parser.parse_args()
+    
+    if args.format_info is None and args.template is None:
+        args.format_info = config.DYNAMIC_FORMAT_INFO
+    
+    benchmark = PipelineBenchmark(args.format_info, args.template, args.work_dir, args.history,
+                                  mode=args.mode, repeat=args.repeat, trace_memory=args.trace_memory,
+                                  verbose=args.verbose)
+    results = benchmark.run(
+        args.sizes,
+        runs_per_paragraph=args.runs_per_paragraph,
+        direct_format_ratio=args.direct_format_ratio,
+        tables=args.tables,
+        sections=args.sections,
+        headers_footers=not args.no_headers_footers,
+        media_kb=args.media_kb,
+        style_count=args.style_count,
+        seed=args.seed
+    )
+    
+    if results and any(result['regressions'] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,53 @@ class Config:
     ENHANCED_ANALYSIS = os.path.join(OUTPUT_DIR, "enhanced_format_analysis.json")
     ARCHITECTURE_TEST_REPORT = os.path.join(OUTPUT_DIR, "architecture_test_report.json")
     
+    # 模板格式信息缓存目录（按模板内容摘要存放）
+    PROFILE_CACHE_DIR = os.path.join(OUTPUT_DIR, "profile_cache")
+    
+    # 批量处理设置
+    BATCH_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "batch")
+    BATCH_MANIFEST_NAME = "batch_manifest.json"
+    
+    # 基准测试设置（合成文档存放目录和历史结果文件）
+    BENCHMARK_DIR = os.path.join(OUTPUT_DIR, "benchmark")
+    BENCHMARK_HISTORY = os.path.join(OUTPUT_DIR, "benchmark_history.jsonl")
+    
+    # 本地格式化服务设置
+    SERVICE_HOST = "127.0.0.1"
+    SERVICE_PORT = 8765
+    SERVICE_WORKERS = None  # 默认CPU核数
+    SERVICE_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+    SERVICE_REQUEST_TIMEOUT = 300  # 单个请求等待格式化结果的秒数，超时返回504
+    
+    # 共享目录任务队列设置（租期内未续租的任务会被其他工作进程收回）
+    SPOOL_DIR = os.path.join(OUTPUT_DIR, "spool")
+    SPOOL_LEASE_SECONDS = 120
+    SPOOL_POLL_SECONDS = 2
+    SPOOL_MAX_ATTEMPTS = 3
+    
+    # 加载文档前删除修订标识属性、校对标记等不影响排版的XML
+    SLIM_XML = False
+    
+    # 清理run格式后合并格式相同的相邻run
+    COALESCE_RUNS = False
+    
+    # 从模板导入样式时，目标文档已有同名样式的处理方式：keep保留目标的定义，replace用模板的定义替换
+    STYLE_MERGE_POLICY = "keep"
+    
+    # 只应用目标文档实际引用的样式（及其基础样式链），不导入也不修改未使用的样式
+    USED_STYLES_ONLY = False
+    
+    # 格式验证引擎：typed按带类型的样式记录比较，proxy按python-docx代理属性的字符串比较
+    VALIDATOR_ENGINE = "typed"
+    # 逐段落检查实际生效的格式（报告中最多记录的偏离段落数）
+    VALIDATE_PARAGRAPH_FORMATS = True
+    PARAGRAPH_CHECK_MAX_DETAILS = 50
+    
+    # 语料统计设置（KLL草图大小、每个任务统计的文档数、统计报告路径）
+    CORPUS_SKETCH_K = 200
+    CORPUS_CHUNK_SIZE = 16
+    CORPUS_REPORT = os.path.join(OUTPUT_DIR, "corpus_analytics.json")
+    
     # 默认设置
     DEFAULT_FONT = "宋体"
     DEFAULT_FONT_SIZE = "10.5pt"
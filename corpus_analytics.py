@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语料级格式统计
+功能：对大量文档统计每个样式的行距、段前段后距、缩进、字号分布和对齐方式、字体使用情况
+每个文档生成一个很小的可合并摘要（计数器 + KLL分位数草图），工作进程先合并各自处理的文档，
+主进程再合并各工作进程的结果；内存占用只与样式数、草图大小和不同取值（字体、对齐方式等）的个数有关，与语料规模无关
+摘要可以保存为JSON，在不同机器上分别统计后再合并（--merge）
+"""
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from docx import Document
+from config import config
+from effective_format_resolver import EffectiveFormatResolver, W_T
+from batch_format_runner import collect_input_documents
+from format_logging import get_logger, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('corpus_analytics')
+
+# 摘要格式版本：结构变化时递增，不同版本的摘要不能合并
+SUMMARY_VERSION = 1
+
+# 报告中输出的分位点
+REPORT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# 对齐方式的中文说明（与FontAndSpacingAnalyzer一致）
+ALIGNMENT_LABELS = {
+    'left': '左对齐',
+    'center': '居中对齐',
+    'right': '右对齐',
+    'both': '两端对齐',
+    'distribute': '分散对齐'
+}
+
+# 每个样式统计的数值分布（单位：磅，倍数行距为倍数）
+DISTRIBUTIONS = ('line_spacing_multiple', 'line_spacing_pt', 'space_before', 'space_after',
+                 'first_line_indent', 'left_indent', 'font_size')
+
+class KLLSketch:
+    """
+    KLL分位数草图：按层保存采样值，第h层每个值代表2^h个原始值
+    各层容量按2/3几何递减，总量超出容量时，将最低的已满层排序后隔一取一提升到上一层
+    保存的值的个数约为3k，与输入个数无关；两个草图可以合并，误差约为1.7/k
+    """
+    def __init__(self, k=None, seed=0):
+        self.k = k or config.CORPUS_SKETCH_K
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.levels = [[]]
+        self._random = random.Random(seed)
+    
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+    
+    def _over_capacity(self):
+        return sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels)))
+    
+    def update(self, value):
+        self.levels[0].append(value)
+        self.n += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+    
+    def _compress(self):
+        while self._over_capacity():
+            for level, items in enumerate(self.levels):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # 奇数个时留下一个值，保证总权重不变
+                kept = [items.pop()] if len(items) % 2 else []
+                self.levels[level + 1].extend(items[self._random.randint(0, 1)::2])
+                self.levels[level] = kept
+                break
+    
+    def merge(self, other):
+        """
+        合并另一个草图（就地修改并返回自身）
+        """
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+    
+    def quantiles(self, fractions):
+        """
+        估计多个分位点（一次排序），草图为空时返回None
+        """
+        if self.n == 0:
+            return [None for _ in fractions]
+        
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            target = fraction * total
+            cumulative = 0
+            result = weighted[-1][0]
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    result = value
+                    break
+            results.append(result)
+        return results
+    
+    def size(self):
+        return sum(len(items) for items in self.levels)
+    
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'min': self.min, 'max': self.max, 'levels': self.levels}
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.n = data['n']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.levels = [list(items) for items in data['levels']] or [[]]
+        return sketch
+
+class StyleSummary:
+    """
+    单个样式的可合并统计：段落数、文档数、各类计数器和数值分布草图
+    """
+    def __init__(self):
+        self.paragraphs = 0
+        self.documents = 0
+        self.counters = {'alignment': {}, 'line_rule': {}, 'ascii_font': {}, 'eastasia_font': {}}
+        self.sketches = {name: KLLSketch() for name in DISTRIBUTIONS}
+    
+    def count(self, counter, value):
+        if value is not None:
+            counts = self.counters[counter]
+            counts[value] = counts.get(value, 0) + 1
+    
+    def add(self, name, value):
+        if value is not None:
+            self.sketches[name].update(value)
+    
+    def merge(self, other):
+        self.paragraphs += other.paragraphs
+        self.documents += other.documents
+        for counter, counts in other.counters.items():
+            target = self.counters.setdefault(counter, {})
+            for value, count in counts.items():
+                target[value] = target.get(value, 0) + count
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+        return self
+    
+    def to_dict(self):
+        return {
+            'paragraphs': self.paragraphs,
+            'documents': self.documents,
+            'counters': self.counters,
+            'sketches': {name: sketch.to_dict() for name, sketch in self.sketches.items()}
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.paragraphs = data['paragraphs']
+        summary.documents = data['documents']
+        summary.counters = {counter: dict(counts) for counter, counts in data['counters'].items()}
+        for name, sketch in data['sketches'].items():
+            summary.sketches[name] = KLLSketch.from_dict(sketch)
+        return summary
+    
+    def report(self, top=10):
+        """
+        报告中的分布：计数器取前top项，数值分布输出个数、最小值、最大值和分位点
+        """
+        distributions = {}
+        for name, sketch in self.sketches.items():
+            if sketch.n == 0:
+                continue
+            values = sketch.quantiles(REPORT_QUANTILES)
+            distributions[name] = {
+                'count': sketch.n,
+                'min': sketch.min,
+                'max': sketch.max,
+                **{f"p{int(fraction * 100)}": value for fraction, value in zip(REPORT_QUANTILES, values)}
+            }
+        
+        return {
+            'paragraphs': self.paragraphs,
+            'documents': self.documents,
+            'usage': {
+                counter: dict(sorted(counts.items(), key=lambda item: -item[1])[:top])
+                for counter, counts in self.counters.items() if counts
+            },
+            'distributions': distributions
+        }
+
+class CorpusSummary:
+    """
+    一批文档的可合并摘要：样式名称 -> StyleSummary
+    """
+    def __init__(self):
+        self.documents = 0
+        self.failed = 0
+        self.paragraphs = 0
+        self.styles = {}
+    
+    def style(self, name):
+        summary = self.styles.get(name)
+        if summary is None:
+            summary = StyleSummary()
+            self.styles[name] = summary
+        return summary
+    
+    def add_document(self, doc):
+        """
+        统计一个已加载文档中每个有内容段落的有效格式（docDefaults → 样式链 → 段落 → run）
+        """
+        resolver = EffectiveFormatResolver(doc)
+        seen_styles = set()
+        for p_element, style, ppr, runs in resolver.resolve_document():
+            texts = [''.join(t.text or '' for t in r_element.iter(W_T)) for r_element, _ in runs]
+            if not any(text.strip() for text in texts):
+                continue
+            
+            name = style.name if style is not None else '(无样式)'
+            summary = self.style(name)
+            summary.paragraphs += 1
+            self.paragraphs += 1
+            if name not in seen_styles:
+                seen_styles.add(name)
+                summary.documents += 1
+            
+            self._add_paragraph(summary, ppr)
+            for text, (_, rpr) in zip(texts, runs):
+                if text.strip():
+                    summary.count('ascii_font', rpr.get('ascii'))
+                    summary.count('eastasia_font', rpr.get('eastAsia'))
+                    if rpr.get('sz') is not None:
+                        summary.add('font_size', rpr['sz'] / 2)
+        
+        self.documents += 1
+    
+    def _add_paragraph(self, summary, ppr):
+        jc = ppr.get('jc')
+        summary.count('alignment', ALIGNMENT_LABELS.get(jc, jc))
+        
+        line = ppr.get('line')
+        if line is not None:
+            rule = ppr.get('lineRule', 'auto')
+            summary.count('line_rule', rule)
+            if rule == 'auto':
+                summary.add('line_spacing_multiple', round(line / 240, 3))
+            else:
+                summary.add('line_spacing_pt', line / 20)
+        
+        for name, prop in (('space_before', 'before'), ('space_after', 'after'), ('left_indent', 'left')):
+            if ppr.get(prop) is not None:
+                summary.add(name, ppr[prop] / 20)
+        if ppr.get('firstLine') is not None:
+            summary.add('first_line_indent', ppr['firstLine'] / 20)
+        elif ppr.get('hanging') is not None:
+            summary.add('first_line_indent', -ppr['hanging'] / 20)
+    
+    def merge(self, other):
+        self.documents += other.documents
+        self.failed += other.failed
+        self.paragraphs += other.paragraphs
+        for name, summary in other.styles.items():
+            self.style(name).merge(summary)
+        return self
+    
+    def to_dict(self):
+        return {
+            'summary_version': SUMMARY_VERSION,
+            'documents': self.documents,
+            'failed': self.failed,
+            'paragraphs': self.paragraphs,
+            'styles': {name: summary.to_dict() for name, summary in self.styles.items()}
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('summary_version') != SUMMARY_VERSION:
+            raise ValueError(f"摘要版本不一致: {data.get('summary_version')}（当前版本 {SUMMARY_VERSION}）")
+        corpus = cls()
+        corpus.documents = data['documents']
+        corpus.failed = data['failed']
+        corpus.paragraphs = data['paragraphs']
+        corpus.styles = {name: StyleSummary.from_dict(summary) for name, summary in data['styles'].items()}
+        return corpus
+    
+    def report(self, top=10):
+        styles = sorted(self.styles.items(), key=lambda item: -item[1].paragraphs)
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'documents': self.documents,
+            'failed': self.failed,
+            'paragraphs': self.paragraphs,
+            'styles': {name: summary.report(top) for name, summary in styles}
+        }
+
+def summarize_documents(paths):
+    """
+    统计一组文档并合并为一个摘要（在工作进程中执行，只返回合并后的摘要）
+    """
+    corpus = CorpusSummary()
+    for path in paths:
+        try:
+            corpus.add_document(Document(path))
+        except Exception as e:
+            logger.error(f"统计文档 {path} 时出错: {e}")
+            corpus.failed += 1
+    return corpus
+
+class CorpusAnalytics:
+    def __init__(self, workers=None, chunk_size=None):
+        """
+        workers: 工作进程数
+        chunk_size: 每个任务统计的文档数（工作进程内先合并，减少传回主进程的摘要数量）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size or config.CORPUS_CHUNK_SIZE
+    
+    def run(self, documents):
+        """
+        并行统计所有文档，返回合并后的语料摘要
+        """
+        chunks = [documents[i:i + self.chunk_size] for i in range(0, len(documents), self.chunk_size)]
+        corpus = CorpusSummary()
+        if self.workers <= 1:
+            for chunk in chunks:
+                corpus.merge(summarize_documents(chunk))
+            return corpus
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(summarize_documents, chunk) for chunk in chunks]
+            for done, future in enumerate(as_completed(futures), 1):
+                corpus.merge(future.result())
+                logger.debug(f"[{done}/{len(chunks)}] 已合并 {corpus.documents} 个文档的摘要")
+        return corpus
+
+def load_summary(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return CorpusSummary.from_dict(json.load(f))
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def main():
+    """
+    主函数：统计语料中各样式的格式分布，或合并已保存的摘要
+    """
+    parser = argparse.ArgumentParser(description="语料级格式统计（可合并摘要 + 分位数草图）")
+    parser.add_argument('inputs', nargs='*', help="输入目录或通配符")
+    parser.add_argument('-o', '--output', default=config.CORPUS_REPORT, help="统计报告路径")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument('--chunk-size', type=int, default=None, help="每个任务统计的文档数")
+    parser.add_argument('--save-summary', default=None, help="同时保存可合并的摘要（供--merge使用）")
+    parser.add_argument('--merge', nargs='+', default=None, help="合并已保存的摘要文件（可与inputs同时使用）")
+    parser.add_argument('--top', type=int, default=10, help="每个计数器输出的前几项")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    corpus = CorpusSummary()
+    start = time.perf_counter()
+    
+    if args.inputs:
+        documents = collect_input_documents(args.inputs)
+        if not documents:
+            logger.error("错误：未找到需要统计的.docx文档")
+            return
+        logger.info(f"统计 {len(documents)} 个文档，工作进程数: {args.workers or os.cpu_count()}")
+        corpus.merge(CorpusAnalytics(args.workers, args.chunk_size).run(documents))
+    
+    for path in args.merge or []:
+        try:
+            corpus.merge(load_summary(path))
+        except Exception as e:
+            logger.error(f"读取摘要 {path} 时出错: {e}")
+            return
+    
+    if corpus.documents == 0 and corpus.failed == 0:
+        parser.error("请指定输入文档或 --merge 摘要文件")
+    
+    if args.save_summary:
+        save_json(corpus.to_dict(), args.save_summary)
+        logger.info(f"可合并摘要已保存到: {args.save_summary}")
+    
+    save_json(corpus.report(args.top), args.output)
+    logger.summary('corpus_analytics',
+                   f"统计完成: {corpus.documents} 个文档，{corpus.paragraphs} 个段落，{len(corpus.styles)} 个样式，"
+                   f"耗时 {time.perf_counter() - start:.2f}s",
+                   documents=corpus.documents, failed=corpus.failed, paragraphs=corpus.paragraphs,
+                   styles=len(corpus.styles))
+    logger.info(f"统计报告已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+直通式docx写出器
+功能：保存格式化后的文档时，只重新序列化XML部件（styles.xml、document.xml、页眉页脚等），
+图片、嵌入字体等未修改的二进制成员按原始压缩数据逐字节复制，不解压也不重新压缩
+"""
+
+import io
+import os
+import sys
+import shutil
+import struct
+import platform
+import zlib
+import zipfile
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+
+# 本地文件头：固定30字节，文件名长度和扩展字段长度位于第26、28字节
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_NAME_LENGTHS = struct.Struct('<HH')
+
+# 通用标志位第3位：CRC和大小写在数据之后的数据描述符中（直通复制时改写到本地文件头）
+DATA_DESCRIPTOR_FLAG = 0x08
+
+# 复制原始压缩数据时每次读取的大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 按原始压缩数据复制需要直接操作ZipFile的内部状态（fp、filelist、NameToInfo、start_dir、_didModify），
+# 只在核对过zipfile实现的CPython版本上启用，其他版本解压后重新写入
+RAW_COPY_VERIFIED_VERSIONS = ((3, 11),)
+RAW_COPY_ZIPFILE_ATTRIBUTES = ('fp', 'filelist', 'NameToInfo', 'start_dir', '_didModify')
+
+def _raw_copy_supported(source_zip, target_zip):
+    """
+    当前解释器和两个ZipFile对象是否支持按原始压缩数据复制
+    """
+    if platform.python_implementation() != 'CPython' or sys.version_info[:2] not in RAW_COPY_VERIFIED_VERSIONS:
+        return False
+    if getattr(target_zip, '_writing', False):
+        return False
+    return all(hasattr(zip_file, attribute) for zip_file in (source_zip, target_zip)
+               for attribute in RAW_COPY_ZIPFILE_ATTRIBUTES)
+
+def copy_member_raw(source_zip, info, target_zip):
+    """
+    将source_zip中的成员info按原始压缩数据复制到target_zip，不解压也不重新压缩
+    不支持直接复制的解释器上退回解压后按原压缩方式重新写入（结果内容相同，只是更慢）
+    """
+    if not _raw_copy_supported(source_zip, target_zip):
+        new_info = zipfile.ZipInfo(info.filename, info.date_time)
+        new_info.compress_type = info.compress_type
+        new_info.create_system = info.create_system
+        new_info.external_attr = info.external_attr
+        target_zip.writestr(new_info, source_zip.read(info))
+        return target_zip.getinfo(info.filename)
+    
+    source_fp = source_zip.fp
+    source_fp.seek(info.header_offset)
+    header = source_fp.read(LOCAL_HEADER_SIZE)
+    name_length, extra_length = LOCAL_HEADER_NAME_LENGTHS.unpack(header[26:30])
+    source_fp.seek(info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+    
+    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.create_system = info.create_system
+    new_info.external_attr = info.external_attr
+    new_info.flag_bits = info.flag_bits & ~DATA_DESCRIPTOR_FLAG
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    target_fp = target_zip.fp
+    new_info.header_offset = target_fp.tell()
+    target_fp.write(new_info.FileHeader(zip64))
+    
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source_fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError(f"成员 {info.filename} 的压缩数据不完整")
+        target_fp.write(chunk)
+        remaining -= len(chunk)
+    
+    # 登记到目标zip的中央目录
+    target_zip.filelist.append(new_info)
+    target_zip.NameToInfo[new_info.filename] = new_info
+    target_zip.start_dir = target_fp.tell()
+    target_zip._didModify = True
+    return new_info
+
+class PassthroughWriter:
+    def __init__(self, source):
+        """
+        source为原始docx：文件路径、bytes或文件对象
+        """
+        self.source = source
+        self.stats = {}
+    
+    def _open_source(self):
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            return zipfile.ZipFile(io.BytesIO(self.source))
+        return zipfile.ZipFile(self.source)
+    
+    def _is_unchanged(self, blob, info):
+        """
+        部件序列化后的内容与原始成员一致时才直通复制（比较大小和CRC，不涉及解压或压缩）
+        """
+        if info is None:
+            return False
+        return len(blob) == info.file_size and (zlib.crc32(blob) & 0xffffffff) == info.CRC
+    
+    def _write_member(self, source_zip, target_zip, member_name, blob, info, stats):
+        """
+        写出一个成员：与原始成员一致时直通复制原始压缩数据，否则压缩写入blob
+        """
+        if self._is_unchanged(blob, info):
+            copy_member_raw(source_zip, info, target_zip)
+            stats['copied_members'] += 1
+            stats['copied_bytes'] += info.compress_size
+        else:
+            target_zip.writestr(member_name, blob)
+            stats['rewritten_members'] += 1
+    
+    def save(self, doc, target):
+        """
+        将doc保存到target（文件路径或文件对象），返回写出统计
+        """
+        stats = {'copied_members': 0, 'rewritten_members': 0, 'copied_bytes': 0}
+        package = doc.part.package
+        parts = list(package.iter_parts())
+        
+        if isinstance(target, (str, os.PathLike)):
+            # 覆盖原文件时无法边读边写，退回python-docx的完整保存
+            if isinstance(self.source, (str, os.PathLike)) and os.path.exists(target) \
+                    and os.path.samefile(self.source, target):
+                doc.save(target)
+                self.stats = {'copied_members': 0, 'rewritten_members': len(parts), 'copied_bytes': 0}
+                return self.stats
+            
+            target_dir = os.path.dirname(os.fspath(target))
+            if target_dir:
+                os.makedirs(target_dir, exist_ok=True)
+        
+        with self._open_source() as source_zip, \
+                zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+            source_infos = {info.filename: info for info in source_zip.infolist()}
+            
+            # 内容类型和包级关系按当前部件重新生成（页眉页脚等部件可能有增加）
+            target_zip.writestr(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+            target_zip.writestr(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+            stats['rewritten_members'] += 2
+            
+            for part in parts:
+                # XML部件的blob每次访问都会重新序列化，只序列化一次，用于比较和写出
+                member_name = part.partname.membername
+                self._write_member(source_zip, target_zip, member_name, part.blob,
+                                   source_infos.get(member_name), stats)
+                
+                if len(part.rels):
+                    rels_name = part.partname.rels_uri.membername
+                    self._write_member(source_zip, target_zip, rels_name, part.rels.xml,
+                                       source_infos.get(rels_name), stats)
+        
+        self.stats = stats
+        return stats
+
+def read_source_bytes(source):
+    """
+    将bytes、bytearray、memoryview或文件对象形式的docx统一读取为bytes
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        return source.read()
+    raise TypeError(f"不支持的文档类型: {type(source).__name__}")
+
+def save_document_bytes(doc, source):
+    """
+    将doc保存为bytes：source为原始docx的bytes，未修改的成员直通复制
+    """
+    buffer = io.BytesIO()
+    PassthroughWriter(source).save(doc, buffer)
+    return buffer.getvalue()
+
+def save_document(doc, target, source=None):
+    """
+    保存文档：提供原始docx时使用直通式写出，否则使用python-docx的完整保存
+    """
+    if source is None:
+        doc.save(target)
+        return None
+    return PassthroughWriter(source).save(doc, target)
+
+def copy_source_document(source, target):
+    """
+    文档没有任何修改时直接复制原始docx（路径、bytes或文件对象）到target，不重新序列化
+    返回写出统计
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if isinstance(target, (str, os.PathLike)):
+            if not (os.path.exists(target) and os.path.samefile(source, target)):
+                target_dir = os.path.dirname(os.fspath(target))
+                if target_dir:
+                    os.makedirs(target_dir, exist_ok=True)
+                shutil.copyfile(source, target)
+            return {'unchanged': 1, 'copied_bytes': os.path.getsize(source)}
+        with open(source, 'rb') as f:
+            source = f.read()
+    
+    data = read_source_bytes(source)
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as f:
+            f.write(data)
+    else:
+        target.write(data)
+    return {'unchanged': 1, 'copied_bytes': len(data)}
@@ -7,58 +7,171 @@
 包括页眉页脚格式的应用
 """
 
+import io
 import os
 import json
+import argparse
 from docx import Document
-from docx.shared import Pt, RGBColor, Inches
+from docx.shared import Pt, Twips, Inches, Length, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_COLOR_INDEX, WD_UNDERLINE
+from docx.enum.dml import MSO_COLOR_TYPE
 from docx.oxml import parse_xml
 from docx.oxml.ns import qn
 from datetime import datetime
+from lxml import etree
 from config import config
+from docx_passthrough_writer import save_document, save_document_bytes, read_source_bytes, copy_source_document
+from style_index import StyleIndex, referenced_style_ids
+from styles_merge import StylesMerger, canonical_xml
+from format_profile import FormatProfile, DEFAULT_HEADER_FOOTER_DISTANCE, ALIGNMENT_NAMES
+from profile_store import is_binary_profile, loads_profile
+from stage_metrics import StageMetrics, metrics_path_for
+from format_logging import get_logger, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('dynamic_format_applier')
+
+W_RFONTS_ASCII = qn('w:ascii')
+W_RFONTS_HANSI = qn('w:hAnsi')
+
+def _assign_changed(target, operations):
+    """
+    只对当前取值与目标取值不同的属性赋值，返回修改列表 [(属性, 原取值, 新取值)]
+    """
+    changed = []
+    for attribute, value in operations:
+        current = getattr(target, attribute)
+        if current != value:
+            setattr(target, attribute, value)
+            changed.append((attribute, current, value))
+    return changed
+
+def _rfonts_changes(before, after):
+    """
+    两组rFonts属性（元素不存在时为None）之间的修改列表；只是新建或删除空元素时记为一项
+    """
+    before_attributes = before or {}
+    after_attributes = after or {}
+    changed = [(f"rFonts.{etree.QName(key).localname}", before_attributes.get(key), after_attributes.get(key))
+               for key in sorted(before_attributes.keys() | after_attributes.keys())
+               if before_attributes.get(key) != after_attributes.get(key)]
+    return changed or [('rFonts', before, after)]
+
+def _plain_value(value):
+    """
+    把修改前后的取值转换为JSON可表示的值：长度为磅，对齐方式为jc取值，颜色为十六进制字符串
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, Length):
+        return round(value.pt, 2)
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, RGBColor):
+        return str(value)
+    if isinstance(value, dict):
+        return {etree.QName(key).localname: item for key, item in value.items()}
+    if isinstance(value, int):
+        return ALIGNMENT_NAMES.get(value, int(value))
+    return str(value)
 
 class DynamicFormatApplier:
-    def __init__(self, format_info_path=None):
+    def __init__(self, format_info_path=None, metrics=None, style_merge_policy=None, used_styles_only=None):
         self.format_info_path = format_info_path or config.DYNAMIC_FORMAT_INFO
         self.format_info = None
-        self.alignment_map = {
-            '左对齐': WD_ALIGN_PARAGRAPH.LEFT,
-            '居中': WD_ALIGN_PARAGRAPH.CENTER,
-            '右对齐': WD_ALIGN_PARAGRAPH.RIGHT,
-            '两端对齐': WD_ALIGN_PARAGRAPH.JUSTIFY,
-            '分散对齐': WD_ALIGN_PARAGRAPH.DISTRIBUTE
-        }
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
+        # 已加载的格式模板文档（内存接口重复处理文档时复用）
+        self.template_doc = None
+        # 格式信息的带类型模型（整数单位和预先生成的应用计划），每份格式信息只解析一次
+        self.profile = None
+        self._profile_source = None
+        # 从模板导入样式的合并引擎（按模板文档复用，模板的样式索引只建立一次）
+        self.style_merge_policy = style_merge_policy or config.STYLE_MERGE_POLICY
+        self.styles_merger = None
+        # 只应用目标文档实际使用的样式（未指定时按配置）；style_scope为最近一次应用的样式名称，None表示全部样式
+        if used_styles_only is None:
+            used_styles_only = config.USED_STYLES_ONLY
+        self.used_styles_only = used_styles_only
+        self.style_scope = None
+        # 最近一次应用实际修改的内容：各阶段的修改数，styles为 样式名称 -> 修改的属性数
+        self.changes = {}
+        # 修改明细：styles为 样式名称 -> [(属性, 原取值, 新取值)]，以及导入的样式和有修改的节（从1开始）
+        self.diff = {}
     
     def load_format_info(self, format_file=None):
         """
-        加载动态提取的格式信息
+        加载动态提取的格式信息（JSON或profile_store打包的二进制文件），加载时校验结构
         """
         if format_file is None:
             format_file = self.format_info_path
         
         try:
             if os.path.exists(format_file):
-                with open(format_file, 'r', encoding='utf-8') as f:
-                    self.format_info = json.load(f)
-                print(f"已加载格式信息: {format_file}")
-                print(f"模板文件: {self.format_info.get('template_file', '未知')}")
-                print(f"提取时间: {self.format_info.get('extraction_time', '未知')}")
-                print(f"样式数量: {len(self.format_info.get('styles', {}))}")
+                with open(format_file, 'rb') as f:
+                    data = f.read()
+                if is_binary_profile(data):
+                    self.profile = loads_profile(data)
+                    self.format_info = self.profile.to_dict()
+                    self._profile_source = self.format_info
+                else:
+                    self.format_info = json.loads(data.decode('utf-8'))
+                    self.get_format_profile()
+                logger.info(f"已加载格式信息: {format_file}")
+                logger.debug(f"模板文件: {self.format_info.get('template_file', '未知')}")
+                logger.debug(f"提取时间: {self.format_info.get('extraction_time', '未知')}")
+                logger.debug(f"样式数量: {len(self.format_info.get('styles', {}))}")
                 return True
             else:
-                print(f"格式信息文件不存在: {format_file}")
+                logger.error(f"格式信息文件不存在: {format_file}")
                 return False
                 
         except Exception as e:
-            print(f"加载格式信息时出错: {e}")
+            logger.error(f"加载格式信息时出错: {e}")
             return False
     
+    def load_profile_for_template(self, template_path, cache=None):
+        """
+        通过模板格式缓存获取指定模板的格式信息，命中缓存时无需解析模板docx
+        """
+        if cache is None:
+            from template_profile_cache import TemplateProfileCache
+            cache = TemplateProfileCache()
+        
+        profile = cache.get_profile(template_path)
+        if profile is None:
+            logger.error(f"无法获取模板格式信息: {template_path}")
+            return False
+        
+        try:
+            format_profile = cache.format_profile(profile)
+        except Exception as e:
+            logger.error(f"解析模板格式信息时出错: {e}")
+            return False
+        
+        # 复制一份再记录模板路径，避免修改缓存中共享的格式信息；带类型模型由缓存共享
+        self.format_info = dict(profile)
+        self.format_info['template_file'] = template_path
+        self.profile = format_profile
+        self._profile_source = self.format_info
+        logger.info(f"已从缓存加载模板格式信息: {template_path} (sha256={profile.get('template_sha256', '未知')[:12]})")
+        logger.debug(f"样式数量: {len(self.format_info.get('styles', {}))}")
+        return True
+    
+    def get_format_profile(self):
+        """
+        当前格式信息的带类型模型：只在第一次使用时解析，format_info被替换后重新解析
+        """
+        if self.profile is None or self._profile_source is not self.format_info:
+            self.profile = FormatProfile.from_format_info(self.format_info)
+            self._profile_source = self.format_info
+        return self.profile
+    
     def apply_formats_to_document(self, input_path=None, output_path=None, use_clean_document=True):
         """
         将动态格式信息应用到测试文档
         """
         if not self.format_info:
-            print("错误：未加载格式信息，请先调用load_format_info()")
+            logger.error("错误：未加载格式信息，请先调用load_format_info()")
             return False
         
         if input_path is None:
@@ -67,79 +180,244 @@ class DynamicFormatApplier:
                 clean_doc_path = os.path.join(config.OUTPUT_DIR, "测试文档_清理后.docx")
                 if os.path.exists(clean_doc_path):
                     input_path = clean_doc_path
-                    print(f"\n使用清理后的测试文档: {input_path}")
+                    logger.info(f"使用清理后的测试文档: {input_path}")
                 else:
                     input_path = config.TEST_DOCUMENT
-                    print(f"\n清理后的文档不存在，使用原始测试文档: {input_path}")
+                    logger.info(f"清理后的文档不存在，使用原始测试文档: {input_path}")
             else:
                 input_path = config.TEST_DOCUMENT
-                print(f"\n使用原始测试文档: {input_path}")
+                logger.info(f"使用原始测试文档: {input_path}")
         
         if output_path is None:
             output_path = config.get_fixed_formatted_doc_path()
         
-        print(f"\n正在应用格式到文档: {input_path}")
+        logger.info(f"正在应用格式到文档: {input_path}")
         
         try:
-            doc = Document(input_path)
+            with self.metrics.stage('load'):
+                doc = Document(input_path)
+                template_doc = self.load_template_document()
             
+            # 应用格式（模板文档只加载一次）
+            if not self.apply_formats(doc, template_doc):
+                return False
+            
+            # 保存格式化后的文档（未修改的图片等成员直通复制）；文档已符合模板时直接复制原文件，不重新序列化
+            with self.metrics.stage('save') as counts:
+                if self.total_changes:
+                    save_document(doc, output_path, source=input_path)
+                else:
+                    counts.update(copy_source_document(input_path, output_path))
+                    logger.info("文档已符合格式模板，未修改任何内容")
+            logger.info(f"格式化完成！文档已保存为: {output_path}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"应用格式时出错: {e}")
+            return False
+    
+    def apply_formats_to_bytes(self, data, template_doc=None):
+        """
+        在内存中应用格式：data为.docx的bytes或文件对象，返回格式化后文档的bytes，不读写任何文件
+        失败时返回None
+        """
+        if not self.format_info:
+            logger.error("错误：未加载格式信息，请先调用load_format_info()")
+            return None
+        
+        try:
+            source = read_source_bytes(data)
+            with self.metrics.stage('load', input_bytes=len(source)):
+                doc = Document(io.BytesIO(source))
+                if template_doc is None:
+                    template_doc = self.get_template_document()
+            
+            if not self.apply_formats(doc, template_doc):
+                return None
+            
+            # 未修改的图片等成员直通复制；文档已符合模板时直接返回原始内容
+            with self.metrics.stage('save'):
+                if not self.total_changes:
+                    logger.info("文档已符合格式模板，未修改任何内容")
+                    return source
+                return save_document_bytes(doc, source)
+        
+        except Exception as e:
+            logger.error(f"应用格式时出错: {e}")
+            return None
+    
+    def plan_formats(self, doc, template_doc=None, doc_id=None):
+        """
+        计划模式：在已加载的文档上执行与apply_formats完全相同的比较和修改，返回将要修改内容的记录，不保存文档
+        失败时返回None
+        """
+        if not self.apply_formats(doc, template_doc):
+            return None
+        
+        return {
+            'doc': doc_id,
+            'changed': self.total_changes > 0,
+            'total_changes': self.total_changes,
+            'document_defaults': self.changes['document_defaults'],
+            'imported_styles': self.diff['imported_styles'],
+            'styles': {
+                style_name: [[attribute, _plain_value(old), _plain_value(new)] for attribute, old, new in changes]
+                for style_name, changes in self.diff['styles'].items()
+            },
+            'header_footer_sections': self.diff['header_footer'],
+            'run_clearing': self.changes['run_clearing']
+        }
+    
+    def get_template_document(self):
+        """
+        返回格式模板文档，只在第一次调用时加载
+        """
+        if self.template_doc is None:
+            self.template_doc = self.load_template_document()
+        return self.template_doc
+    
+    def load_template_document(self):
+        """
+        加载格式模板文档，用于复制缺失的样式和读取页眉内容
+        """
+        template_path = self.format_info.get('template_file') if self.format_info else None
+        if not template_path or not os.path.exists(template_path):
+            template_path = config.TEMPLATE_FILE
+        
+        if not os.path.exists(template_path):
+            logger.warning(f"警告：模板文档不存在: {template_path}")
+            return None
+        
+        try:
+            template_doc = Document(template_path)
+            logger.info(f"已加载模板文档: {template_path}")
+            return template_doc
+        except Exception as e:
+            logger.warning(f"警告：无法加载模板文档 {template_path}: {e}")
+            return None
+    
+    def apply_formats(self, doc, template_doc=None):
+        """
+        将动态格式信息应用到已加载的文档（内存中的Document对象），不读写文件
+        template_doc为已加载的格式模板文档，供复制缺失样式和读取页眉内容使用
+        """
+        if not self.format_info:
+            logger.error("错误：未加载格式信息，请先调用load_format_info()")
+            return False
+        
+        # 只有与格式信息不同的属性才会写入，各阶段记录实际修改数
+        self.changes = {'document_defaults': 0, 'imported_styles': 0, 'styles': {}, 'header_footer': 0, 'run_clearing': 0}
+        self.diff = {'imported_styles': [], 'styles': {}, 'header_footer': []}
+        
+        try:
             # 1. 应用文档默认设置
-            self._apply_document_defaults(doc)
+            with self.metrics.stage('document_defaults') as counts:
+                self.changes['document_defaults'] = self._apply_document_defaults(doc)
+                counts['changes'] = self.changes['document_defaults']
             
             # 2. 应用样式格式
-            print("\n=== 应用样式格式 ===")
-            
-            # 首先加载模板文档以便复制缺失的样式
-            template_doc = None
-            template_path = self.format_info.get('template_file')
-            if template_path and os.path.exists(template_path):
-                try:
-                    template_doc = Document(template_path)
-                    print(f"已加载模板文档用于样式复制: {template_path}")
-                except Exception as e:
-                    print(f"警告：无法加载模板文档 {template_path}: {e}")
-            
-            for style_name, style_info in self.format_info['styles'].items():
-                # 检查样式是否存在，如果不存在则尝试从模板复制
-                if not self._ensure_style_exists(doc, style_name, template_doc):
-                    continue
-                    
-                if self._apply_style_format(doc, style_name, style_info):
-                    print(f"已应用样式: {style_name}")
+            logger.info("=== 应用样式格式 ===")
+            
+            profile = self.get_format_profile()
+            plans = profile.plans
+            with self.metrics.stage('style_application', styles=len(profile.plans)) as counts:
+                # 目标文档的样式索引只建立一次，之后按名称常数时间查找
+                style_index = StyleIndex(doc)
+                applied_styles = 0
+                
+                # 只应用目标文档实际使用的样式：目标文档中没有的样式不会被引用，也不再从模板导入
+                self.style_scope = None
+                if self.used_styles_only:
+                    plans = self._used_style_plans(doc, plans, style_index)
+                    self.style_scope = tuple(plans)
+                    counts['skipped_unused'] = len(profile.plans) - len(plans)
+                
+                # 缺失的样式连同其依赖的样式和编号定义从模板整体导入（一次合并）
+                originals = {}
+                if template_doc is not None and plans:
+                    self.diff['imported_styles'] = [name for name in plans if name not in style_index]
+                    merger = self.get_styles_merger(template_doc)
+                    # replace策略下替换后的样式还会按格式信息修改，记录合并前的定义，应用后与之比较
+                    if merger.policy == 'replace':
+                        originals = {name: canonical_xml(style_index.find_element(name)) for name in plans if name in style_index}
+                    merge_stats = merger.merge(doc, list(plans), style_index)
+                    counts['imported_styles'] = merge_stats['imported_styles']
+                    self.changes['imported_styles'] = merge_stats['imported_styles'] + merge_stats['replaced_styles']
+                
+                for style_name, plan in plans.items():
+                    if style_name not in style_index:
+                        logger.warning(f"  警告：未找到样式 {style_name}")
+                        continue
                     
-                    # 显示字体分离信息
-                    if 'font_separation' in style_info:
-                        sep = style_info['font_separation']
-                        ascii_font = sep.get('ascii', '未设置')
-                        eastAsia_font = sep.get('eastAsia', '未设置')
-                        print(f"  字体分离: 英文={ascii_font}, 中文={eastAsia_font}")
-            
-            # 3. 应用页眉页脚格式
-            self._apply_header_footer_formats(doc, input_path)
+                    if self._apply_style_format(doc, style_name, plan, style_index):
+                        applied_styles += 1
+                        logger.debug(f"已应用样式: {style_name}")
+                        
+                        # 显示字体分离信息
+                        if plan.font_separation is not None:
+                            fonts = dict(plan.font_separation)
+                            ascii_font = fonts.get(qn('w:ascii')) or '未设置'
+                            eastAsia_font = fonts.get(qn('w:eastAsia')) or '未设置'
+                            logger.debug(f"  字体分离: 英文={ascii_font}, 中文={eastAsia_font}")
+                
+                # 替换并应用后与合并前的定义相同的样式（文档已符合模板）不计为修改
+                restored = set()
+                for style_name, original in originals.items():
+                    style_element = style_index.find_element(style_name)
+                    if canonical_xml(style_element) == original:
+                        self.changes['styles'].pop(style_name, None)
+                        self.diff['styles'].pop(style_name, None)
+                        restored.add(id(style_element))
+                if restored:
+                    self.changes['imported_styles'] -= sum(1 for style_element in merger.replaced if id(style_element) in restored)
+                
+                style_changes = self.changes['styles']
+                counts['applied_styles'] = applied_styles
+                counts['changed_styles'] = len(style_changes)
+                counts['style_changes'] = sum(style_changes.values())
+            
+            logger.summary('style_application',
+                           f"已应用 {applied_styles}/{len(plans)} 个样式，"
+                           f"其中 {len(style_changes)} 个有修改（共 {sum(style_changes.values())} 项）",
+                           styles=len(plans), applied_styles=applied_styles,
+                           changed_styles=len(style_changes), style_changes=sum(style_changes.values()))
+            
+            # 3. 应用页眉页脚格式（按应用前后各节和页眉页脚部件的内容判断是否有修改）
+            with self.metrics.stage('header_footer', sections=len(doc.sections)) as counts:
+                before = self._header_footer_snapshot(doc)
+                self._apply_header_footer_formats(doc, template_doc, style_index)
+                after = self._header_footer_snapshot(doc)
+                self.diff['header_footer'] = [number for number, (old, new) in enumerate(zip(before, after), 1) if old != new]
+                self.changes['header_footer'] = len(self.diff['header_footer'])
+                counts['changed_sections'] = self.changes['header_footer']
             
             # 4. 清除段落级别的字体设置，让段落继承样式字体
-            self._clear_paragraph_fonts(doc)
+            with self.metrics.stage('run_clearing') as counts:
+                cleared = self._clear_paragraph_fonts(doc)
+                counts.update(cleared)
+                self.changes['run_clearing'] = sum(cleared.values())
             
-            # 5. 保存格式化后的文档
-            doc.save(output_path)
-            print(f"\n格式化完成！文档已保存为: {output_path}")
+            if not self.total_changes:
+                logger.info("文档已符合格式模板，没有需要修改的内容")
             return True
             
         except Exception as e:
-            print(f"应用格式时出错: {e}")
+            logger.error(f"应用格式时出错: {e}")
             return False
     
     def _apply_document_defaults(self, doc):
         """
         应用文档默认设置
+        返回修改数
         """
+        changes = 0
         try:
             defaults = self.format_info.get('document_defaults', {})
             default_font = defaults.get('default_font')
             default_font_size = defaults.get('default_font_size')
             
             if default_font or default_font_size:
-                print(f"应用文档默认设置: 字体={default_font}, 字号={default_font_size}")
+                logger.info(f"应用文档默认设置: 字体={default_font}, 字号={default_font_size}")
                 
                 # 注意：不在这里设置Normal样式的font.name，
                 # 因为这会覆盖后续的字体分离设置
@@ -154,214 +432,170 @@ class DynamicFormatApplier:
                 if even_and_odd_headers is None:
                     even_and_odd_headers = section_element.makeelement(qn('w:evenAndOddHeaders'), {})
                     section_element.append(even_and_odd_headers)
-            print("已设置文档默认使用奇偶页不同的页眉页脚（XML级别）")
-                        
+                    changes += 1
+            logger.debug("已设置文档默认使用奇偶页不同的页眉页脚（XML级别）")
+        
         except Exception as e:
-            print(f"应用文档默认设置时出错: {e}")
+            logger.error(f"应用文档默认设置时出错: {e}")
+        
+        return changes
     
-    def _ensure_style_exists(self, doc, style_name, template_doc=None):
+    def get_styles_merger(self, template_doc):
         """
-        确保样式存在，如果不存在则尝试从模板复制
+        返回模板文档对应的样式合并引擎，模板文档不变时复用
         """
-        # 检查样式是否已存在
-        for style in doc.styles:
-            if style.name == style_name:
-                return True
-        
-        # 样式不存在，尝试从模板复制
-        if template_doc is not None:
-            template_style = None
-            for style in template_doc.styles:
-                if style.name == style_name:
-                    template_style = style
-                    break
-            
-            if template_style is not None:
-                try:
-                    print(f"  从模板复制样式: {style_name}")
-                    # 根据样式类型添加新样式
-                    if template_style.type == 1:  # PARAGRAPH
-                        new_style = doc.styles.add_style(style_name, 1)
-                    elif template_style.type == 2:  # CHARACTER
-                        new_style = doc.styles.add_style(style_name, 2)
-                    else:
-                        print(f"  警告：不支持的样式类型 {template_style.type} for {style_name}")
-                        return False
-                    
-                    # 复制基本属性
-                    if hasattr(template_style, 'base_style') and template_style.base_style:
-                        try:
-                            new_style.base_style = template_style.base_style
-                        except:
-                            pass  # 如果基础样式不存在，忽略错误
-                    
-                    return True
-                    
-                except Exception as e:
-                    print(f"  警告：无法复制样式 {style_name}: {e}")
-                    return False
+        if self.styles_merger is None or self.styles_merger.template_doc is not template_doc:
+            self.styles_merger = StylesMerger(template_doc, policy=self.style_merge_policy, metrics=self.metrics)
+        return self.styles_merger
+    
+    @property
+    def total_changes(self):
+        """
+        最近一次应用的修改总数，为0表示文档已符合格式模板
+        """
+        return sum(sum(value.values()) if isinstance(value, dict) else value for value in self.changes.values())
+    
+    def _used_style_plans(self, doc, plans, style_index):
+        """
+        按目标文档实际使用的样式（w:pStyle/w:rStyle/w:tblStyle引用的样式、默认样式及其基础样式链）筛选应用计划
+        """
+        used_ids = style_index.used_style_ids(referenced_style_ids(doc))
+        used_plans = {}
+        for style_name, plan in plans.items():
+            style_element = style_index.find_element(style_name)
+            if style_element is not None and style_element.styleId in used_ids:
+                used_plans[style_name] = plan
         
-        print(f"  警告：未找到样式 {style_name}")
-        return False
+        logger.info(f"目标文档使用 {len(used_ids)} 个样式，应用其中格式信息包含的 {len(used_plans)}/{len(plans)} 个")
+        return used_plans
     
-    def _apply_style_format(self, doc, style_name, style_info):
+    def _apply_style_format(self, doc, style_name, plan, style_index=None):
         """
-        应用单个样式的格式
+        按预先生成的应用计划应用单个样式的格式
         """
         try:
             # 查找对应的样式
-            target_style = None
-            for style in doc.styles:
-                if style.name == style_name:
-                    target_style = style
-                    break
+            if style_index is None:
+                style_index = StyleIndex(doc)
+            target_style = style_index.get(style_name)
             
             if not target_style:
-                print(f"  错误：样式 {style_name} 不存在")
+                logger.error(f"  错误：样式 {style_name} 不存在")
                 return False
             
             # 应用字体格式
-            self._apply_font_format(target_style, style_info)
+            changes = self._apply_font_format(target_style, plan)
             
             # 应用段落格式
-            self._apply_paragraph_format(target_style, style_info)
+            changes += self._apply_paragraph_format(target_style, plan)
             
-            # 应用字体分离设置（XML级别）
-            if 'font_separation' in style_info:
-                self._apply_font_separation(target_style, style_info['font_separation'])
+            # 应用字体名称和字体分离设置（XML级别）
+            changes += self._apply_font_names(target_style, plan)
             
+            if changes:
+                self.changes.setdefault('styles', {})[style_name] = len(changes)
+                self.diff.setdefault('styles', {})[style_name] = changes
             return True
             
         except Exception as e:
-            print(f"应用样式 {style_name} 格式时出错: {e}")
+            logger.error(f"应用样式 {style_name} 格式时出错: {e}")
             return False
     
-    def _apply_font_format(self, style, style_info):
+    def _apply_font_format(self, style, plan):
         """
-        应用字体格式
+        应用字体格式，只写入与当前取值不同的属性
+        返回修改列表 [(属性, 原取值, 新取值)]
         """
+        changes = []
         try:
             if hasattr(style, 'font'):
                 font = style.font
                 
-                # 基本字体名称 - 只有在明确设置且不是"继承默认字体"时才设置
-                if 'font_name' in style_info and style_info['font_name'] != '继承默认字体':
-                    font.name = style_info['font_name']
-                elif 'font_name' in style_info and style_info['font_name'] == '继承默认字体':
-                    # 清除font.name，让它继承默认设置
-                    # 但保留字体分离设置，因为它们可能包含重要的语言特定字体信息
-                    font.name = None
-                    # 注意：不清除XML级别的字体分离设置，因为它们是独立的配置
-                    # 字体分离设置将通过_apply_font_separation方法单独处理
-                
-                # 字号
-                if 'font_size' in style_info:
-                    size_pt = float(style_info['font_size'].replace('pt', ''))
-                    font.size = Pt(size_pt)
-                
-                # 粗体
-                if 'bold' in style_info:
-                    font.bold = style_info['bold']
-                
-                # 斜体
-                if 'italic' in style_info:
-                    font.italic = style_info['italic']
-                
-                # 下划线
-                if 'underline' in style_info:
-                    # 这里可以根据需要处理下划线设置
-                    pass
-                
-                # 字体颜色
-                if 'color' in style_info:
+                # 字号、粗体、斜体（字体名称与字体分离设置同在rFonts中，由_apply_font_names处理）
+                changes += _assign_changed(font, [(attribute, value) for attribute, value in plan.font_ops
+                                                  if attribute != 'name'])
+                
+                # 字体颜色（当前为主题颜色时也需要改写为RGB颜色）
+                if plan.color is not None and (font.color.type != MSO_COLOR_TYPE.RGB or font.color.rgb != plan.color):
                     try:
-                        from docx.shared import RGBColor
-                        color_str = style_info['color']
-                        # 处理十六进制颜色格式，如 'EE0000'
-                        if len(color_str) == 6:
-                            r = int(color_str[0:2], 16)
-                            g = int(color_str[2:4], 16)
-                            b = int(color_str[4:6], 16)
-                            font.color.rgb = RGBColor(r, g, b)
-                            print(f"  已应用字体颜色: RGB({r}, {g}, {b})")
-                        else:
-                            print(f"警告：无法解析颜色格式: {color_str}")
+                        current_color = font.color.rgb
+                        font.color.rgb = plan.color
+                        changes.append(('color', current_color, plan.color))
+                        logger.debug(f"  已应用字体颜色: {plan.color}")
                     except Exception as color_error:
-                        print(f"应用字体颜色时出错: {color_error}")
-                
+                        logger.error(f"应用字体颜色时出错: {color_error}")
+        
         except Exception as e:
-            print(f"应用字体格式时出错: {e}")
+            logger.error(f"应用字体格式时出错: {e}")
+        
+        return changes
     
-    def _apply_paragraph_format(self, style, style_info):
+    def _apply_paragraph_format(self, style, plan):
         """
-        应用段落格式
+        应用段落格式，只写入与当前取值不同的属性
+        返回修改列表 [(属性, 原取值, 新取值)]
         """
+        changes = []
         try:
             if hasattr(style, 'paragraph_format'):
                 pf = style.paragraph_format
                 
-                # 对齐方式
-                if 'alignment' in style_info:
-                    alignment_value = self.alignment_map.get(style_info['alignment'])
-                    if alignment_value is not None:
-                        pf.alignment = alignment_value
-                else:
-                    # 清除对齐方式，使用默认值
-                    pf.alignment = None
-                
-                # 行间距 - 完整覆盖逻辑
-                if 'line_spacing' in style_info:
-                    pf.line_spacing = float(style_info['line_spacing'])
-                else:
-                    # 清除行距设置，使用默认值
-                    pf.line_spacing = None
-                
-                # 段前距
-                if 'space_before' in style_info:
-                    space_pt = float(style_info['space_before'].replace('pt', ''))
-                    pf.space_before = Pt(space_pt)
-                else:
-                    # 清除段前距，使用默认值
-                    pf.space_before = None
-                
-                # 段后距
-                if 'space_after' in style_info:
-                    space_pt = float(style_info['space_after'].replace('pt', ''))
-                    pf.space_after = Pt(space_pt)
-                else:
-                    # 清除段后距，使用默认值
-                    pf.space_after = None
-                
-                # 首行缩进
-                if 'first_line_indent' in style_info:
-                    indent_pt = float(style_info['first_line_indent'].replace('pt', ''))
-                    pf.first_line_indent = Pt(indent_pt)
-                else:
-                    # 清除首行缩进，使用默认值
-                    pf.first_line_indent = None
-                
-                # 左缩进
-                if 'left_indent' in style_info:
-                    indent_pt = float(style_info['left_indent'].replace('pt', ''))
-                    pf.left_indent = Pt(indent_pt)
-                else:
-                    # 清除左缩进，使用默认值
-                    pf.left_indent = None
-                
-                # 右缩进
-                if 'right_indent' in style_info:
-                    indent_pt = float(style_info['right_indent'].replace('pt', ''))
-                    pf.right_indent = Pt(indent_pt)
+                # 对齐方式、行间距、段前段后距、缩进 - 完整覆盖逻辑
+                # 格式信息中未设置的属性在计划中取值为None，清除后使用默认值
+                changes = _assign_changed(pf, plan.paragraph_ops)
+        
+        except Exception as e:
+            logger.error(f"应用段落格式时出错: {e}")
+        
+        return changes
+    
+    def _apply_font_names(self, style, plan):
+        """
+        应用字体名称和字体分离设置：先推算按计划赋值后rFonts的属性，与当前一致时不写入
+        返回修改列表 [(属性, 原取值, 新取值)]
+        """
+        try:
+            rpr = style.element.rPr
+            rfonts = rpr.rFonts if rpr is not None else None
+            current = dict(rfonts.attrib) if rfonts is not None else None
+            
+            # 字体名称同时设置ascii和hAnsi；格式信息中字体名称为"继承默认字体"时取值为None，
+            # 与python-docx一致删除整个rFonts，让它继承默认设置
+            name_ops = [value for attribute, value in plan.font_ops if attribute == 'name']
+            expected = current
+            for font_name in name_ops:
+                if font_name is None:
+                    expected = None
                 else:
-                    # 清除右缩进，使用默认值
-                    pf.right_indent = None
-                    
+                    expected = dict(expected or {})
+                    expected[W_RFONTS_ASCII] = font_name
+                    expected[W_RFONTS_HANSI] = font_name
+            
+            if plan.font_separation is not None:
+                expected = dict(expected or {})
+                for attribute, font_name in plan.font_separation:
+                    if font_name is not None:
+                        expected[attribute] = font_name
+                    else:
+                        expected.pop(attribute, None)
+            
+            if expected == current:
+                return []
+            
+            for font_name in name_ops:
+                style.font.name = font_name
+            if plan.font_separation is not None:
+                self._apply_font_separation(style, plan.font_separation)
+            return _rfonts_changes(current, expected)
+        
         except Exception as e:
-            print(f"应用段落格式时出错: {e}")
+            logger.error(f"应用字体名称时出错: {e}")
+            return []
     
     def _apply_font_separation(self, style, font_separation):
         """
         应用字体分离设置（XML级别）
+        font_separation为 (rFonts属性, 字体名称) 的元组，字体名称为None时清除该属性以继承默认设置
         """
         try:
             if hasattr(style, '_element'):
@@ -379,47 +613,24 @@ class DynamicFormatApplier:
                     rfonts = rpr.makeelement(qn('w:rFonts'))
                     rpr.insert(0, rfonts)
                 
-                # 智能应用字体分离设置
                 # 只设置明确指定的字体，未指定的字体清除以继承默认设置
-                
-                # 设置指定的字体
-                if 'ascii' in font_separation and font_separation['ascii'] != '未设置':
-                    rfonts.set(qn('w:ascii'), font_separation['ascii'])
-                else:
-                    # 清除ascii字体设置，让它继承默认
-                    if qn('w:ascii') in rfonts.attrib:
-                        rfonts.attrib.pop(qn('w:ascii'), None)
-                
-                if 'hAnsi' in font_separation and font_separation['hAnsi'] != '未设置':
-                    rfonts.set(qn('w:hAnsi'), font_separation['hAnsi'])
-                else:
-                    # 清除hAnsi字体设置，让它继承默认
-                    if qn('w:hAnsi') in rfonts.attrib:
-                        rfonts.attrib.pop(qn('w:hAnsi'), None)
-                
-                if 'eastAsia' in font_separation and font_separation['eastAsia'] != '未设置':
-                    rfonts.set(qn('w:eastAsia'), font_separation['eastAsia'])
-                else:
-                    # 清除eastAsia字体设置，让它继承默认
-                    if qn('w:eastAsia') in rfonts.attrib:
-                        rfonts.attrib.pop(qn('w:eastAsia'), None)
-                
-                if 'cs' in font_separation and font_separation['cs'] != '未设置':
-                    rfonts.set(qn('w:cs'), font_separation['cs'])
-                else:
-                    # 清除cs字体设置，让它继承默认
-                    if qn('w:cs') in rfonts.attrib:
-                        rfonts.attrib.pop(qn('w:cs'), None)
-                    
+                for attribute, font_name in font_separation:
+                    if font_name is not None:
+                        rfonts.set(attribute, font_name)
+                    else:
+                        rfonts.attrib.pop(attribute, None)
+        
         except Exception as e:
-            print(f"应用字体分离设置时出错: {e}")
+            logger.error(f"应用字体分离设置时出错: {e}")
     
     def _clear_paragraph_fonts(self, doc):
         """
         清除段落级别的字体设置，让段落继承样式字体
+        返回清除字体设置的run数和段落数
         """
+        counts = {}
         try:
-            print("\n=== 清除段落级别字体设置 ===")
+            logger.info("=== 清除段落级别字体设置 ===")
             cleared_run_count = 0
             cleared_para_count = 0
             
@@ -462,13 +673,31 @@ class DynamicFormatApplier:
                             if len(rpr) == 0:
                                 run_element.remove(rpr)
             
-            print(f"已清除 {cleared_run_count} 个run的字体设置")
-            print(f"已清除 {cleared_para_count} 个段落的字体设置")
-            
+            logger.summary('run_clearing', f"已清除 {cleared_run_count} 个run和 {cleared_para_count} 个段落的字体设置",
+                           cleared_runs=cleared_run_count, cleared_paragraphs=cleared_para_count)
+            counts = {'cleared_runs': cleared_run_count, 'cleared_paragraphs': cleared_para_count}
+        
         except Exception as e:
-            print(f"清除段落字体设置时出错: {e}")
+            logger.error(f"清除段落字体设置时出错: {e}")
+        
+        return counts
     
-    def _apply_header_footer_formats(self, doc, test_doc_path):
+    def _header_footer_snapshot(self, doc):
+        """
+        各节的节属性及其页眉页脚部件的规范化序列化结果（只读取已存在的部件，不新建）
+        """
+        snapshot = []
+        for section in doc.sections:
+            sect_pr = section._sectPr
+            members = [etree.tostring(sect_pr, method='c14n')]
+            for reference in sect_pr.iterchildren(qn('w:headerReference'), qn('w:footerReference')):
+                part = doc.part.related_parts.get(reference.get(qn('r:id')))
+                if part is not None:
+                    members.append(etree.tostring(part.element, method='c14n'))
+            snapshot.append(members)
+        return snapshot
+    
+    def _apply_header_footer_formats(self, doc, template_doc=None, style_index=None):
         """
         应用页眉页脚格式
         根据需求：
@@ -480,26 +709,29 @@ class DynamicFormatApplier:
             from docx.oxml.ns import qn
             from docx.oxml import OxmlElement
             
-            print("\n=== 应用页眉页脚格式 ===")
+            logger.info("=== 应用页眉页脚格式 ===")
             
-            # 加载测试文档以获取标题一内容
-            test_doc = Document(test_doc_path)
+            profile = self.get_format_profile()
             
-            # 查找标题一内容
+            # 从正在格式化的文档中查找标题一内容（样式应用不改变段落内容）
+            if style_index is None:
+                style_index = StyleIndex(doc)
             title_one_content = ""
-            for para in test_doc.paragraphs:
-                if para.style.name == "Heading 1" or para.style.name == "标题 1":
+            for para in doc.paragraphs:
+                style_name = style_index.paragraph_style_name(para)
+                if style_name == "Heading 1" or style_name == "标题 1":
                     title_one_content = para.text
                     break
             
             if not title_one_content:
-                print("警告：未找到标题一内容，将使用文档标题作为替代")
-                title_one_content = test_doc.core_properties.title or "文档标题"
+                logger.warning("警告：未找到标题一内容，将使用文档标题作为替代")
+                title_one_content = doc.core_properties.title or "文档标题"
             
-            print(f"找到标题一内容: {title_one_content}")
+            logger.debug(f"找到标题一内容: {title_one_content}")
             
-            # 加载格式模板以获取页眉内容
-            template_doc = Document(self.format_info.get('template_file') or config.TEMPLATE_FILE)
+            # 使用已加载的格式模板获取页眉内容，未提供时才加载
+            if template_doc is None:
+                template_doc = Document(self.format_info.get('template_file') or config.TEMPLATE_FILE)
             
             # 获取格式模板的页眉内容
             odd_header_content = ""
@@ -511,39 +743,32 @@ class DynamicFormatApplier:
                         break
             
             if not odd_header_content:
-                print("警告：未找到格式模板页眉内容，将使用默认页眉")
+                logger.warning("警告：未找到格式模板页眉内容，将使用默认页眉")
                 odd_header_content = "社会保障评论"
             
-            print(f"找到格式模板页眉内容: {odd_header_content}")
+            logger.debug(f"找到格式模板页眉内容: {odd_header_content}")
             
             # 设置奇偶页不同的页眉
             for i, section in enumerate(doc.sections):
                 # 设置页眉页脚选项
                 section.different_first_page_header_footer = False  # 不使用首页不同的页眉
                 
-                # 设置页眉顶端距离和页脚底端距离
-                section_id = f"section_{i+1}"
-                section_settings = self.format_info.get('section_settings', {}).get(section_id, {})
+                # 设置页眉顶端距离和页脚底端距离（缇；未设置时默认15磅）
+                section_profile = profile.section(f"section_{i+1}")
                 
                 # 设置页眉顶端距离
-                if 'header_distance' in section_settings:
-                    header_distance_str = section_settings['header_distance']
-                    if header_distance_str.endswith('pt'):
-                        header_distance_pt = float(header_distance_str.replace('pt', ''))
-                        section.header_distance = Pt(header_distance_pt)
-                        print(f"设置第{i+1}节页眉顶端距离: {header_distance_pt}pt")
-                else:
-                    section.header_distance = Pt(15)  # 默认设置页眉与正文的距离
+                header_distance = section_profile.header_distance
+                if header_distance is None:
+                    header_distance = DEFAULT_HEADER_FOOTER_DISTANCE
+                section.header_distance = Twips(header_distance)
+                logger.debug(f"设置第{i+1}节页眉顶端距离: {header_distance / 20}pt")
                 
                 # 设置页脚底端距离
-                if 'footer_distance' in section_settings:
-                    footer_distance_str = section_settings['footer_distance']
-                    if footer_distance_str.endswith('pt'):
-                        footer_distance_pt = float(footer_distance_str.replace('pt', ''))
-                        section.footer_distance = Pt(footer_distance_pt)
-                        print(f"设置第{i+1}节页脚底端距离: {footer_distance_pt}pt")
-                else:
-                    section.footer_distance = Pt(15)  # 默认设置页脚与正文的距离
+                footer_distance = section_profile.footer_distance
+                if footer_distance is None:
+                    footer_distance = DEFAULT_HEADER_FOOTER_DISTANCE
+                section.footer_distance = Twips(footer_distance)
+                logger.debug(f"设置第{i+1}节页脚底端距离: {footer_distance / 20}pt")
                 
                 # 启用奇偶页不同的页眉页脚 - 在XML级别设置
                 section_element = section._sectPr
@@ -551,7 +776,7 @@ class DynamicFormatApplier:
                 if even_and_odd_headers is None:
                     even_and_odd_headers = section_element.makeelement(qn('w:evenAndOddHeaders'), {})
                     section_element.append(even_and_odd_headers)
-                print(f"已启用第{i+1}节的奇偶页不同页眉页脚")
+                logger.debug(f"已启用第{i+1}节的奇偶页不同页眉页脚")
                 
                 # 清除现有页眉内容
                 for para in section.header.paragraphs:
@@ -668,12 +893,12 @@ class DynamicFormatApplier:
                 run = para.add_run(" -")
                 run.font.size = Pt(10.5)
                 
-                print(f"已设置第{i+1}节的奇偶页页眉和页脚页码")
-            
-            print("页眉页脚格式应用完成")
+                logger.debug(f"已设置第{i+1}节的奇偶页页眉和页脚页码")
             
+            logger.summary('header_footer', f"页眉页脚格式应用完成: {len(doc.sections)} 节", sections=len(doc.sections))
+        
         except Exception as e:
-            print(f"应用页眉页脚格式时出错: {e}")
+            logger.error(f"应用页眉页脚格式时出错: {e}")
     
     def get_style_summary(self):
         """
@@ -717,8 +942,16 @@ class DynamicFormatApplier:
 
 def main():
     """
-    主函数：应用动态格式到测试文档
+    主函数：应用动态格式到测试文档；指定--plan时只计划将要进行的修改并写入JSONL
     """
+    parser = argparse.ArgumentParser(description="将格式模板的格式应用到测试文档")
+    parser.add_argument('inputs', nargs='*', default=[config.TEST_DOCUMENT], help="计划模式下的输入文档")
+    parser.add_argument('--plan', default=None, metavar='JSONL',
+                        help="只计划将要进行的修改并写入JSONL，不保存任何文档")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
     # 检查格式信息文件是否存在
     if not os.path.exists(config.DYNAMIC_FORMAT_INFO):
         print(f"错误：找不到格式信息文件 {config.DYNAMIC_FORMAT_INFO}")
@@ -731,7 +964,22 @@ def main():
         print(f"错误：找不到以下必需文件: {', '.join(missing_files)}")
         return
     
-    applier = DynamicFormatApplier()
+    if args.plan:
+        # 计划与实际处理走同一条流水线（清理、合并、应用），判断是否修改的条件一致
+        from format_pipeline import FormatPipeline, write_plan_records
+        pipeline = FormatPipeline(config.DYNAMIC_FORMAT_INFO)
+        records = []
+        for input_path in args.inputs:
+            record = pipeline.plan_document(input_path, doc_id=input_path)
+            records.append(record if record is not None else {'doc': input_path, 'error': '计划失败'})
+        summary = write_plan_records(records, args.plan)
+        logger.summary('format_plan', f"格式修改计划完成: {summary['documents']} 个文档，需要修改 {summary['changed']} 个，"
+                       f"已符合模板 {summary['unchanged']} 个，失败 {summary['failed']} 个", **summary)
+        print(f"格式修改计划已保存到: {args.plan}")
+        return
+    
+    metrics = StageMetrics()
+    applier = DynamicFormatApplier(metrics=metrics)
     
     # 1. 加载格式信息
     if not applier.load_format_info():
@@ -741,9 +989,12 @@ def main():
     print("\n=== 格式信息摘要 ===")
     print(applier.get_style_summary())
     
-    # 2. 应用格式到测试文档
-    success = applier.apply_formats_to_document()
+    # 2. 应用格式到测试文档（分阶段指标保存在格式化后的文档旁边）
+    output_path = config.get_fixed_formatted_doc_path()
+    metrics.context = {'output': output_path}
+    success = applier.apply_formats_to_document(output_path=output_path)
     if success:
+        print(f"分阶段指标已保存到: {metrics.save(metrics_path_for(output_path))}")
         print("\n格式应用完成！")
     else:
         print("\n格式应用失败！")
@@ -9,6 +9,7 @@
 
 import os
 import json
+import hashlib
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -16,10 +17,31 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.oxml.ns import qn
 from datetime import datetime
 from config import config
+from style_resolver import StyleResolver
+from theme_fonts import read_theme_fonts
+from stage_metrics import StageMetrics, metrics_path_for
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('dynamic_format_extractor')
+
+# 提取器版本：提取逻辑或格式信息结构变化时递增，使旧的模板格式缓存失效
+EXTRACTOR_VERSION = 2
+
+def compute_template_digest(template_path):
+    """
+    计算模板文件内容的SHA-256摘要，用于标识模板版本
+    """
+    digest = hashlib.sha256()
+    with open(template_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class DynamicFormatExtractor:
-    def __init__(self, template_path=None):
+    def __init__(self, template_path=None, metrics=None):
         self.template_path = template_path or config.TEMPLATE_FILE
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
         self.format_info = {
             'extraction_time': None,
             'template_file': self.template_path,
@@ -27,15 +49,18 @@ class DynamicFormatExtractor:
             'styles': {},
             'section_settings': {}
         }
+        self.style_resolver = None
+        self._font_separation_cache = {}
     
-    def extract_template_formats(self, template_path=None):
+    def extract_template_formats(self, template_path=None, output_path=None):
         """
         动态提取格式模板中的所有格式信息
+        output_path为格式信息的保存路径，默认保存到config.DYNAMIC_FORMAT_INFO
         """
         if template_path is None:
             template_path = self.template_path
             
-        print(f"正在动态提取格式模板: {template_path}")
+        logger.info(f"正在动态提取格式模板: {template_path}")
         
         self.format_info['extraction_time'] = datetime.now().isoformat()
         self.format_info['template_file'] = os.path.basename(template_path)
@@ -43,63 +68,84 @@ class DynamicFormatExtractor:
         self.format_info['footers'] = {}
         
         try:
-            doc = Document(template_path)
+            with self.metrics.stage('load'):
+                doc = Document(template_path)
+                
+                # 每个模板文档建立一次样式继承解析器，所有样式共享解析结果
+                # （主题字体按模板的主题部件解析，只读取一次）
+                self.style_resolver = StyleResolver(doc)
+                self._font_separation_cache = {}
+                theme_fonts = read_theme_fonts(doc)
+                if theme_fonts is not None:
+                    self.format_info['theme_fonts'] = theme_fonts.to_dict()
+                
+                # 记录模板内容摘要和提取器版本，标识格式信息来自哪个模板版本
+                self.format_info['template_sha256'] = compute_template_digest(template_path)
+                self.format_info['extractor_version'] = EXTRACTOR_VERSION
             
             # 1. 提取文档默认设置
-            self._extract_document_defaults(doc)
+            with self.metrics.stage('document_defaults'):
+                self._extract_document_defaults(doc)
             
             # 2. 提取所有段落样式的完整格式信息
-            print("\n=== 提取样式格式信息 ===")
-            for style in doc.styles:
-                if style.type == WD_STYLE_TYPE.PARAGRAPH:
-                    style_info = self._extract_complete_style_info(style)
-                    self.format_info['styles'][style.name] = style_info
-                    print(f"提取样式: {style.name}")
-                    
-                    # 显示基本字体属性
-                    font_attrs = []
-                    if 'font_size' in style_info:
-                        font_attrs.append(f"字号={style_info['font_size']}")
-                    if 'bold' in style_info:
-                        font_attrs.append(f"加粗={style_info['bold']}")
-                    if 'italic' in style_info:
-                        font_attrs.append(f"斜体={style_info['italic']}")
-                    if 'color' in style_info:
-                        font_attrs.append(f"颜色={style_info['color']}")
-                    if 'underline' in style_info:
-                        font_attrs.append(f"下划线={style_info['underline']}")
-                    
-                    if font_attrs:
-                        print(f"  字体属性: {', '.join(font_attrs)}")
-                    
-                    # 显示字体分离信息
-                    if 'font_separation' in style_info:
-                        font_size = style_info.get('font_size', '未设置')
-                        # 优先显示ascii字体，如果未设置则显示hAnsi字体
-                        english_font = style_info['font_separation'].get('ascii') or style_info['font_separation'].get('hAnsi', '未设置')
-                        print(f"  字体分离: 英文={english_font}, 中文={style_info['font_separation'].get('eastAsia', '未设置')}, 字号={font_size}")
+            logger.info("=== 提取样式格式信息 ===")
+            with self.metrics.stage('style_extraction') as counts:
+                for style in doc.styles:
+                    if style.type == WD_STYLE_TYPE.PARAGRAPH:
+                        style_info = self._extract_complete_style_info(style)
+                        self.format_info['styles'][style.name] = style_info
+                        logger.debug(f"提取样式: {style.name}")
+                        
+                        # 显示基本字体属性
+                        font_attrs = []
+                        if 'font_size' in style_info:
+                            font_attrs.append(f"字号={style_info['font_size']}")
+                        if 'bold' in style_info:
+                            font_attrs.append(f"加粗={style_info['bold']}")
+                        if 'italic' in style_info:
+                            font_attrs.append(f"斜体={style_info['italic']}")
+                        if 'color' in style_info:
+                            font_attrs.append(f"颜色={style_info['color']}")
+                        if 'underline' in style_info:
+                            font_attrs.append(f"下划线={style_info['underline']}")
+                        
+                        if font_attrs:
+                            logger.debug(f"  字体属性: {', '.join(font_attrs)}")
+                        
+                        # 显示字体分离信息
+                        if 'font_separation' in style_info:
+                            font_size = style_info.get('font_size', '未设置')
+                            # 优先显示ascii字体，如果未设置则显示hAnsi字体
+                            english_font = style_info['font_separation'].get('ascii') or style_info['font_separation'].get('hAnsi', '未设置')
+                            logger.debug(f"  字体分离: 英文={english_font}, 中文={style_info['font_separation'].get('eastAsia', '未设置')}, 字号={font_size}")
+                
+                counts['styles'] = len(self.format_info['styles'])
             
             # 3. 提取页眉页脚格式信息
-            print("\n=== 提取页眉页脚格式信息 ===")
-            self._extract_header_footer_formats(doc)
+            logger.info("=== 提取页眉页脚格式信息 ===")
+            with self.metrics.stage('header_footer', sections=len(doc.sections)):
+                self._extract_header_footer_formats(doc)
             
             # 4. 保存格式信息到文件
-            self._save_format_info()
+            with self.metrics.stage('save'):
+                self._save_format_info(output_path)
             
-            print(f"\n格式信息提取完成！")
-            print(f"共提取 {len(self.format_info['styles'])} 个样式，页眉 {len(self.format_info['headers'])} 个，页脚 {len(self.format_info['footers'])} 个")
+            logger.summary('extraction',
+                           f"格式信息提取完成！共提取 {len(self.format_info['styles'])} 个样式，页眉 {len(self.format_info['headers'])} 个，页脚 {len(self.format_info['footers'])} 个",
+                           styles=len(self.format_info['styles']), headers=len(self.format_info['headers']),
+                           footers=len(self.format_info['footers']))
             
             return self.format_info
             
         except Exception as e:
-            print(f"提取格式信息时出错: {e}")
+            logger.error(f"提取格式信息时出错: {e}")
             return None
     
     def _extract_document_defaults(self, doc):
         """
         提取文档默认设置，包括XML级别的默认字体分离设置
         """
-        print("提取文档默认设置...")
+        logger.info("提取文档默认设置...")
         
         try:
             # 1. 先尝试从样式部件中提取文档默认设置
@@ -118,18 +164,18 @@ class DynamicFormatExtractor:
                     if rpr_default is not None:
                         rpr = rpr_default.find(qn('w:rPr'))
                         if rpr is not None:
-                            # 提取默认字体分离设置
-                            rfonts = rpr.find(qn('w:rFonts'))
-                            if rfonts is not None:
-                                eastAsia_font = rfonts.get(qn('w:eastAsia'))
+                            # 提取默认字体分离设置（直接设置优先，其次为按模板主题解析的主题字体）
+                            default_fonts = self.style_resolver.doc_defaults()[0] if self.style_resolver else {}
+                            if rpr.find(qn('w:rFonts')) is not None:
+                                eastAsia_font = default_fonts.get('eastAsia')
                                 if eastAsia_font:
                                     self.format_info['document_defaults']['default_font'] = eastAsia_font
-                                    print(f"  文档默认中文字体: {eastAsia_font}")
+                                    logger.debug(f"  文档默认中文字体: {eastAsia_font}")
                                 else:
-                                    ascii_font = rfonts.get(qn('w:ascii'))
+                                    ascii_font = default_fonts.get('ascii')
                                     if ascii_font:
                                         self.format_info['document_defaults']['default_font'] = ascii_font
-                                        print(f"  文档默认英文字体: {ascii_font}")
+                                        logger.debug(f"  文档默认英文字体: {ascii_font}")
                             
                             # 提取默认字号
                             sz = rpr.find(qn('w:sz'))
@@ -138,7 +184,7 @@ class DynamicFormatExtractor:
                                 if font_size:
                                     # Word中字号是半点单位，需要除以2
                                     self.format_info['document_defaults']['default_font_size'] = str(int(font_size) / 2) + 'pt'
-                                    print(f"  文档默认字号: {int(font_size) / 2}pt")
+                                    logger.debug(f"  文档默认字号: {int(font_size) / 2}pt")
             
             # 2. 如果没有从XML中提取到，则使用Normal样式作为备选
             if 'default_font' not in self.format_info['document_defaults']:
@@ -152,23 +198,23 @@ class DynamicFormatExtractor:
                     font = normal_style.font
                     if font.name:
                         self.format_info['document_defaults']['default_font'] = font.name
-                        print(f"  从Normal样式获取默认字体: {font.name}")
+                        logger.debug(f"  从Normal样式获取默认字体: {font.name}")
                     
                     if font.size and 'default_font_size' not in self.format_info['document_defaults']:
                         self.format_info['document_defaults']['default_font_size'] = str(font.size.pt) + 'pt'
-                        print(f"  从Normal样式获取默认字号: {font.size.pt}pt")
+                        logger.debug(f"  从Normal样式获取默认字号: {font.size.pt}pt")
             
             # 3. 最后的备选方案
             if 'default_font' not in self.format_info['document_defaults']:
                 self.format_info['document_defaults']['default_font'] = '宋体'
-                print(f"  使用备选默认字体: 宋体")
+                logger.debug(f"  使用备选默认字体: 宋体")
             
             if 'default_font_size' not in self.format_info['document_defaults']:
                 self.format_info['document_defaults']['default_font_size'] = '10.0pt'
-                print(f"  使用备选默认字号: 10.0pt")
+                logger.debug(f"  使用备选默认字号: 10.0pt")
                 
         except Exception as e:
-            print(f"提取文档默认设置时出错: {e}")
+            logger.error(f"提取文档默认设置时出错: {e}")
             # 设置备选值
             self.format_info['document_defaults']['default_font'] = '宋体'
             self.format_info['document_defaults']['default_font_size'] = '10.0pt'
@@ -196,7 +242,7 @@ class DynamicFormatExtractor:
             return style_info
             
         except Exception as e:
-            print(f"提取样式 {style.name} 信息时出错: {e}")
+            logger.error(f"提取样式 {style.name} 信息时出错: {e}")
             return style_info
     
     def _extract_font_info(self, style):
@@ -244,45 +290,33 @@ class DynamicFormatExtractor:
                     font_info['font_separation'] = {
                         'eastAsia': default_font
                     }
-                    print(f"  Normal样式使用文档默认中文字体: {default_font}")
+                    logger.debug(f"  Normal样式使用文档默认中文字体: {default_font}")
             
             return font_info
             
         except Exception as e:
-            print(f"提取字体信息时出错: {e}")
+            logger.error(f"提取字体信息时出错: {e}")
             return {}
     
+    def _get_resolver(self, style):
+        """
+        获取样式所在文档的样式继承解析器（单独调用时按样式所在的样式部件临时建立）
+        """
+        styles_element = style._element.getparent()
+        if self.style_resolver is None or self.style_resolver.styles_element is not styles_element:
+            self.style_resolver = StyleResolver(styles_element)
+            self._font_separation_cache = {}
+        return self.style_resolver
+    
     def _get_inherited_font_size(self, style):
         """
         获取继承的字号，如果整个继承链条都没有设置，则使用Word默认值12pt
         """
         try:
-            # 遍历继承链条查找字号设置
-            current_style = style
-            level = 0
-            
-            while current_style and level < 10:  # 防止无限循环
-                # 检查当前样式的字号
-                if hasattr(current_style, 'font') and current_style.font.size:
-                    return str(current_style.font.size.pt) + 'pt'
-                
-                # 检查XML级别的字号设置
-                if hasattr(current_style, '_element'):
-                    style_element = current_style._element
-                    rpr = style_element.find(qn('w:rPr'))
-                    if rpr is not None:
-                        sz = rpr.find(qn('w:sz'))
-                        if sz is not None:
-                            sz_val = sz.get(qn('w:val'))
-                            if sz_val:
-                                return str(int(sz_val)/2) + 'pt'
-                
-                # 移动到基础样式
-                if hasattr(current_style, 'base_style') and current_style.base_style:
-                    current_style = current_style.base_style
-                    level += 1
-                else:
-                    break
+            # 基础样式链上最近的字号设置（解析结果按样式缓存）
+            resolved = self._get_resolver(style).resolve(style)
+            if resolved is not None and 'sz' in resolved.chain_rpr:
+                return str(resolved.chain_rpr['sz'] / 2) + 'pt'
             
             # 检查文档默认字号
             try:
@@ -297,7 +331,7 @@ class DynamicFormatExtractor:
             return '12.0pt'
             
         except Exception as e:
-            print(f"获取继承字号时出错: {e}")
+            logger.error(f"获取继承字号时出错: {e}")
             return '12.0pt'  # 出错时返回默认值
     
     def _extract_font_separation(self, style):
@@ -305,133 +339,73 @@ class DynamicFormatExtractor:
         提取XML级别的字体分离设置，包括继承的字体和主题字体
         """
         try:
-            separation = {}
-            theme_fonts = {}
-            
-            if hasattr(style, '_element'):
-                style_element = style._element
-                
-                # 查找rPr元素
-                rpr = style_element.find(qn('w:rPr'))
-                if rpr is not None:
-                    # 查找rFonts元素
-                    rfonts = rpr.find(qn('w:rFonts'))
-                    if rfonts is not None:
-                        # 提取直接字体设置
-                        ascii_font = rfonts.get(qn('w:ascii'))
-                        if ascii_font:
-                            separation['ascii'] = ascii_font
-                        
-                        hAnsi_font = rfonts.get(qn('w:hAnsi'))
-                        if hAnsi_font:
-                            separation['hAnsi'] = hAnsi_font
-                        
-                        eastAsia_font = rfonts.get(qn('w:eastAsia'))
-                        if eastAsia_font:
-                            separation['eastAsia'] = eastAsia_font
-                        
-                        cs_font = rfonts.get(qn('w:cs'))
-                        if cs_font:
-                            separation['cs'] = cs_font
-                        
-                        # 提取主题字体设置
-                        ascii_theme = rfonts.get(qn('w:asciiTheme'))
-                        if ascii_theme:
-                            theme_fonts['ascii'] = ascii_theme
-                        
-                        hAnsi_theme = rfonts.get(qn('w:hAnsiTheme'))
-                        if hAnsi_theme:
-                            theme_fonts['hAnsi'] = hAnsi_theme
-                        
-                        eastAsia_theme = rfonts.get(qn('w:eastAsiaTheme'))
-                        if eastAsia_theme:
-                            theme_fonts['eastAsia'] = eastAsia_theme
-                        
-                        cs_theme = rfonts.get(qn('w:cstheme'))
-                        if cs_theme:
-                            theme_fonts['cs'] = cs_theme
-            
-            # 解析主题字体为实际字体名称
-            theme_font_map = {
-                'majorHAnsi': 'Calibri Light',
-                'minorHAnsi': 'Calibri',
-                'majorBidi': 'Times New Roman',
-                'minorBidi': 'Arial'
-            }
+            resolver = self._get_resolver(style)
+            resolved = resolver.resolve(style)
+            if resolved is None:
+                return None
             
-            for font_type, theme_name in theme_fonts.items():
-                if font_type not in separation:  # 只有在没有直接设置时才使用主题字体
-                    actual_font = theme_font_map.get(theme_name, theme_name)
-                    separation[font_type] = actual_font
-            
-            # 如果当前样式没有设置某些字体，尝试从基础样式继承
-            if hasattr(style, 'base_style') and style.base_style:
-                base_separation = self._extract_font_separation(style.base_style)
-                if base_separation:
-                    # 只继承当前样式没有设置的字体
-                    for font_type in ['ascii', 'hAnsi', 'eastAsia', 'cs']:
-                        if font_type not in separation and font_type in base_separation:
-                            separation[font_type] = base_separation[font_type]
-            
-            # 如果仍然没有设置，且不是Normal样式，则检查是否需要使用文档默认字体
-            if style.name != 'Normal' and separation:
-                default_font = self.format_info['document_defaults'].get('default_font', '宋体')
-                
-                # 只对eastAsia字体使用默认字体
-                if 'eastAsia' not in separation:
-                    separation['eastAsia'] = default_font
-            
-            # 处理cs字体作为英文字体的情况
-            # 当cs字体设置了常见英文字体时，将其作为英文字体（优先级高于继承的字体）
-            if separation and 'cs' in separation:
-                cs_font = separation['cs']
-                # 如果cs字体是常见的英文字体，则将其作为英文字体
-                common_english_fonts = ['Times New Roman', 'Arial', 'Calibri', 'Calibri Light', 'Verdana', 'Tahoma']
-                if cs_font in common_english_fonts:
-                    # 如果ascii和hAnsi都未直接设置（即来自继承），则用cs字体覆盖
-                    # 检查是否是直接设置的字体（通过重新解析当前样式的rFonts）
-                    direct_fonts = self._get_direct_fonts(style)
-                    if 'ascii' not in direct_fonts and 'hAnsi' not in direct_fonts:
-                        separation['ascii'] = cs_font
-                        separation['hAnsi'] = cs_font
-            
-            return separation if separation else None
+            separation = self._resolve_font_separation(resolver, resolved, set())
+            return dict(separation) if separation else None
             
         except Exception as e:
-            print(f"提取字体分离设置时出错: {e}")
+            logger.error(f"提取字体分离设置时出错: {e}")
             return None
     
+    def _resolve_font_separation(self, resolver, resolved, visiting):
+        """
+        计算样式的字体分离设置，每个样式只计算一次，子样式直接复用基础样式的结果
+        """
+        cache_key = resolved.style_id or id(resolved)
+        if cache_key in self._font_separation_cache:
+            return self._font_separation_cache[cache_key]
+        
+        # 样式自身的字体设置（直接设置优先，其次为解析后的主题字体）
+        separation = dict(resolved.own_fonts)
+        
+        # 如果当前样式没有设置某些字体，从基础样式继承
+        base = resolver.base_of(resolved)
+        if base is not None and cache_key not in visiting:
+            visiting.add(cache_key)
+            base_separation = self._resolve_font_separation(resolver, base, visiting)
+            if base_separation:
+                # 只继承当前样式没有设置的字体
+                for font_type in ['ascii', 'hAnsi', 'eastAsia', 'cs']:
+                    if font_type not in separation and font_type in base_separation:
+                        separation[font_type] = base_separation[font_type]
+        
+        # 如果仍然没有设置，且不是Normal样式，则检查是否需要使用文档默认字体
+        if resolved.name != 'Normal' and separation:
+            default_font = self.format_info['document_defaults'].get('default_font', '宋体')
+            
+            # 只对eastAsia字体使用默认字体
+            if 'eastAsia' not in separation:
+                separation['eastAsia'] = default_font
+        
+        # 处理cs字体作为英文字体的情况
+        # 当cs字体设置了常见英文字体时，将其作为英文字体（优先级高于继承的字体）
+        if separation and 'cs' in separation:
+            cs_font = separation['cs']
+            # 如果cs字体是常见的英文字体，则将其作为英文字体
+            common_english_fonts = ['Times New Roman', 'Arial', 'Calibri', 'Calibri Light', 'Verdana', 'Tahoma']
+            if cs_font in common_english_fonts:
+                # 如果ascii和hAnsi都未直接设置（即来自继承），则用cs字体覆盖
+                direct_fonts = resolved.direct_fonts
+                if 'ascii' not in direct_fonts and 'hAnsi' not in direct_fonts:
+                    separation['ascii'] = cs_font
+                    separation['hAnsi'] = cs_font
+        
+        self._font_separation_cache[cache_key] = separation
+        return separation
+    
     def _get_direct_fonts(self, style):
         """
         获取样式中直接设置的字体（不包括继承的字体）
         """
-        direct_fonts = {}
         try:
-            if hasattr(style, '_element'):
-                style_element = style._element
-                rpr = style_element.find(qn('w:rPr'))
-                if rpr is not None:
-                    rfonts = rpr.find(qn('w:rFonts'))
-                    if rfonts is not None:
-                        ascii_font = rfonts.get(qn('w:ascii'))
-                        if ascii_font:
-                            direct_fonts['ascii'] = ascii_font
-                        
-                        hAnsi_font = rfonts.get(qn('w:hAnsi'))
-                        if hAnsi_font:
-                            direct_fonts['hAnsi'] = hAnsi_font
-                        
-                        eastAsia_font = rfonts.get(qn('w:eastAsia'))
-                        if eastAsia_font:
-                            direct_fonts['eastAsia'] = eastAsia_font
-                        
-                        cs_font = rfonts.get(qn('w:cs'))
-                        if cs_font:
-                            direct_fonts['cs'] = cs_font
-            
-            return direct_fonts
+            resolved = self._get_resolver(style).resolve(style)
+            return dict(resolved.direct_fonts) if resolved is not None else {}
         except Exception as e:
-            print(f"获取直接字体设置时出错: {e}")
+            logger.error(f"获取直接字体设置时出错: {e}")
             return {}
     
     def _extract_paragraph_info(self, style):
@@ -482,7 +456,7 @@ class DynamicFormatExtractor:
             return paragraph_info
             
         except Exception as e:
-            print(f"提取段落格式信息时出错: {e}")
+            logger.error(f"提取段落格式信息时出错: {e}")
             return {}
     
     def _save_format_info(self, output_path=None):
@@ -500,10 +474,10 @@ class DynamicFormatExtractor:
             with open(output_path, 'w', encoding='utf-8') as f:
                 json.dump(self.format_info, f, ensure_ascii=False, indent=2)
             
-            print(f"格式信息已保存到: {output_path}")
+            logger.info(f"格式信息已保存到: {output_path}")
             
         except Exception as e:
-            print(f"保存格式信息时出错: {e}")
+            logger.error(f"保存格式信息时出错: {e}")
             
     def _extract_header_footer_formats(self, doc):
         """
@@ -519,30 +493,30 @@ class DynamicFormatExtractor:
                     header_distance_pt = section.header_distance.pt
                     self.format_info['section_settings'][section_id] = self.format_info['section_settings'].get(section_id, {})
                     self.format_info['section_settings'][section_id]['header_distance'] = f"{header_distance_pt}pt"
-                    print(f"提取页眉顶端距离: 第{i+1}节 - {header_distance_pt}pt")
+                    logger.debug(f"提取页眉顶端距离: 第{i+1}节 - {header_distance_pt}pt")
                 
                 if hasattr(section, 'footer_distance') and section.footer_distance:
                     footer_distance_pt = section.footer_distance.pt
                     self.format_info['section_settings'][section_id] = self.format_info['section_settings'].get(section_id, {})
                     self.format_info['section_settings'][section_id]['footer_distance'] = f"{footer_distance_pt}pt"
-                    print(f"提取页脚底端距离: 第{i+1}节 - {footer_distance_pt}pt")
+                    logger.debug(f"提取页脚底端距离: 第{i+1}节 - {footer_distance_pt}pt")
                 
                 # 提取页眉格式
                 if section.header.is_linked_to_previous == False:
                     header_info = self._extract_header_footer_content(section.header)
                     if header_info:
                         self.format_info['headers'][section_id] = header_info
-                        print(f"提取页眉格式: 第{i+1}节")
+                        logger.debug(f"提取页眉格式: 第{i+1}节")
                 
                 # 提取页脚格式
                 if section.footer.is_linked_to_previous == False:
                     footer_info = self._extract_header_footer_content(section.footer)
                     if footer_info:
                         self.format_info['footers'][section_id] = footer_info
-                        print(f"提取页脚格式: 第{i+1}节")
+                        logger.debug(f"提取页脚格式: 第{i+1}节")
                         
         except Exception as e:
-            print(f"提取页眉页脚格式时出错: {e}")
+            logger.error(f"提取页眉页脚格式时出错: {e}")
     
     def _extract_header_footer_content(self, header_footer):
         """
@@ -588,7 +562,7 @@ class DynamicFormatExtractor:
             return content_info
             
         except Exception as e:
-            print(f"提取页眉页脚内容时出错: {e}")
+            logger.error(f"提取页眉页脚内容时出错: {e}")
             return None
     
     def load_format_info(self, format_file=None):
@@ -602,31 +576,36 @@ class DynamicFormatExtractor:
             if os.path.exists(format_file):
                 with open(format_file, 'r', encoding='utf-8') as f:
                     self.format_info = json.load(f)
-                print(f"已加载格式信息: {format_file}")
+                logger.info(f"已加载格式信息: {format_file}")
                 return self.format_info
             else:
-                print(f"格式信息文件不存在: {format_file}")
+                logger.warning(f"格式信息文件不存在: {format_file}")
                 return None
                 
         except Exception as e:
-            print(f"加载格式信息时出错: {e}")
+            logger.error(f"加载格式信息时出错: {e}")
             return None
 
 def main():
     """
     主函数：提取格式模板的格式信息
     """
+    configure_logging()
+    
     # 验证必需文件
     missing_files = config.validate_required_files()
     if missing_files:
         print(f"错误：找不到以下必需文件: {', '.join(missing_files)}")
         return
     
-    extractor = DynamicFormatExtractor()
+    metrics = StageMetrics()
+    metrics.context = {'input': config.TEMPLATE_FILE, 'output': config.DYNAMIC_FORMAT_INFO}
+    extractor = DynamicFormatExtractor(metrics=metrics)
     
-    # 提取格式模板的格式信息
+    # 提取格式模板的格式信息（分阶段指标保存在格式信息文件旁边）
     format_info = extractor.extract_template_formats()
     if format_info:
+        print(f"分阶段指标已保存到: {metrics.save(metrics_path_for(config.DYNAMIC_FORMAT_INFO))}")
         print("\n=== 格式信息提取摘要 ===")
         print(f"提取时间: {format_info['extraction_time']}")
         print(f"模板文件: {format_info['template_file']}")
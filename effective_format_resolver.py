@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有效格式解析器
+功能：按 文档默认设置(docDefaults) → 段落样式链 → 段落直接格式 → 字符样式链 → run直接格式
+的顺序计算每个段落和每个run实际生效的段落属性和run属性，一次遍历整个文档
+样式链的解析结果按文档缓存；相同的属性集合只保存一份（驻留），
+样式和直接格式都相同的段落、run共用同一个只读结果对象
+"""
+
+import os
+import json
+import argparse
+from types import MappingProxyType
+from lxml import etree
+from docx import Document
+from docx.oxml.ns import qn, nsmap
+from docx.enum.style import WD_STYLE_TYPE
+from config import config
+from style_resolver import StyleResolver, read_rpr, read_ppr
+from style_index import style_type
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('effective_format_resolver')
+
+# 段落中直接包含run的容器（超链接、修订插入、智能标记、简单域、内容控件），只编译一次
+RUN_XPATH = etree.XPath('./w:r | ./w:hyperlink/w:r | ./w:ins/w:r | ./w:smartTag/w:r | ./w:fldSimple/w:r | '
+                        './w:sdt/w:sdtContent/w:r', namespaces={'w': nsmap['w']})
+
+W_P = qn('w:p')
+W_T = qn('w:t')
+W_PPR = qn('w:pPr')
+W_RPR = qn('w:rPr')
+W_PSTYLE = qn('w:pStyle')
+W_RSTYLE = qn('w:rStyle')
+W_VAL = qn('w:val')
+
+# 验证段落实际格式时比较的属性
+CHECKED_RUN_PROPERTIES = ('ascii', 'hAnsi', 'eastAsia', 'sz', 'b', 'i')
+CHECKED_PARAGRAPH_PROPERTIES = ('jc', 'line', 'lineRule', 'before', 'after', 'firstLine', 'left')
+
+EMPTY_PROPS = MappingProxyType({})
+
+def _element_key(element):
+    """
+    元素内容的键（子元素标签、属性和嵌套子元素），比序列化为XML快
+    """
+    return tuple((child.tag, tuple(child.attrib.items()), _element_key(child) if len(child) else ())
+                 for child in element)
+
+def _run_text(run_element):
+    return ''.join(t.text or '' for t in run_element.iter(W_T))
+
+class EffectiveFormatResolver:
+    def __init__(self, doc, style_resolver=None, theme_font_map=None):
+        """
+        doc为已加载的Document对象；style_resolver为该文档的样式继承解析器（未提供时新建）
+        """
+        self.doc = doc
+        self.style_resolver = style_resolver or StyleResolver(doc, theme_font_map=theme_font_map)
+        self.style_index = self.style_resolver.style_index
+        self.theme_font_map = self.style_resolver.theme_font_map
+        # 驻留表：属性集合 -> 只读属性字典
+        self._interned = {}
+        # 直接格式缓存：rPr/pPr的内容 -> 解析后的属性集合
+        self._direct_rpr = {}
+        self._direct_ppr = {}
+        # 组合缓存：(上一层结果, 样式, 直接格式) -> 有效属性
+        self._paragraph_cache = {}
+        self._run_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def intern(self, props):
+        """
+        返回与props内容相同的唯一只读属性字典
+        """
+        key = tuple(sorted(props.items()))
+        interned = self._interned.get(key)
+        if interned is None:
+            interned = MappingProxyType(dict(key))
+            self._interned[key] = interned
+        return interned
+    
+    def _direct(self, element, cache, reader):
+        if element is None:
+            return EMPTY_PROPS
+        key = _element_key(element)
+        props = cache.get(key)
+        if props is None:
+            props = self.intern(reader(element))
+            cache[key] = props
+        return props
+    
+    def _paragraph_style(self, ppr_element):
+        """
+        段落样式的解析结果：未引用样式或引用无效时使用默认段落样式
+        """
+        style_id = None
+        if ppr_element is not None:
+            p_style = ppr_element.find(W_PSTYLE)
+            if p_style is not None:
+                style_id = p_style.get(W_VAL)
+        style_element = self.style_index.by_id.get(style_id) if style_id else None
+        if style_element is None or style_type(style_element) != WD_STYLE_TYPE.PARAGRAPH:
+            style_element = self.style_index.defaults.get(WD_STYLE_TYPE.PARAGRAPH)
+        if style_element is None:
+            return None
+        return self.style_resolver.resolve(style_element)
+    
+    def paragraph_format(self, p_element):
+        """
+        段落的有效格式，返回(段落样式解析结果, 有效段落属性, 段落级run属性)
+        段落级run属性为 文档默认设置 → 段落样式链，是段落内run的起点
+        """
+        if hasattr(p_element, '_p'):
+            p_element = p_element._p
+        
+        ppr_element = p_element.find(W_PPR)
+        style = self._paragraph_style(ppr_element)
+        direct_ppr = self._direct(ppr_element, self._direct_ppr, read_ppr)
+        key = (style.style_id if style is not None else None, id(direct_ppr))
+        cached = self._paragraph_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        
+        self.cache_misses += 1
+        if style is not None:
+            ppr = dict(style.ppr)
+            rpr = style.rpr
+        else:
+            default_rpr, default_ppr = self.style_resolver.doc_defaults()
+            ppr = dict(default_ppr)
+            rpr = default_rpr
+        ppr.update(direct_ppr)
+        
+        cached = (style, self.intern(ppr), self.intern(rpr))
+        self._paragraph_cache[key] = cached
+        return cached
+    
+    def run_format(self, paragraph_rpr, r_element):
+        """
+        run的有效属性：段落级run属性 → 字符样式链 → run直接格式
+        """
+        if hasattr(r_element, '_r'):
+            r_element = r_element._r
+        
+        rpr_element = r_element.find(W_RPR)
+        char_style_id = None
+        if rpr_element is not None:
+            r_style = rpr_element.find(W_RSTYLE)
+            if r_style is not None:
+                char_style_id = r_style.get(W_VAL)
+        direct_rpr = self._direct(rpr_element, self._direct_rpr, self._read_run_rpr)
+        
+        key = (id(paragraph_rpr), char_style_id, id(direct_rpr))
+        cached = self._run_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        
+        self.cache_misses += 1
+        rpr = dict(paragraph_rpr)
+        if char_style_id:
+            char_style = self.style_resolver.resolve(char_style_id)
+            if char_style is not None and char_style.type == WD_STYLE_TYPE.CHARACTER:
+                rpr.update(char_style.chain_rpr)
+        rpr.update(direct_rpr)
+        
+        cached = self.intern(rpr)
+        self._run_cache[key] = cached
+        return cached
+    
+    def _read_run_rpr(self, rpr_element):
+        return read_rpr(rpr_element, self.theme_font_map)
+    
+    def iter_paragraphs(self):
+        """
+        按文档顺序遍历正文中的所有段落（包括表格中的段落）
+        """
+        return self.doc.element.body.iter(W_P)
+    
+    def iter_runs(self, p_element):
+        return RUN_XPATH(p_element)
+    
+    def resolve_document(self):
+        """
+        一次遍历计算所有段落和run的有效格式
+        返回列表：每个段落为 (段落元素, 段落样式解析结果, 有效段落属性, [(run元素, 有效run属性), ...])
+        """
+        resolved = []
+        for p_element in self.iter_paragraphs():
+            style, ppr, paragraph_rpr = self.paragraph_format(p_element)
+            runs = [(r_element, self.run_format(paragraph_rpr, r_element)) for r_element in self.iter_runs(p_element)]
+            resolved.append((p_element, style, ppr, runs))
+        return resolved
+    
+    def stats(self):
+        """
+        缓存和驻留统计
+        """
+        return {
+            'interned_property_sets': len(self._interned),
+            'distinct_direct_rpr': len(self._direct_rpr),
+            'distinct_direct_ppr': len(self._direct_ppr),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses
+        }
+    
+    def check_paragraphs(self, max_details=None):
+        """
+        检查每个段落实际生效的格式是否与其段落样式一致：
+        段落直接格式或run直接格式覆盖了样式中设置的属性时记为偏离
+        返回检查结果（偏离明细最多max_details条）
+        """
+        if max_details is None:
+            max_details = config.PARAGRAPH_CHECK_MAX_DETAILS
+        
+        checked = 0
+        deviating = 0
+        property_counts = {}
+        details = []
+        
+        for index, (p_element, style, ppr, runs) in enumerate(self.resolve_document()):
+            texts = [_run_text(r_element) for r_element, _ in runs]
+            text_runs = [(text, rpr) for text, (_, rpr) in zip(texts, runs) if text.strip()]
+            if not text_runs or style is None:
+                continue
+            checked += 1
+            
+            deviations = []
+            for prop in CHECKED_PARAGRAPH_PROPERTIES:
+                expected = style.ppr.get(prop)
+                if expected is not None and ppr.get(prop) != expected:
+                    deviations.append({'property': prop, 'expected': expected, 'actual': ppr.get(prop)})
+            
+            # 同一个有效属性对象只比较一次
+            seen = set()
+            for text, rpr in text_runs:
+                if id(rpr) in seen:
+                    continue
+                seen.add(id(rpr))
+                for prop in CHECKED_RUN_PROPERTIES:
+                    expected = style.rpr.get(prop)
+                    if expected is not None and rpr.get(prop) != expected:
+                        deviations.append({'property': prop, 'expected': expected, 'actual': rpr.get(prop),
+                                           'run_text': text[:30]})
+            
+            if deviations:
+                deviating += 1
+                for deviation in deviations:
+                    property_counts[deviation['property']] = property_counts.get(deviation['property'], 0) + 1
+                if len(details) < max_details:
+                    text = ''.join(texts)
+                    details.append({
+                        'paragraph_index': index + 1,
+                        'style_name': style.name,
+                        'text_preview': text[:50] + '...' if len(text) > 50 else text,
+                        'deviations': deviations
+                    })
+        
+        return {
+            'paragraphs_checked': checked,
+            'deviating_paragraphs': deviating,
+            'property_counts': property_counts,
+            'details': details,
+            'resolver': self.stats()
+        }
+
+def main():
+    """
+    主函数：输出文档每个段落和run实际生效的格式
+    """
+    parser = argparse.ArgumentParser(description="计算文档中每个段落和run实际生效的格式")
+    parser.add_argument('document', nargs='?', default=config.TEST_DOCUMENT, help="要分析的文档")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "effective_formats.json"),
+                        help="结果文件")
+    parser.add_argument('--check', action='store_true', help="只输出与段落样式不一致的段落")
+    args = parser.parse_args()
+    configure_logging()
+    
+    if not os.path.exists(args.document):
+        print(f"错误：找不到文档 {args.document}")
+        return
+    
+    resolver = EffectiveFormatResolver(Document(args.document))
+    if args.check:
+        result = resolver.check_paragraphs()
+        logger.info(f"检查段落 {result['paragraphs_checked']} 个，与样式不一致 {result['deviating_paragraphs']} 个")
+    else:
+        paragraphs = []
+        for index, (p_element, style, ppr, runs) in enumerate(resolver.resolve_document()):
+            paragraphs.append({
+                'paragraph_index': index + 1,
+                'style_name': style.name if style is not None else None,
+                'paragraph_format': dict(ppr),
+                'runs': [{'text': _run_text(r_element), 'format': dict(rpr)} for r_element, rpr in runs]
+            })
+        result = {'paragraphs': paragraphs, 'resolver': resolver.stats()}
+        logger.info(f"已解析 {len(paragraphs)} 个段落，不同的属性集合 {result['resolver']['interned_property_sets']} 个")
+    
+    config.ensure_output_dir()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logger.info(f"结果已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分级结构化日志
+功能：替代各组件中逐条print的输出。逐段落、逐样式、逐节的明细为DEBUG级别（默认不输出），
+每个阶段结束时输出一条INFO级别的汇总事件；每条日志带文档标识、阶段和计数等结构化字段，
+可输出为便于阅读的文本或每行一个JSON对象（供日志收集器使用）
+"""
+
+import sys
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# 所有组件日志的根记录器名称
+LOGGER_NAME = 'word_format'
+
+# 当前上下文的结构化字段（文档标识、阶段等），线程和协程之间互不影响
+_log_context = contextvars.ContextVar('format_log_context', default={})
+
+@contextmanager
+def log_context(**fields):
+    """
+    在with语句范围内为所有日志附加结构化字段，例如 log_context(doc_id='论文.docx')
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+class ContextFilter(logging.Filter):
+    """
+    将上下文字段与单条日志的字段合并到record.fields
+    """
+    def filter(self, record):
+        fields = dict(_log_context.get())
+        fields.update(getattr(record, 'fields', None) or {})
+        record.fields = fields
+        return True
+
+class FormatLogger(logging.LoggerAdapter):
+    """
+    支持结构化字段的日志记录器：logger.info(消息, fields={...})
+    """
+    def process(self, msg, kwargs):
+        fields = dict(self.extra)
+        fields.update(kwargs.pop('fields', None) or {})
+        kwargs['extra'] = {'fields': fields}
+        return msg, kwargs
+    
+    def summary(self, stage, msg, **counts):
+        """
+        输出阶段汇总事件（INFO级别）
+        """
+        self.info(msg, fields={'event': 'stage_summary', 'stage': stage, 'counts': counts})
+
+class TextFormatter(logging.Formatter):
+    """
+    文本格式：默认只输出消息（与原来的控制台输出一致），show_fields时附加结构化字段
+    """
+    def __init__(self, show_fields=False):
+        super().__init__()
+        self.show_fields = show_fields
+    
+    def format(self, record):
+        message = record.getMessage()
+        fields = getattr(record, 'fields', None)
+        if self.show_fields and fields:
+            message += ' [' + ', '.join(f"{key}={value}" for key, value in fields.items()) + ']'
+        if record.exc_info:
+            message += '\n' + self.formatException(record.exc_info)
+        return message
+
+class JsonFormatter(logging.Formatter):
+    """
+    JSON格式：每条日志一行JSON，包含时间、级别、记录器、消息和全部结构化字段
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage().strip()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def get_logger(name, **fields):
+    """
+    获取组件的日志记录器，fields为该记录器所有日志固定附加的字段
+    """
+    return FormatLogger(logging.getLogger(f"{LOGGER_NAME}.{name}"), fields)
+
+def configure_logging(level='INFO', json_format=False, stream=None, show_fields=False):
+    """
+    配置组件日志的输出级别和格式（重复调用时替换之前的配置）
+    未配置时只有WARNING及以上级别通过Python默认处理输出
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JsonFormatter() if json_format else TextFormatter(show_fields))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
+
+def add_logging_arguments(parser):
+    """
+    为命令行工具添加日志相关参数
+    """
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="日志级别（DEBUG输出逐段落、逐样式的明细）")
+    parser.add_argument('--log-json', action='store_true', help="以每行一个JSON对象的格式输出日志")
+    return parser
+
+def configure_logging_from_args(args):
+    """
+    按add_logging_arguments添加的命令行参数配置日志
+    """
+    return configure_logging(args.log_level, json_format=args.log_json)
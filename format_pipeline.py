@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+格式化流水线
+功能：在同一个内存中的Document对象上依次执行 清理run格式 → 应用模板格式 → 验证格式
+每个输入文档只解析一次，格式模板只加载一次，结果只保存一次，不再生成中间文件
+也可以直接在内存中处理bytes（process_bytes），不读写任何文件
+"""
+
+import io
+import os
+import json
+import argparse
+from docx import Document
+from config import config
+from run_format_cleaner import RunFormatCleaner
+from run_coalescer import RunCoalescer
+from xml_slimmer import XmlSlimmer
+from dynamic_format_applier import DynamicFormatApplier
+from format_validator import FormatValidator
+from docx_passthrough_writer import PassthroughWriter, read_source_bytes, copy_source_document
+from stage_metrics import StageMetrics, metrics_path_for
+from format_logging import get_logger, log_context, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('format_pipeline')
+
+class FormatPipeline:
+    def __init__(self, format_info_path=None, template_path=None, profile_cache=None, metrics=None,
+                 coalesce_runs=None, slim_xml=None, used_styles_only=None):
+        # 各组件共用同一个指标记录器；启用时每个文档的指标保存在输出文档旁边
+        self.metrics = metrics or StageMetrics(enabled=False)
+        # 加载前流式删除修订标识、校对标记等不影响排版的XML（未指定时按配置）
+        if slim_xml is None:
+            slim_xml = config.SLIM_XML
+        self.slimmer = XmlSlimmer(self.metrics) if slim_xml else None
+        self.cleaner = RunFormatCleaner(self.metrics)
+        # 清理后合并格式相同的相邻run（未指定时按配置）
+        if coalesce_runs is None:
+            coalesce_runs = config.COALESCE_RUNS
+        self.coalescer = RunCoalescer(self.metrics) if coalesce_runs else None
+        self.applier = DynamicFormatApplier(format_info_path, self.metrics, used_styles_only=used_styles_only)
+        self.format_info_path = format_info_path
+        self.profile_cache = profile_cache
+        self.validator = FormatValidator(self.metrics)
+        self.metrics_path = None
+        # 最近一次处理失败的原因（供服务等调用方返回给客户端，日志中另有完整记录）
+        self.last_error = None
+        self.template_path = template_path
+        self.template_doc = None
+        self.template_styles = None
+    
+    def load(self):
+        """
+        加载格式信息和格式模板（每个流水线实例只加载一次，可处理多个文档）
+        只指定模板时通过模板格式缓存获取格式信息；指定了格式信息文件时直接加载该文件
+        """
+        if self.template_path and not self.format_info_path:
+            if not self.applier.load_profile_for_template(self.template_path, self.profile_cache):
+                return False
+        else:
+            if not self.applier.load_format_info():
+                return False
+            
+            if self.template_path:
+                self.applier.format_info['template_file'] = self.template_path
+        
+        self.template_doc = self.applier.load_template_document()
+        if self.template_doc is not None:
+            # 模板样式只分析一次，供所有文档的验证复用
+            self.template_styles = self.validator.analyze_document_styles(self.template_doc)
+        
+        return True
+    
+    def process_document(self, input_path, output_path, report_path=None, validate=True):
+        """
+        处理单个文档：加载一次，依次清理、应用、验证，最后保存一次
+        返回验证报告（validate=False时返回空字典），失败时返回None，失败原因记录在last_error中
+        """
+        self.last_error = None
+        if self.applier.format_info is None and not self.load():
+            logger.error("错误：无法加载格式信息")
+            self.last_error = '无法加载格式信息'
+            return None
+        
+        self.metrics.reset()
+        self.metrics.context = {'input': input_path, 'output': output_path}
+        self.metrics_path = None
+        
+        # 该文档的所有日志都带上文档标识
+        with log_context(doc_id=os.path.basename(input_path)):
+            try:
+                logger.info(f"=== 流水线处理文档: {input_path} ===")
+                
+                # 1. 加载文档（唯一一次解析；启用XML精简时先在内存中精简，保存时以精简后的docx为直通复制的来源）
+                source = input_path
+                if self.slimmer is not None:
+                    source = self.slimmer.slim_bytes(input_path)
+                
+                with self.metrics.stage('load') as counts:
+                    doc = Document(io.BytesIO(source) if isinstance(source, bytes) else source)
+                    counts['paragraphs'] = len(doc.paragraphs)
+                
+                # 2-5. 清理、应用、保存、验证
+                report = self._format_loaded(doc, source, output_path, report_path, validate, output_path)
+                if report is None:
+                    self.last_error = '应用格式失败'
+                    return None
+                logger.info(f"格式化后的文档已保存到: {output_path}")
+                
+                # 6. 保存分阶段指标
+                if self.metrics.enabled:
+                    self.metrics_path = self.metrics.save(metrics_path_for(output_path))
+                    self.metrics.print_summary()
+                
+                return report
+            
+            except Exception as e:
+                logger.error(f"流水线处理文档 {input_path} 时出错: {e}")
+                self.last_error = f"流水线处理文档时出错: {e}"
+                return None
+    
+    def process_bytes(self, data, validate=True, doc_id=None):
+        """
+        在内存中处理单个文档：data为.docx的bytes或文件对象，不读写任何文件
+        返回(格式化后文档的bytes, 验证报告)，验证报告不写入文件；失败时返回(None, None)，失败原因记录在last_error中
+        """
+        self.last_error = None
+        if self.applier.format_info is None and not self.load():
+            logger.error("错误：无法加载格式信息")
+            self.last_error = '无法加载格式信息'
+            return None, None
+        
+        self.metrics.reset()
+        self.metrics.context = {'input': doc_id or '内存中的文档'}
+        self.metrics_path = None
+        
+        with log_context(doc_id=doc_id or '内存中的文档'):
+            try:
+                source = read_source_bytes(data)
+                if self.slimmer is not None:
+                    source = self.slimmer.slim_bytes(source)
+                
+                with self.metrics.stage('load', input_bytes=len(source)) as counts:
+                    doc = Document(io.BytesIO(source))
+                    counts['paragraphs'] = len(doc.paragraphs)
+                
+                buffer = io.BytesIO()
+                report = self._format_loaded(doc, source, buffer, False, validate, doc_id)
+                if report is None:
+                    self.last_error = '应用格式失败'
+                    return None, None
+                return buffer.getvalue(), report
+            
+            except Exception as e:
+                logger.error(f"流水线处理内存文档时出错: {e}")
+                self.last_error = f"流水线处理内存文档时出错: {e}"
+                return None, None
+    
+    def plan_document(self, input_path, doc_id=None):
+        """
+        计划模式：加载文档后执行与process_document相同的清理、合并和应用，只返回修改记录，
+        不保存也不验证（XML精简不影响排版，计划时不执行）；失败时返回None
+        """
+        if self.applier.format_info is None and not self.load():
+            logger.error("错误：无法加载格式信息")
+            return None
+        
+        doc_id = doc_id or os.path.basename(input_path)
+        self.metrics.reset()
+        self.metrics.context = {'input': input_path, 'plan': True}
+        
+        with log_context(doc_id=doc_id):
+            try:
+                with self.metrics.stage('load') as counts:
+                    doc = Document(input_path)
+                    counts['paragraphs'] = len(doc.paragraphs)
+                
+                self.cleaner.clean_document(doc)
+                if self.coalescer is not None:
+                    self.coalescer.coalesce_document(doc)
+                
+                record = self.applier.plan_formats(doc, self.template_doc, doc_id)
+                if record is None:
+                    return None
+                
+                record['cleaned_runs'] = self.cleaner.cleaned_runs
+                record['total_runs'] = self.cleaner.total_runs
+                if self.coalescer is not None:
+                    record['merged_runs'] = self.coalescer.runs_before - self.coalescer.runs_after
+                # 与实际处理时判断是否直接复制原始docx的条件一致
+                record['changed'] = not self._document_unchanged()
+                return record
+            
+            except Exception as e:
+                logger.error(f"计划文档 {input_path} 的格式修改时出错: {e}")
+                return None
+    
+    def _document_unchanged(self):
+        """
+        清理、合并和应用是否都没有修改当前文档（计划模式与实际保存共用的判断）
+        """
+        return self.cleaner.cleaned_runs == 0 and self.applier.total_changes == 0 \
+            and (self.coalescer is None or self.coalescer.runs_before == self.coalescer.runs_after)
+    
+    def _format_loaded(self, doc, source, target, report_path, validate, formatted_label):
+        """
+        对已加载的文档依次清理、应用、保存、验证
+        source为原始docx（路径或bytes，供直通复制未修改的成员），target为输出路径或文件对象
+        """
+        # 清理run级别格式
+        self.cleaner.clean_document(doc)
+        
+        # 合并清理后格式相同的相邻run，减少后续步骤需要遍历的run
+        if self.coalescer is not None:
+            self.coalescer.coalesce_document(doc)
+        
+        # 应用模板格式
+        if not self.applier.apply_formats(doc, self.template_doc):
+            return None
+        
+        # 保存结果（唯一一次写入，只重新序列化XML部件，图片等成员直通复制）
+        # 清理、合并和应用都没有修改任何内容时直接复制原始docx，不重新序列化
+        with self.metrics.stage('save') as counts:
+            if self._document_unchanged():
+                logger.info("文档已符合格式模板，未修改任何内容")
+                write_stats = copy_source_document(source, target)
+            else:
+                write_stats = PassthroughWriter(source).save(doc, target)
+            counts.update(write_stats)
+        
+        # 在同一个内存文档上验证
+        if not validate or self.template_doc is None:
+            return {}
+        
+        # 只应用了文档使用的样式时，只验证这些样式
+        template_styles = self.template_styles
+        if self.applier.style_scope is not None:
+            template_styles = {name: style for name, style in template_styles.items() if name in self.applier.style_scope}
+        
+        return self.validator.generate_validation_report(
+            self.template_doc, doc, report_path,
+            template_styles=template_styles,
+            template_label=self.applier.format_info.get('template_file'),
+            formatted_label=formatted_label
+        )
+
+def write_plan_records(records, plan_path):
+    """
+    将计划记录逐行写入JSONL（失败的文档记录为含error的行），返回汇总统计
+    """
+    directory = os.path.dirname(os.fspath(plan_path))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    
+    failed = sum(1 for record in records if 'error' in record)
+    changed = sum(1 for record in records if record.get('changed'))
+    return {
+        'documents': len(records),
+        'changed': changed,
+        'unchanged': len(records) - changed - failed,
+        'failed': failed
+    }
+
+def main():
+    """
+    主函数：对测试文档执行完整的格式化流水线
+    """
+    parser = argparse.ArgumentParser(description="清理 → 应用 → 验证 单次加载格式化流水线")
+    parser.add_argument('input', nargs='?', default=config.TEST_DOCUMENT, help="待格式化的文档")
+    parser.add_argument('-o', '--output', default=config.get_fixed_formatted_doc_path(), help="格式化后的文档路径")
+    parser.add_argument('--format-info', default=None, help="格式信息文件（只指定模板时使用模板格式缓存）")
+    parser.add_argument('--template', default=None, help="格式模板文档（默认使用格式信息中记录的模板）")
+    parser.add_argument('--report', default=config.VALIDATION_REPORT, help="验证报告路径")
+    parser.add_argument('--no-validate', action='store_true', help="跳过格式验证")
+    parser.add_argument('--coalesce-runs', action='store_true', default=None,
+                        help="清理后合并格式相同的相邻run")
+    parser.add_argument('--slim-xml', action='store_true', default=None,
+                        help="加载前删除修订标识、校对标记等不影响排版的XML")
+    parser.add_argument('--used-styles-only', action='store_true', default=None,
+                        help="只应用文档实际使用的样式（及其基础样式链）")
+    parser.add_argument('--no-metrics', action='store_true', help="不记录分阶段指标")
+    parser.add_argument('--trace-memory', action='store_true', help="用tracemalloc记录各阶段峰值内存（处理会变慢）")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    if args.format_info is None and args.template is None:
+        args.format_info = config.DYNAMIC_FORMAT_INFO
+    
+    if args.format_info and not os.path.exists(args.format_info):
+        print(f"错误：找不到格式信息文件 {args.format_info}")
+        print("请先运行 dynamic_format_extractor.py 提取格式信息")
+        return
+    
+    if not os.path.exists(args.input):
+        print(f"错误：找不到待格式化的文档 {args.input}")
+        return
+    
+    metrics = StageMetrics(enabled=not args.no_metrics, trace_memory=args.trace_memory)
+    pipeline = FormatPipeline(args.format_info, args.template, metrics=metrics,
+                              coalesce_runs=args.coalesce_runs, slim_xml=args.slim_xml,
+                              used_styles_only=args.used_styles_only)
+    report = pipeline.process_document(args.input, args.output, args.report, validate=not args.no_validate)
+    metrics.close()
+    
+    if report is None:
+        print("\n流水线处理失败！")
+    else:
+        if pipeline.metrics_path:
+            print(f"分阶段指标已保存到: {pipeline.metrics_path}")
+        print("\n流水线处理完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带类型的格式信息
+功能：把提取器生成的格式信息（字号为'10.5pt'字符串、行距为str(float)、对齐方式为中文名称）
+只在加载时解析一次，转换为整数单位的只读模型：字号为半磅，间距、缩进和页眉页脚距离为缇(twip)，
+对齐方式为WD_ALIGN_PARAGRAPH枚举；同时为每个样式预先生成应用计划（要设置的属性和python-docx取值），
+应用格式时直接赋值，不再逐项解析字符串，也没有浮点往返误差
+紧凑格式（to_dict）带schema_version，加载时校验版本
+"""
+
+import os
+import json
+import argparse
+from docx.shared import Pt, Twips, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from config import config
+from dynamic_format_extractor import EXTRACTOR_VERSION
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('format_profile')
+
+# 紧凑格式的版本，结构变化时递增
+PROFILE_SCHEMA_VERSION = 1
+
+# 提取器格式信息中的对齐方式名称
+ALIGNMENT_LABELS = {
+    '左对齐': WD_ALIGN_PARAGRAPH.LEFT,
+    '居中': WD_ALIGN_PARAGRAPH.CENTER,
+    '右对齐': WD_ALIGN_PARAGRAPH.RIGHT,
+    '两端对齐': WD_ALIGN_PARAGRAPH.JUSTIFY,
+    '分散对齐': WD_ALIGN_PARAGRAPH.DISTRIBUTE
+}
+
+# 紧凑格式中的对齐方式（与w:jc的取值相同）
+ALIGNMENT_VALUES = {
+    'left': WD_ALIGN_PARAGRAPH.LEFT,
+    'center': WD_ALIGN_PARAGRAPH.CENTER,
+    'right': WD_ALIGN_PARAGRAPH.RIGHT,
+    'both': WD_ALIGN_PARAGRAPH.JUSTIFY,
+    'distribute': WD_ALIGN_PARAGRAPH.DISTRIBUTE
+}
+ALIGNMENT_NAMES = {alignment: value for value, alignment in ALIGNMENT_VALUES.items()}
+
+# 提取器格式信息中表示“清除字体名称，继承默认字体”的取值
+INHERIT_FONT_NAME = '继承默认字体'
+
+# 字体分离中表示未设置的取值
+UNSET_FONT = '未设置'
+
+# 字体分离：(格式信息中的键, rFonts属性)
+FONT_SEPARATION_KEYS = (('ascii', qn('w:ascii')), ('hAnsi', qn('w:hAnsi')),
+                        ('eastAsia', qn('w:eastAsia')), ('cs', qn('w:cs')))
+FONT_SEPARATION_ATTRIBUTES = dict(FONT_SEPARATION_KEYS)
+
+# 段落间距和缩进字段（单位为缇），未设置时应用时清除
+TWIPS_FIELDS = ('space_before', 'space_after', 'first_line_indent', 'left_indent', 'right_indent')
+
+# 未设置页眉/页脚距离时使用的默认值（15磅）
+DEFAULT_HEADER_FOOTER_DISTANCE = 300
+
+class ProfileSchemaError(ValueError):
+    """
+    格式信息不符合结构或版本不受支持
+    """
+
+def _points(value, field):
+    """
+    解析'10.5pt'形式（或数值）的磅值
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip()
+    if text.endswith('pt'):
+        text = text[:-2]
+    try:
+        return float(text)
+    except ValueError:
+        raise ProfileSchemaError(f"{field} 的取值无效: {value!r}")
+
+def _half_points(value, field):
+    return round(_points(value, field) * 2)
+
+def _twips(value, field):
+    return round(_points(value, field) * 20)
+
+def _integer(value, field):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ProfileSchemaError(f"{field} 应为整数: {value!r}")
+    return value
+
+def _optional_integer(value, field):
+    return None if value is None else _integer(value, field)
+
+class LineSpacing:
+    """
+    行距：rule为multiple时value为行数的240分之一（与w:line相同，240为单倍行距），
+    rule为exact时value为固定行高（缇）
+    """
+    __slots__ = ('rule', 'value')
+    
+    RULES = ('multiple', 'exact')
+    
+    def __init__(self, rule, value):
+        if rule not in self.RULES:
+            raise ProfileSchemaError(f"不支持的行距规则: {rule!r}")
+        self.rule = rule
+        self.value = _integer(value, 'line_spacing')
+    
+    @classmethod
+    def parse(cls, value):
+        """
+        解析提取器保存的行距：str(float)为倍数，str(int)为python-docx Length（EMU）表示的固定行高
+        """
+        text = str(value).strip()
+        try:
+            if text.lstrip('-').isdigit():
+                return cls('exact', round(int(text) / 635))
+            return cls('multiple', round(float(text) * 240))
+        except ValueError:
+            raise ProfileSchemaError(f"line_spacing 的取值无效: {value!r}")
+    
+    def docx_value(self):
+        """
+        赋给ParagraphFormat.line_spacing的值
+        """
+        if self.rule == 'multiple':
+            return self.value / 240
+        return Twips(self.value)
+    
+    def to_dict(self):
+        return {'rule': self.rule, 'value': self.value}
+    
+    def __eq__(self, other):
+        return isinstance(other, LineSpacing) and (self.rule, self.value) == (other.rule, other.value)
+    
+    def __hash__(self):
+        return hash((self.rule, self.value))
+
+class StyleProfile:
+    """
+    单个样式的格式（整数单位），未设置的字段为None
+    font_name为None且inherit_font_name为真时，应用时清除字体名称以继承默认字体
+    font_separation为 rFonts属性 -> 字体名称（None表示清除该属性），整个为None时不处理字体分离
+    """
+    __slots__ = ('name', 'style_type', 'font_name', 'inherit_font_name', 'font_size', 'bold', 'italic', 'color',
+                 'font_separation', 'alignment', 'line_spacing') + TWIPS_FIELDS
+    
+    def __init__(self, name, style_type='paragraph', font_name=None, inherit_font_name=False, font_size=None,
+                 bold=None, italic=None, color=None, font_separation=None, alignment=None, line_spacing=None,
+                 **twips):
+        self.name = name
+        self.style_type = style_type
+        self.font_name = font_name
+        self.inherit_font_name = inherit_font_name
+        self.font_size = _optional_integer(font_size, 'font_size')
+        self.bold = bold
+        self.italic = italic
+        self.color = color
+        self.font_separation = font_separation
+        self.alignment = alignment
+        self.line_spacing = line_spacing
+        for field in TWIPS_FIELDS:
+            setattr(self, field, _optional_integer(twips.pop(field, None), field))
+        if twips:
+            raise ProfileSchemaError(f"样式 {name} 包含未知字段: {', '.join(sorted(twips))}")
+    
+    @classmethod
+    def from_format_info(cls, name, style_info):
+        """
+        由提取器格式信息中的一个样式解析（字符串单位 -> 整数单位）
+        """
+        font_name = style_info.get('font_name')
+        inherit_font_name = font_name == INHERIT_FONT_NAME
+        if inherit_font_name:
+            font_name = None
+        
+        color = style_info.get('color')
+        if color is not None:
+            try:
+                RGBColor.from_string(color)
+            except ValueError:
+                logger.warning(f"警告：无法解析样式 {name} 的颜色格式: {color}")
+                color = None
+        
+        font_separation = None
+        if 'font_separation' in style_info:
+            separation = style_info['font_separation']
+            font_separation = {attribute: separation[key]
+                               for key, attribute in FONT_SEPARATION_KEYS
+                               if separation.get(key) and separation[key] != UNSET_FONT}
+        
+        alignment = None
+        if 'alignment' in style_info:
+            alignment = ALIGNMENT_LABELS.get(style_info['alignment'])
+            if alignment is None:
+                logger.warning(f"警告：样式 {name} 的对齐方式无法识别: {style_info['alignment']}")
+        
+        line_spacing = None
+        if style_info.get('line_spacing') is not None:
+            line_spacing = LineSpacing.parse(style_info['line_spacing'])
+        
+        twips = {field: _twips(style_info[field], field) for field in TWIPS_FIELDS if field in style_info}
+        
+        return cls(
+            name,
+            style_type=style_info.get('type', 'paragraph'),
+            font_name=font_name,
+            inherit_font_name=inherit_font_name,
+            font_size=_half_points(style_info['font_size'], 'font_size') if 'font_size' in style_info else None,
+            bold=style_info.get('bold'),
+            italic=style_info.get('italic'),
+            color=color,
+            font_separation=font_separation,
+            alignment=alignment,
+            line_spacing=line_spacing,
+            **twips
+        )
+    
+    @classmethod
+    def from_dict(cls, name, data):
+        """
+        由紧凑格式解析
+        """
+        data = dict(data)
+        alignment = data.pop('alignment', None)
+        if alignment is not None:
+            if alignment not in ALIGNMENT_VALUES:
+                raise ProfileSchemaError(f"样式 {name} 的对齐方式无效: {alignment!r}")
+            alignment = ALIGNMENT_VALUES[alignment]
+        line_spacing = data.pop('line_spacing', None)
+        if line_spacing is not None:
+            line_spacing = LineSpacing(line_spacing.get('rule'), line_spacing.get('value'))
+        font_separation = data.pop('font_separation', None)
+        if font_separation is not None:
+            try:
+                font_separation = {FONT_SEPARATION_ATTRIBUTES[key]: value for key, value in font_separation.items()}
+            except KeyError as e:
+                raise ProfileSchemaError(f"样式 {name} 的字体分离包含未知字体类型: {e}")
+        return cls(name, alignment=alignment, line_spacing=line_spacing, font_separation=font_separation, **data)
+    
+    def to_dict(self):
+        """
+        紧凑格式：只包含已设置的字段，单位为半磅和缇，对齐方式为w:jc的取值
+        """
+        data = {'style_type': self.style_type}
+        for field in ('font_name', 'font_size', 'bold', 'italic', 'color') + TWIPS_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.inherit_font_name:
+            data['inherit_font_name'] = True
+        if self.font_separation is not None:
+            data['font_separation'] = {key: self.font_separation[attribute]
+                                       for key, attribute in FONT_SEPARATION_KEYS if attribute in self.font_separation}
+        if self.alignment is not None:
+            data['alignment'] = ALIGNMENT_NAMES[self.alignment]
+        if self.line_spacing is not None:
+            data['line_spacing'] = self.line_spacing.to_dict()
+        return data
+
+class StyleApplyPlan:
+    """
+    预先生成的样式应用计划：应用时按顺序赋值，不再解析格式信息
+    font_ops/paragraph_ops为 (属性名, python-docx取值) 的元组
+    """
+    __slots__ = ('style_name', 'font_ops', 'color', 'paragraph_ops', 'font_separation')
+    
+    def __init__(self, style):
+        self.style_name = style.name
+        
+        font_ops = []
+        if style.font_name is not None:
+            font_ops.append(('name', style.font_name))
+        elif style.inherit_font_name:
+            font_ops.append(('name', None))
+        if style.font_size is not None:
+            font_ops.append(('size', Pt(style.font_size / 2)))
+        if style.bold is not None:
+            font_ops.append(('bold', style.bold))
+        if style.italic is not None:
+            font_ops.append(('italic', style.italic))
+        self.font_ops = tuple(font_ops)
+        self.color = RGBColor.from_string(style.color) if style.color else None
+        
+        # 段落格式完整覆盖：未设置的属性清除，使用默认值
+        paragraph_ops = [
+            ('alignment', style.alignment),
+            ('line_spacing', style.line_spacing.docx_value() if style.line_spacing is not None else None)
+        ]
+        for field in TWIPS_FIELDS:
+            value = getattr(style, field)
+            paragraph_ops.append((field, Twips(value) if value is not None else None))
+        self.paragraph_ops = tuple(paragraph_ops)
+        
+        # rFonts属性 -> 字体名称（None表示清除），按格式信息中的顺序
+        if style.font_separation is None:
+            self.font_separation = None
+        else:
+            self.font_separation = tuple((attribute, style.font_separation.get(attribute))
+                                         for _, attribute in FONT_SEPARATION_KEYS)
+
+class SectionProfile:
+    """
+    节设置：页眉顶端距离和页脚底端距离（缇），未设置时为None
+    """
+    __slots__ = ('header_distance', 'footer_distance')
+    
+    def __init__(self, header_distance=None, footer_distance=None):
+        self.header_distance = _optional_integer(header_distance, 'header_distance')
+        self.footer_distance = _optional_integer(footer_distance, 'footer_distance')
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+class FormatProfile:
+    """
+    整个模板的带类型格式信息：styles按格式信息中的顺序，plans为 样式名称 -> 应用计划（第一次使用时生成）
+    """
+    __slots__ = ('schema_version', 'template_file', 'template_sha256', 'extractor_version', 'extraction_time',
+                 'default_font', 'default_font_size', 'styles', 'sections', '_plans')
+    
+    def __init__(self, styles, sections=None, template_file=None, template_sha256=None, extractor_version=None,
+                 extraction_time=None, default_font=None, default_font_size=None):
+        self.schema_version = PROFILE_SCHEMA_VERSION
+        self.template_file = template_file
+        self.template_sha256 = template_sha256
+        self.extractor_version = extractor_version
+        self.extraction_time = extraction_time
+        self.default_font = default_font
+        self.default_font_size = _optional_integer(default_font_size, 'default_font_size')
+        self.styles = dict(styles)
+        self.sections = dict(sections or {})
+        self._plans = None
+    
+    @property
+    def plans(self):
+        if self._plans is None:
+            self._plans = {name: StyleApplyPlan(style) for name, style in self.styles.items()}
+        return self._plans
+    
+    @classmethod
+    def from_format_info(cls, format_info):
+        """
+        解析提取器生成的格式信息（dynamic_format_info.json的内容）；已经是紧凑格式时按紧凑格式解析
+        """
+        if not isinstance(format_info, dict):
+            raise ProfileSchemaError(f"格式信息应为字典: {type(format_info).__name__}")
+        if 'schema_version' in format_info:
+            return cls.from_dict(format_info)
+        
+        extractor_version = format_info.get('extractor_version')
+        if extractor_version is not None and extractor_version > EXTRACTOR_VERSION:
+            raise ProfileSchemaError(f"格式信息由更新版本的提取器生成（v{extractor_version}），"
+                                     f"当前仅支持到v{EXTRACTOR_VERSION}")
+        if not isinstance(format_info.get('styles'), dict):
+            raise ProfileSchemaError("格式信息缺少styles")
+        
+        styles = {name: StyleProfile.from_format_info(name, style_info)
+                  for name, style_info in format_info['styles'].items()}
+        
+        sections = {}
+        for section_id, settings in format_info.get('section_settings', {}).items():
+            sections[section_id] = SectionProfile(**{
+                field: _twips(settings[field], field)
+                for field in SectionProfile.__slots__ if str(settings.get(field, '')).endswith('pt')
+            })
+        
+        defaults = format_info.get('document_defaults', {})
+        default_font_size = defaults.get('default_font_size')
+        return cls(
+            styles,
+            sections,
+            template_file=format_info.get('template_file'),
+            template_sha256=format_info.get('template_sha256'),
+            extractor_version=extractor_version,
+            extraction_time=format_info.get('extraction_time'),
+            default_font=defaults.get('default_font'),
+            default_font_size=_half_points(default_font_size, 'default_font_size') if default_font_size else None
+        )
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        解析紧凑格式，校验schema_version
+        """
+        schema_version = data.get('schema_version')
+        if schema_version != PROFILE_SCHEMA_VERSION:
+            raise ProfileSchemaError(f"不支持的格式信息结构版本: {schema_version}（当前为{PROFILE_SCHEMA_VERSION}）")
+        
+        try:
+            styles = {name: StyleProfile.from_dict(name, style) for name, style in data['styles'].items()}
+            sections = {section_id: SectionProfile(**section) for section_id, section in data.get('sections', {}).items()}
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ProfileSchemaError(f"紧凑格式信息结构无效: {e}")
+        
+        return cls(
+            styles,
+            sections,
+            template_file=data.get('template_file'),
+            template_sha256=data.get('template_sha256'),
+            extractor_version=data.get('extractor_version'),
+            extraction_time=data.get('extraction_time'),
+            default_font=data.get('default_font'),
+            default_font_size=data.get('default_font_size')
+        )
+    
+    def to_dict(self):
+        """
+        紧凑格式（整数单位，带schema_version），可直接序列化为JSON
+        """
+        return {
+            'schema_version': self.schema_version,
+            'template_file': self.template_file,
+            'template_sha256': self.template_sha256,
+            'extractor_version': self.extractor_version,
+            'extraction_time': self.extraction_time,
+            'default_font': self.default_font,
+            'default_font_size': self.default_font_size,
+            'styles': {name: style.to_dict() for name, style in self.styles.items()},
+            'sections': {section_id: section.to_dict() for section_id, section in self.sections.items()}
+        }
+    
+    def section(self, section_id):
+        return self.sections.get(section_id) or SectionProfile()
+
+def load_format_profile(path):
+    """
+    读取格式信息文件（提取器格式或紧凑格式）并解析为FormatProfile
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return FormatProfile.from_format_info(json.load(f))
+
+def main():
+    """
+    主函数：把提取器生成的格式信息转换为紧凑格式
+    """
+    parser = argparse.ArgumentParser(description="将格式信息转换为整数单位的紧凑格式")
+    parser.add_argument('format_info', nargs='?', default=config.DYNAMIC_FORMAT_INFO, help="格式信息文件")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "format_profile.json"),
+                        help="紧凑格式信息文件")
+    args = parser.parse_args()
+    configure_logging()
+    
+    if not os.path.exists(args.format_info):
+        print(f"错误：找不到格式信息文件 {args.format_info}")
+        return
+    
+    try:
+        profile = load_format_profile(args.format_info)
+    except (ProfileSchemaError, ValueError) as e:
+        logger.error(f"解析格式信息 {args.format_info} 时出错: {e}")
+        return
+    
+    config.ensure_output_dir()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(profile.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+    logger.info(f"已转换 {len(profile.styles)} 个样式，紧凑格式信息已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
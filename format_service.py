@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地格式化HTTP服务
+功能：常驻进程，模板格式信息和格式模板在工作进程中只加载一次并保持在内存中，
+上传文档后在有界进程池中执行 清理 → 应用 → 验证，返回格式化后的文档和验证摘要
+接口：
+  GET  /health                          服务状态
+  GET  /templates                       可用模板列表
+  POST /format?template=<模板ID>         请求体为.docx（原始字节或multipart/form-data上传），
+                                        返回JSON（base64编码的文档和验证摘要）；
+                                        加 &output=docx 时直接返回.docx，验证摘要放在响应头中
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import argparse
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from config import config
+from format_pipeline import FormatPipeline
+from template_profile_cache import TemplateProfileCache
+from batch_format_runner import summarize_validation
+from format_logging import get_logger, configure_logging, log_context, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('format_service')
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# 工作进程内每个模板一个已加载的流水线，由_init_service_worker创建
+_worker_pipelines = {}
+
+def _init_service_worker(templates, log_level='WARNING'):
+    """
+    工作进程初始化：为每个模板加载格式信息和格式模板（每个进程只执行一次）
+    """
+    configure_logging(log_level)
+    for template_id, template_path in templates.items():
+        pipeline = FormatPipeline(template_path=template_path)
+        if pipeline.load():
+            _worker_pipelines[template_id] = pipeline
+        else:
+            logger.error(f"错误：工作进程无法加载模板 {template_id}: {template_path}")
+
+def _worker_ready():
+    """
+    预热用的空任务：确保工作进程已启动并完成初始化
+    """
+    return sorted(_worker_pipelines)
+
+def _format_in_worker(template_id, data, validate, doc_id):
+    """
+    在工作进程中格式化一个文档，返回(格式化后文档的bytes, 验证摘要, 错误信息)
+    """
+    pipeline = _worker_pipelines.get(template_id)
+    if pipeline is None:
+        return None, None, f"工作进程未能加载模板 {template_id}"
+    
+    output, report = pipeline.process_bytes(data, validate=validate, doc_id=doc_id)
+    if output is None:
+        return None, None, pipeline.last_error or '流水线处理失败'
+    return output, summarize_validation(report) if report else None, None
+
+def _extract_upload(content_type, body):
+    """
+    从请求体中取出上传的文档：multipart/form-data取第一个文件字段，其他情况请求体即为文档
+    返回(文档字节, 文件名)
+    """
+    if not content_type.startswith('multipart/form-data'):
+        return body, None
+    
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+    for part in message.iter_parts():
+        if part.get_filename() or part.get_param('name', header='content-disposition') == 'file':
+            return part.get_payload(decode=True), part.get_filename()
+    return None, None
+
+class FormatService:
+    def __init__(self, templates, workers=None, max_pending=None, max_upload_bytes=None,
+                 profile_cache=None, worker_log_level='WARNING', request_timeout=None):
+        """
+        templates: 模板ID -> 模板文件路径
+        workers: 工作进程数
+        max_pending: 同时处理和排队的请求上限，超过时返回503
+        request_timeout: 单个请求等待格式化结果的秒数，超过时返回504
+        """
+        self.templates = dict(templates)
+        self.workers = workers or config.SERVICE_WORKERS or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        self.max_upload_bytes = max_upload_bytes or config.SERVICE_MAX_UPLOAD_BYTES
+        self.request_timeout = request_timeout or config.SERVICE_REQUEST_TIMEOUT
+        self.profile_cache = profile_cache or TemplateProfileCache()
+        self.worker_log_level = worker_log_level
+        self.template_info = {}
+        self.executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.started_at = None
+        self.processed = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+    
+    def start(self):
+        """
+        预热模板格式缓存并启动工作进程池（各进程加载完模板后才开始接受请求）
+        """
+        for template_id, template_path in self.templates.items():
+            profile = self.profile_cache.get_profile(template_path)
+            if profile is None:
+                logger.error(f"错误：无法获取模板格式信息: {template_path}")
+                return False
+            self.template_info[template_id] = {
+                'id': template_id,
+                'template_file': template_path,
+                'template_sha256': profile.get('template_sha256'),
+                'styles': len(profile.get('styles', {}))
+            }
+        
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_service_worker,
+                                            initargs=(self.templates, self.worker_log_level))
+        for future in [self.executor.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+        
+        self.started_at = time.time()
+        logger.info(f"格式化服务已就绪：{len(self.templates)} 个模板，{self.workers} 个工作进程")
+        return True
+    
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+    
+    def health(self):
+        return {
+            'status': 'ok' if self.executor is not None else 'starting',
+            'templates': len(self.templates),
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'request_timeout': self.request_timeout,
+            'processed': self.processed,
+            'failed': self.failed,
+            'uptime_seconds': round(time.time() - self.started_at, 1) if self.started_at else 0
+        }
+    
+    def format_document(self, template_id, data, validate=True, doc_id=None):
+        """
+        格式化一个文档，返回(格式化后文档的bytes, 验证摘要, 错误信息)
+        请求过多时立即返回错误，不排队等待；超过request_timeout仍未完成时返回超时错误
+        """
+        if not self._slots.acquire(blocking=False):
+            return None, None, '服务繁忙，请稍后重试'
+        try:
+            future = self.executor.submit(_format_in_worker, template_id, data, validate, doc_id)
+        except Exception as e:
+            self._slots.release()
+            future = None
+            output, summary, error = None, None, f"格式化时出错: {e}"
+        
+        if future is not None:
+            # 槽位在任务真正结束时才释放：超时返回后工作进程仍在处理，新请求不能越过上限
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                output, summary, error = future.result(timeout=self.request_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                output, summary, error = None, None, f"处理超时（超过 {self.request_timeout} 秒）"
+            except Exception as e:
+                output, summary, error = None, None, f"格式化时出错: {e}"
+        
+        with self._stats_lock:
+            if error:
+                self.failed += 1
+            else:
+                self.processed += 1
+        return output, summary, error
+
+class FormatRequestHandler(BaseHTTPRequestHandler):
+    # 由make_server设置
+    service = None
+    
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+    
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, self.service.health())
+        elif path == '/templates':
+            self._send_json(200, {'templates': list(self.service.template_info.values())})
+        else:
+            self._send_json(404, {'error': f"未知路径: {path}"})
+    
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/format':
+            self._send_json(404, {'error': f"未知路径: {url.path}"})
+            return
+        
+        query = parse_qs(url.query)
+        template_id = query.get('template', ['default'])[0]
+        validate = query.get('validate', ['1'])[0] not in ('0', 'false', 'no')
+        output_format = query.get('output', ['json'])[0]
+        
+        if template_id not in self.service.templates:
+            self._send_json(404, {'error': f"未知模板: {template_id}", 'templates': list(self.service.templates)})
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._send_json(400, {'error': f"无效的Content-Length: {self.headers.get('Content-Length')}"})
+            return
+        if length <= 0:
+            self._send_json(400, {'error': '请求体为空，请上传.docx文档'})
+            return
+        if length > self.service.max_upload_bytes:
+            self._send_json(413, {'error': f"文档超过大小上限 {self.service.max_upload_bytes} 字节"})
+            return
+        
+        data, filename = _extract_upload(self.headers.get('Content-Type', ''), self.rfile.read(length))
+        if not data:
+            self._send_json(400, {'error': '未找到上传的文档'})
+            return
+        # .docx是zip包，不是zip的上传属于客户端错误，不交给工作进程
+        if not zipfile.is_zipfile(io.BytesIO(data)):
+            self._send_json(400, {'error': '上传的文件不是有效的.docx文档（不是zip格式）'})
+            return
+        
+        doc_id = filename or query.get('name', [None])[0] or f"upload-{threading.get_ident()}"
+        start = time.perf_counter()
+        with log_context(doc_id=doc_id):
+            output, summary, error = self.service.format_document(template_id, data, validate, doc_id)
+            duration = round(time.perf_counter() - start, 3)
+            
+            if error:
+                if error.startswith('服务繁忙'):
+                    status = 503
+                elif error.startswith('处理超时'):
+                    status = 504
+                else:
+                    status = 500
+                logger.error(f"格式化文档 {doc_id} 失败: {error}")
+                self._send_json(status, {'error': error})
+                return
+            
+            logger.summary('service_request', f"已格式化 {doc_id}（{duration}s）",
+                           input_bytes=len(data), output_bytes=len(output), duration_seconds=duration)
+        
+        if output_format == 'docx':
+            self.send_response(200)
+            self.send_header('Content-Type', DOCX_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(output)))
+            self.send_header('X-Validation-Summary', json.dumps(summary))
+            self.send_header('X-Duration-Seconds', str(duration))
+            self.end_headers()
+            self.wfile.write(output)
+            return
+        
+        self._send_json(200, {
+            'template': template_id,
+            'document': base64.b64encode(output).decode('ascii'),
+            'validation': summary,
+            'duration_seconds': duration
+        })
+
+def make_server(service, host=None, port=None):
+    """
+    创建绑定到service的HTTP服务器（每个请求一个线程，CPU密集的格式化在进程池中执行）
+    """
+    handler = type('BoundFormatRequestHandler', (FormatRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host or config.SERVICE_HOST, port or config.SERVICE_PORT), handler)
+
+def parse_template_arguments(values):
+    """
+    解析 --template ID=路径 参数；只给出路径时使用文件名（不含扩展名）作为ID
+    """
+    templates = {}
+    for value in values or []:
+        if '=' in value:
+            template_id, path = value.split('=', 1)
+        else:
+            path = value
+            template_id = os.path.splitext(os.path.basename(path))[0]
+        templates[template_id] = path
+    if not templates:
+        templates['default'] = config.TEMPLATE_FILE
+    return templates
+
+def main():
+    """
+    主函数：启动本地格式化服务
+    """
+    parser = argparse.ArgumentParser(description="本地格式化HTTP服务（模板常驻内存）")
+    parser.add_argument('--template', action='append', help="模板，格式为 ID=路径（可多次指定，默认 default=格式模板.docx）")
+    parser.add_argument('--host', default=config.SERVICE_HOST, help="监听地址")
+    parser.add_argument('--port', type=int, default=config.SERVICE_PORT, help="监听端口")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument('--max-pending', type=int, default=None, help="同时处理和排队的请求上限（默认工作进程数的2倍）")
+    parser.add_argument('--request-timeout', type=float, default=None,
+                        help=f"单个请求等待格式化结果的秒数（默认{config.SERVICE_REQUEST_TIMEOUT}）")
+    parser.add_argument('--worker-log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="工作进程的日志级别")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    templates = parse_template_arguments(args.template)
+    for template_id, path in templates.items():
+        if not os.path.exists(path):
+            print(f"错误：找不到模板 {template_id}: {path}")
+            return
+    
+    service = FormatService(templates, args.workers, args.max_pending, worker_log_level=args.worker_log_level,
+                            request_timeout=args.request_timeout)
+    if not service.start():
+        return
+    
+    server = make_server(service, args.host, args.port)
+    print(f"格式化服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止格式化服务...")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -12,21 +12,60 @@ from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.shared import OxmlElement, qn
 from config import config
+from style_index import StyleIndex
+from style_resolver import StyleResolver
+from style_records import StyleRecord, read_style_records, compare_style_records
+from effective_format_resolver import EffectiveFormatResolver
+from stage_metrics import StageMetrics, metrics_path_for
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('format_validator')
 
 class FormatValidator:
-    def __init__(self):
+    def __init__(self, metrics=None, engine=None, tolerances=None, check_paragraphs=None):
+        """
+        engine: 'typed'（默认）解析一次styles.xml得到带类型的样式记录并按数值和容差比较；
+                'proxy'通过python-docx代理属性读取并按字符串比较（旧版报告格式）
+        tolerances: typed引擎各数值类型的比较容差，见style_records.DEFAULT_TOLERANCES
+        check_paragraphs: 是否逐段落检查实际生效的格式与段落样式是否一致
+        """
+        self.engine = engine or config.VALIDATOR_ENGINE
+        self.tolerances = tolerances
+        self.check_paragraphs = config.VALIDATE_PARAGRAPH_FORMATS if check_paragraphs is None else check_paragraphs
         self.template_styles = {}
         self.formatted_styles = {}
         self.validation_report = {}
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
         
+    def _load_document(self, doc_or_path):
+        """
+        支持传入文件路径或已加载的Document对象，已加载的文档不再重复解析
+        """
+        if isinstance(doc_or_path, (str, os.PathLike)):
+            return Document(doc_or_path)
+        return doc_or_path
+    
     def analyze_document_styles(self, doc_path):
         """
         分析文档中的样式定义
+        doc_path可以是文件路径，也可以是已加载的Document对象
         """
+        if self.engine == 'typed':
+            try:
+                # 路径只读取styles.xml部件，已加载的文档直接使用其样式部件
+                return read_style_records(doc_path)
+            except Exception as e:
+                logger.error(f"分析文档样式时出错: {e}")
+                return {}
+        
         try:
-            doc = Document(doc_path)
+            doc = self._load_document(doc_path)
             styles_info = {}
             
+            # 样式继承解析器每个文档建立一次，字体信息与提取器使用同一套解析结果
+            resolver = StyleResolver(doc)
+            
             for style in doc.styles:
                 if style.type == 1:  # 段落样式
                     style_info = {
@@ -39,7 +78,7 @@ class FormatValidator:
                     }
                     
                     # 获取字体信息
-                    font_info = self.get_font_info(style)
+                    font_info = self.get_font_info(style, resolver)
                     style_info.update(font_info)
                     
                     # 获取段落格式信息
@@ -51,12 +90,13 @@ class FormatValidator:
             return styles_info
             
         except Exception as e:
-            print(f"分析文档样式时出错: {e}")
+            logger.error(f"分析文档样式时出错: {e}")
             return {}
     
-    def get_font_info(self, style):
+    def get_font_info(self, style, resolver=None):
         """
         获取字体信息，包括中英文字体分离设置
+        resolver为文档的样式继承解析器，未提供时按样式所在的样式部件临时建立
         """
         font_info = {
             'ascii_font': None,
@@ -66,34 +106,20 @@ class FormatValidator:
         }
         
         try:
-            if hasattr(style, '_element'):
-                style_element = style._element
-                
-                # 查找rPr元素
-                rpr = style_element.find(qn('w:rPr'))
-                if rpr is not None:
-                    # 查找rFonts元素
-                    rfonts = rpr.find(qn('w:rFonts'))
-                    if rfonts is not None:
-                        # 获取各种字体设置
-                        ascii_font = rfonts.get(qn('w:ascii'))
-                        if ascii_font:
-                            font_info['ascii_font'] = ascii_font
-                        
-                        eastAsia_font = rfonts.get(qn('w:eastAsia'))
-                        if eastAsia_font:
-                            font_info['eastasia_font'] = eastAsia_font
-                        
-                        cs_font = rfonts.get(qn('w:cs'))
-                        if cs_font:
-                            font_info['cs_font'] = cs_font
-                        
-                        hAnsi_font = rfonts.get(qn('w:hAnsi'))
-                        if hAnsi_font:
-                            font_info['hansi_font'] = hAnsi_font
+            if resolver is None:
+                resolver = StyleResolver(style.element.getparent())
+            
+            # 样式rFonts中直接设置的字体
+            resolved = resolver.resolve(style)
+            if resolved is not None:
+                direct_fonts = resolved.direct_fonts
+                font_info['ascii_font'] = direct_fonts.get('ascii')
+                font_info['eastasia_font'] = direct_fonts.get('eastAsia')
+                font_info['cs_font'] = direct_fonts.get('cs')
+                font_info['hansi_font'] = direct_fonts.get('hAnsi')
                         
         except Exception as e:
-            print(f"获取字体信息时出错: {e}")
+            logger.error(f"获取字体信息时出错: {e}")
             
         return font_info
 
@@ -132,7 +158,7 @@ class FormatValidator:
             return False
             
         except Exception as e:
-            print(f"检查字体分离一致性时出错: {e}")
+            logger.error(f"检查字体分离一致性时出错: {e}")
             # 出错时采用宽松匹配
             return formatted_font_name in ['Times New Roman', '宋体', 'Arial']
 
@@ -143,7 +169,7 @@ class FormatValidator:
                 return style.font.name
             return '继承默认字体'
         except Exception as e:
-            print(f"获取字体名称时出错: {e}")
+            logger.error(f"获取字体名称时出错: {e}")
             return None
     
     def _get_font_size(self, style):
@@ -153,7 +179,7 @@ class FormatValidator:
                 return f"{style.font.size.pt}pt"
             return None
         except Exception as e:
-            print(f"获取字体大小时出错: {e}")
+            logger.error(f"获取字体大小时出错: {e}")
             return None
     
     def _get_bold(self, style):
@@ -163,7 +189,7 @@ class FormatValidator:
                 return style.font.bold
             return None
         except Exception as e:
-            print(f"获取加粗设置时出错: {e}")
+            logger.error(f"获取加粗设置时出错: {e}")
             return None
     
     def _get_italic(self, style):
@@ -173,7 +199,7 @@ class FormatValidator:
                 return style.font.italic
             return None
         except Exception as e:
-            print(f"获取斜体设置时出错: {e}")
+            logger.error(f"获取斜体设置时出错: {e}")
             return None
     
     def _get_paragraph_format_info(self, style):
@@ -220,24 +246,28 @@ class FormatValidator:
                 info['left_indent'] = None
                 
         except Exception as e:
-            print(f"获取段落格式信息时出错: {e}")
+            logger.error(f"获取段落格式信息时出错: {e}")
             
         return info
     
     def analyze_document_paragraphs(self, doc_path):
         """
         分析文档中段落的实际格式
+        doc_path可以是文件路径，也可以是已加载的Document对象
         """
         try:
-            doc = Document(doc_path)
+            doc = self._load_document(doc_path)
             paragraphs_info = []
             
+            # 段落样式通过样式索引按styleId查找，避免每个段落线性查找样式
+            style_index = StyleIndex(doc)
+            
             for i, paragraph in enumerate(doc.paragraphs):
                 if paragraph.text.strip():  # 只分析有内容的段落
                     para_info = {
                         'paragraph_index': i + 1,
                         'text_preview': paragraph.text[:50] + '...' if len(paragraph.text) > 50 else paragraph.text,
-                        'style_name': paragraph.style.name,
+                        'style_name': style_index.paragraph_style_name(paragraph),
                         'font_name': self._get_run_font_name(paragraph),
                         'alignment': self._get_paragraph_alignment(paragraph),
                         'line_spacing': self._get_paragraph_line_spacing(paragraph),
@@ -248,7 +278,7 @@ class FormatValidator:
             return paragraphs_info
             
         except Exception as e:
-            print(f"分析文档段落时出错: {e}")
+            logger.error(f"分析文档段落时出错: {e}")
             return []
     
     def _get_run_font_name(self, paragraph):
@@ -259,7 +289,7 @@ class FormatValidator:
                     return run.font.name
             return None
         except Exception as e:
-            print(f"获取运行字体名称时出错: {e}")
+            logger.error(f"获取运行字体名称时出错: {e}")
             return None
     
     def _get_paragraph_alignment(self, paragraph):
@@ -269,7 +299,7 @@ class FormatValidator:
                 return f"{paragraph.alignment.name} ({paragraph.alignment.value})"
             return None
         except Exception as e:
-            print(f"获取段落对齐方式时出错: {e}")
+            logger.error(f"获取段落对齐方式时出错: {e}")
             return None
     
     def _get_paragraph_line_spacing(self, paragraph):
@@ -279,7 +309,7 @@ class FormatValidator:
                 return str(paragraph.paragraph_format.line_spacing)
             return None
         except Exception as e:
-            print(f"获取段落行间距时出错: {e}")
+            logger.error(f"获取段落行间距时出错: {e}")
             return None
     
     def _get_paragraph_first_line_indent(self, paragraph):
@@ -289,13 +319,16 @@ class FormatValidator:
                 return f"{paragraph.paragraph_format.first_line_indent.pt}pt"
             return None
         except Exception as e:
-            print(f"获取段落首行缩进时出错: {e}")
+            logger.error(f"获取段落首行缩进时出错: {e}")
             return None
     
     def compare_styles(self, template_styles, formatted_styles):
         """
         比较模板样式和格式化后样式的差异
         """
+        if self._is_typed(template_styles) or self._is_typed(formatted_styles):
+            return compare_style_records(template_styles, formatted_styles, self.tolerances)
+        
         comparison_result = {}
         
         for style_name in template_styles:
@@ -352,67 +385,127 @@ class FormatValidator:
         
         return comparison_result
     
-    def generate_validation_report(self, template_doc, formatted_doc, output_file=None):
+    def _is_typed(self, styles):
+        return any(isinstance(style, StyleRecord) for style in styles.values())
+    
+    def _styles_for_report(self, styles):
+        """
+        报告中的样式信息：带类型的样式记录转换为字典
+        """
+        return {name: style.to_dict() if isinstance(style, StyleRecord) else style for name, style in styles.items()}
+    
+    def generate_validation_report(self, template_doc, formatted_doc, output_file=None,
+                                   template_styles=None, template_label=None, formatted_label=None):
         """
         生成完整的验证报告
+        template_doc和formatted_doc可以是文件路径，也可以是已加载的Document对象，
+        格式化后的文档只解析一次；template_styles为已分析的模板样式，传入时不再重复分析模板
+        output_file为False时只返回报告，不写文件
         """
         if output_file is None:
             output_file = config.VALIDATION_REPORT
         
-        print("开始格式验证...")
+        logger.info("开始格式验证...")
         
         # 确保输出目录存在
-        config.ensure_output_dir()
-        
-        # 分析模板样式
-        print("分析格式模板样式...")
-        template_styles = self.analyze_document_styles(template_doc)
-        
-        # 分析格式化后文档样式
-        print("分析格式化后文档样式...")
-        formatted_styles = self.analyze_document_styles(formatted_doc)
+        if output_file:
+            config.ensure_output_dir()
         
-        # 分析格式化后文档段落
-        formatted_paragraphs = self.analyze_document_paragraphs(formatted_doc)
-        
-        # 比较样式差异
-        print("比较样式差异...")
-        style_comparison = self.compare_styles(template_styles, formatted_styles)
-        
-        # 生成报告
-        report = {
-            'template_document': template_doc,
-            'formatted_document': formatted_doc,
-            'template_styles_count': len(template_styles),
-            'formatted_styles_count': len(formatted_styles),
-            'paragraphs_count': len(formatted_paragraphs),
-            'style_comparison': style_comparison,
-            'template_styles': template_styles,
-            'formatted_styles': formatted_styles,
-            'formatted_paragraphs': formatted_paragraphs
-        }
-        
-        # 保存详细报告
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        with self.metrics.stage('validation') as counts:
+            # 分析模板样式
+            if template_styles is None:
+                logger.debug("分析格式模板样式...")
+                template_styles = self.analyze_document_styles(template_doc)
+            
+            # 分析格式化后文档样式和段落（同一个已加载的文档）
+            logger.debug("分析格式化后文档样式...")
+            formatted_doc_obj = self._load_document(formatted_doc)
+            formatted_styles = self.analyze_document_styles(formatted_doc_obj)
+            
+            # 分析格式化后文档段落
+            formatted_paragraphs = self.analyze_document_paragraphs(formatted_doc_obj)
+            
+            # 比较样式差异
+            logger.debug("比较样式差异...")
+            style_comparison = self.compare_styles(template_styles, formatted_styles)
+            
+            # 逐段落检查实际生效的格式（docDefaults → 样式链 → 段落 → run）
+            paragraph_check = None
+            if self.check_paragraphs:
+                logger.debug("检查段落实际格式...")
+                paragraph_check = self.check_paragraph_formats(formatted_doc_obj)
+            
+            # 生成报告
+            report = {
+                'template_document': template_label or self._describe_document(template_doc),
+                'formatted_document': formatted_label or self._describe_document(formatted_doc),
+                'template_styles_count': len(template_styles),
+                'formatted_styles_count': len(formatted_styles),
+                'paragraphs_count': len(formatted_paragraphs),
+                'style_comparison': style_comparison,
+                'validator_engine': self.engine,
+                'template_styles': self._styles_for_report(template_styles),
+                'formatted_styles': self._styles_for_report(formatted_styles),
+                'formatted_paragraphs': formatted_paragraphs
+            }
+            if paragraph_check is not None:
+                report['paragraph_format_check'] = paragraph_check
+            
+            # 保存详细报告
+            if output_file:
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+            
+            counts['styles'] = len(template_styles)
+            counts['paragraphs'] = len(formatted_paragraphs)
+            if paragraph_check is not None:
+                counts['deviating_paragraphs'] = paragraph_check['deviating_paragraphs']
         
         # 生成控制台摘要
         self._print_validation_summary(report)
         
         return report
     
+    def check_paragraph_formats(self, doc_path):
+        """
+        检查每个段落中run实际生效的格式是否与段落样式一致（直接格式覆盖了样式设置时记为偏离）
+        doc_path可以是文件路径，也可以是已加载的Document对象
+        """
+        try:
+            doc = self._load_document(doc_path)
+            return EffectiveFormatResolver(doc).check_paragraphs()
+        except Exception as e:
+            logger.error(f"检查段落实际格式时出错: {e}")
+            return None
+    
+    def _describe_document(self, doc_or_path):
+        """
+        报告中记录的文档名称：路径原样记录，已加载的文档使用其标题
+        """
+        if isinstance(doc_or_path, (str, os.PathLike)):
+            return str(doc_or_path)
+        return doc_or_path.core_properties.title or '内存中的文档'
+    
     def _print_validation_summary(self, report):
         """
-        打印验证摘要到控制台
+        输出验证摘要（逐个样式的匹配结果为DEBUG级别，差异和总结为INFO级别）
         """
-        print("\n=== 格式验证报告 ===")
-        print(f"格式模板: {report['template_document']}")
-        print(f"格式化后文档: {report['formatted_document']}")
-        print(f"模板样式数量: {report['template_styles_count']}")
-        print(f"格式化后样式数量: {report['formatted_styles_count']}")
-        print(f"文档段落数量: {report['paragraphs_count']}")
+        logger.info("=== 格式验证报告 ===")
+        logger.info(f"格式模板: {report['template_document']}")
+        logger.info(f"格式化后文档: {report['formatted_document']}")
+        logger.info(f"模板样式数量: {report['template_styles_count']}")
+        logger.info(f"格式化后样式数量: {report['formatted_styles_count']}")
+        logger.info(f"文档段落数量: {report['paragraphs_count']}")
+        
+        paragraph_check = report.get('paragraph_format_check')
+        if paragraph_check:
+            logger.info(f"实际格式与段落样式不一致的段落: {paragraph_check['deviating_paragraphs']}/"
+                        f"{paragraph_check['paragraphs_checked']}")
+            for detail in paragraph_check['details']:
+                logger.debug(f"   段落{detail['paragraph_index']}（{detail['style_name']}）: "
+                             f"{', '.join(item['property'] for item in detail['deviations'])}")
         
-        print("\n=== 样式比较结果 ===")
+        logger.info("=== 样式比较结果 ===")
         
         matched_count = 0
         different_count = 0
@@ -422,46 +515,52 @@ class FormatValidator:
             status = comparison['status']
             
             if status == 'matched':
-                print(f"✅ {style_name}: 完全匹配")
+                logger.debug(f"✅ {style_name}: 完全匹配")
                 matched_count += 1
             elif status == 'different':
                 diff_count = len(comparison['differences'])
-                print(f"⚠️  {style_name}: 存在差异 ({diff_count}个属性不同)")
+                logger.info(f"⚠️  {style_name}: 存在差异 ({diff_count}个属性不同)")
                 
                 # 显示前几个差异
                 for diff in comparison['differences'][:3]:  # 只显示前3个差异
                     template_val = diff['template_value'] if diff['template_value'] is not None else 'None'
                     formatted_val = diff['formatted_value'] if diff['formatted_value'] is not None else 'None'
-                    print(f"   - {diff['property']}: 模板='{template_val}' vs 格式化='{formatted_val}'")
+                    logger.info(f"   - {diff['property']}: 模板='{template_val}' vs 格式化='{formatted_val}'")
                 
                 different_count += 1
             elif status == 'missing':
-                print(f"❌ {style_name}: 缺少样式")
+                logger.info(f"❌ {style_name}: 缺少样式")
                 missing_count += 1
         
-        print("\n=== 总结 ===")
-        print(f"完全匹配: {matched_count}个样式")
-        print(f"存在差异: {different_count}个样式")
-        print(f"缺少样式: {missing_count}个样式")
-        
         total_styles = matched_count + different_count + missing_count
-        if total_styles > 0:
-            match_rate = (matched_count / total_styles) * 100
-            print(f"格式匹配率: {match_rate:.1f}%")
+        match_rate = (matched_count / total_styles) * 100 if total_styles > 0 else None
+        
+        logger.info("=== 总结 ===")
+        logger.summary('validation',
+                       f"完全匹配: {matched_count}个样式，存在差异: {different_count}个样式，缺少样式: {missing_count}个样式",
+                       matched=matched_count, different=different_count, missing=missing_count,
+                       match_rate=round(match_rate, 1) if match_rate is not None else None)
+        
+        if match_rate is not None:
+            logger.info(f"格式匹配率: {match_rate:.1f}%")
             
             if match_rate >= 80:
-                print("✅ 格式转换效果优秀！")
+                logger.info("✅ 格式转换效果优秀！")
             elif match_rate >= 60:
-                print("⚠️  格式转换基本成功，但仍有部分样式需要调整。")
+                logger.warning("⚠️  格式转换基本成功，但仍有部分样式需要调整。")
             else:
-                print("❌ 格式转换存在较多问题，需要检查转换逻辑。")
+                logger.warning("❌ 格式转换存在较多问题，需要检查转换逻辑。")
 
 def main():
+    configure_logging()
+    
     # 文件路径
     template_doc = config.TEMPLATE_FILE
     
-    # 使用配置中的格式化文档路径
-    formatted_doc = config.get_formatted_doc_path()
+    # 使用格式应用器保存的格式化文档，不存在时使用最新的带时间戳的格式化文档
+    formatted_doc = config.get_fixed_formatted_doc_path()
+    if not os.path.exists(formatted_doc):
+        formatted_doc = config.get_latest_formatted_doc()
     
     if not formatted_doc:
         print(f"错误: 找不到格式化后文档（模式: {config.FORMATTED_DOC_PREFIX}*.docx）")
@@ -479,12 +578,15 @@ def main():
         return
     
     # 创建验证器
-    validator = FormatValidator()
+    metrics = StageMetrics()
+    metrics.context = {'input': formatted_doc, 'output': config.VALIDATION_REPORT}
+    validator = FormatValidator(metrics)
     
-    # 生成验证报告
+    # 生成验证报告（分阶段指标保存在验证报告旁边）
     report = validator.generate_validation_report(template_doc, formatted_doc)
     
     print(f"\n详细报告已保存到: {config.VALIDATION_REPORT}")
+    print(f"分阶段指标已保存到: {metrics.save(metrics_path_for(config.VALIDATION_REPORT))}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
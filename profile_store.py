@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+格式信息的二进制存储
+功能：把带类型的格式信息（FormatProfile的紧凑格式）保存为带文件头的二进制文件：
+魔数 + 结构版本 + marshal格式版本 + CRC32 + marshal编码的紧凑格式，加载时校验文件头和校验和，
+不需要解析带缩进的JSON，工作进程启动时加载几十个模板只需几毫秒
+旧版本的格式信息（包括提取器生成的dynamic_format_info.json，视为结构版本0）通过迁移函数逐版本升级
+JSON形式仍可导出，供人工查看
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import marshal
+import argparse
+from config import config
+from format_profile import FormatProfile, ProfileSchemaError, PROFILE_SCHEMA_VERSION
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('profile_store')
+
+# 文件头：魔数、结构版本、marshal格式版本、负载的CRC32
+PROFILE_MAGIC = b'DFPF'
+PROFILE_HEADER = struct.Struct('<4sHHI')
+
+# 二进制格式信息文件的扩展名
+PROFILE_EXTENSION = '.profile'
+
+# 结构版本 -> 升级到下一版本的迁移函数
+MIGRATIONS = {}
+
+def register_migration(from_version):
+    """
+    注册迁移函数：把结构版本from_version的格式信息（字典）升级为下一版本
+    """
+    def register(func):
+        MIGRATIONS[from_version] = func
+        return func
+    return register
+
+@register_migration(0)
+def _migrate_extractor_layout(data):
+    """
+    提取器生成的格式信息（字号为'10.5pt'字符串、对齐方式为中文名称）-> 结构版本1
+    """
+    return FormatProfile.from_format_info(data).to_dict()
+
+def schema_version_of(data):
+    """
+    格式信息的结构版本：没有schema_version的为提取器格式（版本0）
+    """
+    return data.get('schema_version', 0)
+
+def upgrade_profile_data(data):
+    """
+    按迁移函数逐版本升级到当前结构版本，返回升级后的字典
+    """
+    version = schema_version_of(data)
+    if version > PROFILE_SCHEMA_VERSION:
+        raise ProfileSchemaError(f"格式信息的结构版本 {version} 高于当前支持的版本 {PROFILE_SCHEMA_VERSION}")
+    while version < PROFILE_SCHEMA_VERSION:
+        migration = MIGRATIONS.get(version)
+        if migration is None:
+            raise ProfileSchemaError(f"缺少结构版本 {version} 的迁移函数")
+        data = migration(data)
+        new_version = schema_version_of(data)
+        if new_version <= version:
+            raise ProfileSchemaError(f"结构版本 {version} 的迁移函数没有升级版本")
+        version = new_version
+    return data
+
+def profile_from_data(data):
+    """
+    由任意受支持版本的格式信息字典得到FormatProfile
+    """
+    if not isinstance(data, dict):
+        raise ProfileSchemaError(f"格式信息应为字典: {type(data).__name__}")
+    return FormatProfile.from_dict(upgrade_profile_data(data))
+
+def dumps_profile(profile):
+    """
+    编码为二进制：文件头 + marshal编码的紧凑格式
+    """
+    payload = marshal.dumps(profile.to_dict())
+    header = PROFILE_HEADER.pack(PROFILE_MAGIC, profile.schema_version, marshal.version, zlib.crc32(payload))
+    return header + payload
+
+def is_binary_profile(data):
+    return data[:len(PROFILE_MAGIC)] == PROFILE_MAGIC
+
+def loads_profile(data):
+    """
+    解码二进制格式信息：校验魔数、marshal格式版本和校验和，旧结构版本按迁移函数升级
+    """
+    if len(data) < PROFILE_HEADER.size or not is_binary_profile(data):
+        raise ProfileSchemaError("不是二进制格式信息")
+    _, schema_version, marshal_version, checksum = PROFILE_HEADER.unpack_from(data)
+    if marshal_version != marshal.version:
+        raise ProfileSchemaError(f"marshal格式版本不一致: {marshal_version}（当前为{marshal.version}）")
+    payload = memoryview(data)[PROFILE_HEADER.size:]
+    if zlib.crc32(payload) != checksum:
+        raise ProfileSchemaError("二进制格式信息校验和不一致，文件可能已损坏")
+    
+    try:
+        profile_data = marshal.loads(payload)
+    except (ValueError, EOFError, TypeError) as e:
+        raise ProfileSchemaError(f"无法解码二进制格式信息: {e}")
+    if not isinstance(profile_data, dict) or schema_version_of(profile_data) != schema_version:
+        raise ProfileSchemaError("二进制格式信息的文件头与内容不一致")
+    return profile_from_data(profile_data)
+
+def save_profile(profile, path):
+    """
+    保存为二进制文件（先写临时文件再原子替换，并发进程不会读到半写入的文件）
+    """
+    directory = os.path.dirname(os.fspath(path))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(dumps_profile(profile))
+    os.replace(temp_path, path)
+    return path
+
+def load_profile(path):
+    """
+    读取格式信息文件：二进制文件、紧凑格式JSON或提取器生成的JSON均可，返回FormatProfile
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_binary_profile(data):
+        return loads_profile(data)
+    try:
+        return profile_from_data(json.loads(data.decode('utf-8')))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProfileSchemaError(f"无法解析格式信息文件 {path}: {e}")
+
+def export_json(profile, path):
+    """
+    导出为便于人工查看的JSON（紧凑格式，带缩进）
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile.to_dict(), f, ensure_ascii=False, indent=2)
+    return path
+
+def main():
+    """
+    主函数：打包、导出或查看格式信息
+    """
+    parser = argparse.ArgumentParser(description="格式信息的二进制打包与JSON导出")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    pack_parser = subparsers.add_parser('pack', help="把JSON格式信息打包为二进制")
+    pack_parser.add_argument('source', nargs='?', default=config.DYNAMIC_FORMAT_INFO, help="格式信息文件")
+    pack_parser.add_argument('-o', '--output', default=None, help="二进制文件路径（默认与源文件同名）")
+    
+    export_parser = subparsers.add_parser('export', help="把格式信息导出为JSON")
+    export_parser.add_argument('source', help="格式信息文件")
+    export_parser.add_argument('-o', '--output', required=True, help="JSON文件路径")
+    
+    info_parser = subparsers.add_parser('info', help="查看格式信息并测量加载时间")
+    info_parser.add_argument('sources', nargs='+', help="格式信息文件")
+    
+    args = parser.parse_args()
+    configure_logging()
+    
+    try:
+        if args.command == 'pack':
+            output = args.output or os.path.splitext(args.source)[0] + PROFILE_EXTENSION
+            save_profile(load_profile(args.source), output)
+            logger.info(f"已打包 {args.source} -> {output}（{os.path.getsize(output)} 字节）")
+        elif args.command == 'export':
+            export_json(load_profile(args.source), args.output)
+            logger.info(f"已导出 {args.source} -> {args.output}")
+        else:
+            start = time.perf_counter()
+            profiles = [(path, load_profile(path)) for path in args.sources]
+            elapsed = time.perf_counter() - start
+            for path, profile in profiles:
+                print(f"{path}: 结构版本 {profile.schema_version}，{len(profile.styles)} 个样式，"
+                      f"模板 {profile.template_file}（sha256={(profile.template_sha256 or '未知')[:12]}）")
+            print(f"加载 {len(profiles)} 个格式信息共 {elapsed * 1000:.1f}ms")
+    except (OSError, ProfileSchemaError) as e:
+        logger.error(f"处理格式信息时出错: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相邻run合并器
+功能：清理run格式后，把同一容器中相邻、rPr完全相同（规范化序列化后逐字节相同）且只包含简单文本的w:r合并为一个
+编辑器按修订标识(rsid)和校对标记把一句话拆成很多run，清理后它们的格式往往已经相同；
+合并后后续的格式应用、验证和run分析需要遍历的run更少，输出文档也更小
+域代码（fldChar/instrText）、图片、脚注引用等run保持不动，书签、超链接、修订标记等非run元素两侧的run不会合并
+"""
+
+import os
+import argparse
+from lxml import etree
+from docx import Document
+from docx.oxml.ns import qn
+from config import config
+from docx_passthrough_writer import save_document
+from stage_metrics import StageMetrics
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('run_coalescer')
+
+W_R = qn('w:r')
+W_T = qn('w:t')
+W_RPR = qn('w:rPr')
+W_PROOF_ERR = qn('w:proofErr')
+W_TYPE = qn('w:type')
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# 校对标记的种类：w:type为 <种类>Start / <种类>End
+PROOF_MARK_KINDS = ('spell', 'gram')
+
+# 可以合并的run内容：文本、制表符、换行和特殊连字符（合并后按原顺序保留）
+SIMPLE_RUN_CONTENT = frozenset(qn(f'w:{tag}') for tag in ('t', 'tab', 'br', 'cr', 'noBreakHyphen', 'softHyphen'))
+
+def _is_simple_run(r_element):
+    """
+    run是否只包含rPr和简单文本内容（不含域代码、图片、脚注引用等）
+    """
+    for child in r_element:
+        if child.tag != W_RPR and child.tag not in SIMPLE_RUN_CONTENT:
+            return False
+    return True
+
+def _rpr_key(r_element):
+    """
+    run格式的规范化序列化结果，没有rPr时为空
+    """
+    rpr = r_element.find(W_RPR)
+    if rpr is None or len(rpr) == 0 and not rpr.attrib:
+        return b''
+    return etree.tostring(rpr, method='c14n')
+
+def _set_text(t_element, text):
+    t_element.text = text
+    if text != text.strip():
+        t_element.set(XML_SPACE, 'preserve')
+
+class RunCoalescer:
+    def __init__(self, metrics=None):
+        self.runs_before = 0
+        self.runs_after = 0
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
+    
+    def coalesce_document(self, doc):
+        """
+        合并已加载文档（内存中的Document对象）正文中的相邻run，不读写文件
+        返回减少的run数
+        """
+        with self.metrics.stage('run_coalescing') as counts:
+            body = doc.element.body
+            # 按直接包含run的容器（段落、超链接、修订插入、内容控件等）分组，只合并同一容器中的run
+            containers = {}
+            self.runs_before = 0
+            for r_element in body.iter(W_R):
+                self.runs_before += 1
+                parent = r_element.getparent()
+                containers[id(parent)] = parent
+            
+            removed_proof_marks = 0
+            for container in containers.values():
+                removed_proof_marks += self._coalesce_container(container)
+            
+            self.runs_after = sum(1 for _ in body.iter(W_R))
+            merged = self.runs_before - self.runs_after
+            counts['runs_before'] = self.runs_before
+            counts['runs_after'] = self.runs_after
+            counts['merged_runs'] = merged
+            counts['removed_proof_marks'] = removed_proof_marks
+        
+        reduction = merged / self.runs_before * 100 if self.runs_before else 0.0
+        logger.summary('run_coalescing',
+                       f"合并相邻run完成: {self.runs_before} → {self.runs_after}，减少 {merged} 个（{reduction:.1f}%）",
+                       runs_before=self.runs_before, runs_after=self.runs_after, merged_runs=merged)
+        
+        return merged
+    
+    def _coalesce_container(self, container):
+        """
+        合并容器中相邻的简单run：两个run之间只隔着校对标记(w:proofErr)时也视为相邻
+        合并后只移除起止都落在同一段合并范围内的校对标记对，另一端在范围外的标记保持不动
+        返回移除的校对标记数
+        """
+        removed = 0
+        target = None
+        target_key = None
+        pending_proof_marks = []
+        # 当前合并范围内（被合并的run之间）的校对标记
+        span_proof_marks = []
+        
+        for child in list(container):
+            if child.tag == W_PROOF_ERR:
+                if target is not None:
+                    pending_proof_marks.append(child)
+                continue
+            
+            if child.tag != W_R or not _is_simple_run(child):
+                removed += self._remove_paired_proof_marks(container, span_proof_marks)
+                target = None
+                pending_proof_marks = []
+                span_proof_marks = []
+                continue
+            
+            key = _rpr_key(child)
+            if target is not None and key == target_key:
+                span_proof_marks.extend(pending_proof_marks)
+                self._merge_into(target, child)
+                container.remove(child)
+            else:
+                removed += self._remove_paired_proof_marks(container, span_proof_marks)
+                span_proof_marks = []
+                target = child
+                target_key = key
+            pending_proof_marks = []
+        
+        removed += self._remove_paired_proof_marks(container, span_proof_marks)
+        return removed
+    
+    def _remove_paired_proof_marks(self, container, proof_marks):
+        """
+        按文档顺序配对拼写/语法校对标记的开始和结束，移除成对的标记，返回移除数
+        """
+        open_marks = {}
+        paired = []
+        for proof_mark in proof_marks:
+            mark_type = proof_mark.get(W_TYPE) or ''
+            for kind in PROOF_MARK_KINDS:
+                if mark_type == f"{kind}Start":
+                    open_marks.setdefault(kind, []).append(proof_mark)
+                elif mark_type == f"{kind}End" and open_marks.get(kind):
+                    paired.append(open_marks[kind].pop())
+                    paired.append(proof_mark)
+        
+        for proof_mark in paired:
+            container.remove(proof_mark)
+        return len(paired)
+    
+    def _merge_into(self, target, source):
+        """
+        把source的内容按顺序追加到target末尾，相接的w:t合并为一个
+        """
+        last = target[-1] if len(target) else None
+        for child in list(source):
+            if child.tag == W_RPR:
+                continue
+            if child.tag == W_T and last is not None and last.tag == W_T:
+                _set_text(last, (last.text or '') + (child.text or ''))
+                continue
+            target.append(child)
+            last = child
+    
+    def coalesce_document_runs(self, input_path, output_path):
+        """
+        合并文档中的相邻run并保存
+        """
+        try:
+            logger.info(f"=== 合并文档相邻run: {input_path} ===")
+            
+            with self.metrics.stage('load'):
+                doc = Document(input_path)
+            
+            self.coalesce_document(doc)
+            
+            # 未修改的图片等成员直通复制
+            with self.metrics.stage('save'):
+                save_document(doc, output_path, source=input_path)
+            
+            logger.info(f"合并后的文档已保存到: {output_path}")
+            
+            return True
+        
+        except Exception as e:
+            logger.error(f"合并文档相邻run时出错: {e}")
+            return False
+
+def main():
+    """
+    主函数：合并文档中格式相同的相邻run
+    """
+    parser = argparse.ArgumentParser(description="合并文档中格式相同的相邻run")
+    parser.add_argument('input', nargs='?', default=config.TEST_DOCUMENT, help="要处理的文档")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "测试文档_合并run后.docx"),
+                        help="合并后的文档路径")
+    args = parser.parse_args()
+    configure_logging()
+    
+    if not os.path.exists(args.input):
+        print(f"错误：找不到文档 {args.input}")
+        return
+    
+    config.ensure_output_dir()
+    RunCoalescer().coalesce_document_runs(args.input, args.output)
+
+if __name__ == "__main__":
+    main()
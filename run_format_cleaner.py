@@ -5,35 +5,89 @@ Run格式清理器
 清理Word文档中run级别的格式设置，让样式级别的格式能够正常生效
 """
 
+import io
 import os
 import shutil
 from docx import Document
 from docx.oxml.ns import qn
 from config import config
+from docx_passthrough_writer import save_document, save_document_bytes, read_source_bytes
+from stage_metrics import StageMetrics, metrics_path_for
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('run_format_cleaner')
+
+# run的rPr中需要清理的格式元素（字体、字号、加粗、斜体、下划线）
+RUN_FORMAT_TAGS = ('rFonts', 'sz', 'szCs', 'b', 'bCs', 'i', 'iCs', 'u')
+RUN_FORMAT_ELEMENTS = tuple(qn(f'w:{tag}') for tag in RUN_FORMAT_TAGS)
 
 class RunFormatCleaner:
-    def __init__(self):
+    def __init__(self, metrics=None):
         self.cleaned_runs = 0
         self.total_runs = 0
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
     
     def clean_document_runs(self, input_path, output_path):
         """
         清理文档中所有run级别的格式设置
         """
         try:
-            print(f"=== 清理文档run格式: {input_path} ===")
+            logger.info(f"=== 清理文档run格式: {input_path} ===")
             
             # 加载文档
-            doc = Document(input_path)
+            with self.metrics.stage('load'):
+                doc = Document(input_path)
+            
+            # 清理已加载的文档
+            self.clean_document(doc)
+            
+            # 保存清理后的文档（未修改的图片等成员直通复制）
+            with self.metrics.stage('save'):
+                save_document(doc, output_path, source=input_path)
+            
+            logger.info(f"清理后的文档已保存到: {output_path}")
+            
+            return True
+        
+        except Exception as e:
+            logger.error(f"清理文档run格式时出错: {e}")
+            return False
+    
+    def clean_document_bytes(self, data):
+        """
+        在内存中清理run格式：data为.docx的bytes或文件对象，返回清理后文档的bytes，不读写任何文件
+        失败时返回None
+        """
+        try:
+            source = read_source_bytes(data)
+            with self.metrics.stage('load', input_bytes=len(source)):
+                doc = Document(io.BytesIO(source))
             
-            # 重置计数器
-            self.cleaned_runs = 0
-            self.total_runs = 0
+            self.clean_document(doc)
             
+            with self.metrics.stage('save'):
+                return save_document_bytes(doc, source)
+        
+        except Exception as e:
+            logger.error(f"清理文档run格式时出错: {e}")
+            return None
+    
+    def clean_document(self, doc):
+        """
+        清理已加载文档（内存中的Document对象）的run级别格式设置，不读写文件
+        返回清理的run数
+        """
+        # 重置计数器
+        self.cleaned_runs = 0
+        self.total_runs = 0
+        
+        with self.metrics.stage('run_cleaning') as counts:
             # 遍历所有段落
             for para_idx, paragraph in enumerate(doc.paragraphs):
-                if paragraph.text.strip():  # 只处理有内容的段落
-                    print(f"处理段落{para_idx + 1}: {paragraph.text[:50]}...")
+                text = paragraph.text
+                if text.strip():  # 只处理有内容的段落
+                    logger.debug("处理段落%d: %s...", para_idx + 1, text[:50])
                     
                     # 清理段落中的所有run
                     for run_idx, run in enumerate(paragraph.runs):
@@ -42,109 +96,35 @@ class RunFormatCleaner:
                             if self._clean_run_format(run):
                                 self.cleaned_runs += 1
             
-            # 保存清理后的文档
-            doc.save(output_path)
-            
-            print(f"\n=== 清理完成 ===")
-            print(f"总run数: {self.total_runs}")
-            print(f"清理的run数: {self.cleaned_runs}")
-            print(f"清理后的文档已保存到: {output_path}")
-            
-            return True
-            
-        except Exception as e:
-            print(f"清理文档run格式时出错: {e}")
-            return False
+            counts['runs'] = self.total_runs
+            counts['cleaned_runs'] = self.cleaned_runs
+        
+        logger.summary('run_cleaning', f"清理run格式完成: 总run数 {self.total_runs}，清理的run数 {self.cleaned_runs}",
+                       runs=self.total_runs, cleaned_runs=self.cleaned_runs)
+        
+        return self.cleaned_runs
     
     def _clean_run_format(self, run):
         """
-        清理单个run的格式设置
+        清理单个run的格式设置：删除rPr中RUN_FORMAT_TAGS列出的元素（与流式清理器相同），rPr为空时一并删除
         """
         cleaned = False
         
         try:
-            # 清理基本字体格式
-            if hasattr(run, 'font'):
-                font = run.font
-                
-                # 清理字体名称
-                if font.name is not None:
-                    font.name = None
-                    cleaned = True
-                
-                # 清理字体大小
-                if font.size is not None:
-                    font.size = None
-                    cleaned = True
-                
-                # 清理粗体设置
-                if font.bold is not None:
-                    font.bold = None
-                    cleaned = True
-                
-                # 清理斜体设置
-                if font.italic is not None:
-                    font.italic = None
-                    cleaned = True
-                
-                # 清理下划线设置
-                if font.underline is not None:
-                    font.underline = None
-                    cleaned = True
-            
-            # 清理XML级别的字体设置
-            if hasattr(run, '_element'):
-                run_element = run._element
-                rpr = run_element.find(qn('w:rPr'))
-                if rpr is not None:
-                    # 查找并移除rFonts元素
-                    rfonts = rpr.find(qn('w:rFonts'))
-                    if rfonts is not None:
-                        rpr.remove(rfonts)
-                        cleaned = True
-                    
-                    # 查找并移除字体大小设置
-                    sz = rpr.find(qn('w:sz'))
-                    if sz is not None:
-                        rpr.remove(sz)
+            run_element = run._element
+            rpr = run_element.find(qn('w:rPr'))
+            if rpr is not None:
+                for child in list(rpr):
+                    if child.tag in RUN_FORMAT_ELEMENTS:
+                        rpr.remove(child)
                         cleaned = True
-                    
-                    # 查找并移除复杂字体大小设置
-                    szcs = rpr.find(qn('w:szCs'))
-                    if szcs is not None:
-                        rpr.remove(szcs)
-                        cleaned = True
-                    
-                    # 查找并移除粗体设置
-                    b = rpr.find(qn('w:b'))
-                    if b is not None:
-                        rpr.remove(b)
-                        cleaned = True
-                    
-                    # 查找并移除复杂粗体设置
-                    bcs = rpr.find(qn('w:bCs'))
-                    if bcs is not None:
-                        rpr.remove(bcs)
-                        cleaned = True
-                    
-                    # 查找并移除斜体设置
-                    i = rpr.find(qn('w:i'))
-                    if i is not None:
-                        rpr.remove(i)
-                        cleaned = True
-                    
-                    # 查找并移除复杂斜体设置
-                    ics = rpr.find(qn('w:iCs'))
-                    if ics is not None:
-                        rpr.remove(ics)
-                        cleaned = True
-                    
-                    # 如果rPr元素为空，则移除它
-                    if len(rpr) == 0:
-                        run_element.remove(rpr)
+                
+                # 如果rPr元素为空，则移除它
+                if len(rpr) == 0:
+                    run_element.remove(rpr)
         
         except Exception as e:
-            print(f"清理run格式时出错: {e}")
+            logger.error(f"清理run格式时出错: {e}")
         
         return cleaned
     
@@ -154,7 +134,7 @@ class RunFormatCleaner:
         """
         # 验证测试文档是否存在
         if not os.path.exists(config.TEST_DOCUMENT):
-            print(f"错误：找不到测试文档 {config.TEST_DOCUMENT}")
+            logger.error(f"错误：找不到测试文档 {config.TEST_DOCUMENT}")
             return False
         
         # 确保输出目录存在
@@ -167,7 +147,7 @@ class RunFormatCleaner:
         success = self.clean_document_runs(config.TEST_DOCUMENT, clean_doc_path)
         
         if success:
-            print(f"\n清理后的测试文档已创建: {clean_doc_path}")
+            logger.info(f"清理后的测试文档已创建: {clean_doc_path}")
             return clean_doc_path
         else:
             return None
@@ -176,12 +156,17 @@ def main():
     """
     主函数
     """
-    cleaner = RunFormatCleaner()
+    configure_logging()
+    metrics = StageMetrics()
+    cleaner = RunFormatCleaner(metrics)
     
     # 创建清理后的测试文档
     clean_doc_path = cleaner.create_clean_test_document()
     
     if clean_doc_path:
+        # 分阶段指标保存在清理后的文档旁边
+        metrics.context = {'input': config.TEST_DOCUMENT, 'output': clean_doc_path}
+        print(f"分阶段指标已保存到: {metrics.save(metrics_path_for(clean_doc_path))}")
         print("\n建议：")
         print("1. 使用清理后的测试文档重新运行格式应用")
         print("2. 或者将清理后的文档替换原始测试文档")
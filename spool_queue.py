@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于共享目录的格式化任务队列
+功能：多台机器挂载同一个（NFS）目录即可横向扩展批量格式化，无需消息中间件
+  incoming/    待处理的文档（submit提交，先写临时文件再重命名，保证只出现完整文件）
+  processing/  已领取的文档和租约文件（通过原子重命名领取，只有一个工作进程能成功）
+  done/        处理成功：原文档、格式化后的文档、验证报告和分阶段指标
+  failed/      处理失败：原文档、错误信息（和已生成的验证报告）
+工作进程处理期间定期续租；租约过期（节点崩溃或失联）的文档由其他工作进程收回重新排队，
+超过最大尝试次数后移入failed/。租约按各节点的系统时间判断，各节点需保持时钟同步
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import socket
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from config import config
+from format_pipeline import FormatPipeline
+from template_profile_cache import TemplateProfileCache
+from batch_format_runner import summarize_validation
+from stage_metrics import StageMetrics
+from format_logging import get_logger, configure_logging, log_context, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('spool_queue')
+
+SPOOL_DIRS = ('incoming', 'processing', 'done', 'failed')
+
+# 已领取文档的文件名：<领取标识>__<排队文件名>
+CLAIM_SEPARATOR = '__'
+
+# 重新排队的任务在文件名中记录已尝试次数：<任务名主干>.attempt<N>.docx，重新排队只需一次原子重命名
+# 提交的任务名都以 -<8位十六进制>.docx 结尾，不会与该格式混淆
+ATTEMPT_NAME_PATTERN = re.compile(r'^(?P<stem>.+)\.attempt(?P<attempts>\d+)\.docx$')
+
+def _queued_name(name, attempts):
+    """
+    任务在incoming/中的文件名（带上已尝试次数）
+    """
+    if not attempts:
+        return name
+    return f"{os.path.splitext(name)[0]}.attempt{attempts}.docx"
+
+def _parse_queued_name(queued_name):
+    """
+    从排队文件名中解析出任务名和已尝试次数
+    """
+    match = ATTEMPT_NAME_PATTERN.match(queued_name)
+    if match is None:
+        return queued_name, 0
+    return f"{match.group('stem')}.docx", int(match.group('attempts'))
+
+class LeaseLostError(Exception):
+    """租约已被其他工作进程收回"""
+
+def _write_json_atomic(path, data):
+    """
+    先写临时文件再重命名，其他节点不会读到写了一半的文件
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class SpoolJob:
+    def __init__(self, name, claim_id, path, attempt):
+        """
+        name: 任务名（提交时的文件名，不含尝试次数）
+        claim_id: 本次领取的标识，processing中的文件名为 <claim_id>__<排队文件名>
+        attempt: 第几次尝试处理
+        """
+        self.name = name
+        self.claim_id = claim_id
+        self.path = path
+        self.attempt = attempt
+        self.stem = os.path.splitext(name)[0]
+        self.lease_path = f"{path}.lease"
+        # 处理过程中生成的文件先放在工作目录，完成后随原文档一起移走
+        self.work_dir = f"{path}.work"
+
+class SpoolQueue:
+    def __init__(self, spool_dir=None, lease_seconds=None, max_attempts=None):
+        self.spool_dir = spool_dir or config.SPOOL_DIR
+        self.lease_seconds = lease_seconds or config.SPOOL_LEASE_SECONDS
+        self.max_attempts = max_attempts or config.SPOOL_MAX_ATTEMPTS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        for name in SPOOL_DIRS:
+            os.makedirs(self.dir(name), exist_ok=True)
+    
+    def dir(self, name):
+        return os.path.join(self.spool_dir, name)
+    
+    def submit(self, input_path):
+        """
+        提交文档：复制到incoming/，任务名加短标识避免不同节点提交的同名文档冲突
+        返回任务名
+        """
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        name = f"{stem}-{uuid.uuid4().hex[:8]}.docx"
+        temp_path = os.path.join(self.dir('incoming'), f".{name}.tmp")
+        shutil.copyfile(input_path, temp_path)
+        os.replace(temp_path, os.path.join(self.dir('incoming'), name))
+        return name
+    
+    def pending_jobs(self):
+        """
+        incoming/中的排队文件名，按提交时间先后排序（忽略临时文件和Word临时文件）
+        """
+        entries = []
+        with os.scandir(self.dir('incoming')) as it:
+            for entry in it:
+                if entry.name.endswith('.docx') and not entry.name.startswith(('.', '~$')):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name))
+                    except FileNotFoundError:
+                        continue
+        return [name for _, name in sorted(entries)]
+    
+    def claim_next(self):
+        """
+        领取下一个任务：将文档从incoming/重命名到processing/（原子操作，并发领取时只有一个成功），
+        随后写入租约；没有可领取的任务时返回None
+        """
+        for queued_name in self.pending_jobs():
+            claim_id = uuid.uuid4().hex[:12]
+            path = os.path.join(self.dir('processing'), f"{claim_id}{CLAIM_SEPARATOR}{queued_name}")
+            try:
+                os.rename(os.path.join(self.dir('incoming'), queued_name), path)
+            except FileNotFoundError:
+                # 已被其他工作进程领取
+                continue
+            
+            name, attempts = _parse_queued_name(queued_name)
+            job = SpoolJob(name, claim_id, path, attempts + 1)
+            self.renew_lease(job, claimed=True)
+            return job
+        return None
+    
+    def renew_lease(self, job, claimed=False):
+        """
+        写入或续租：文档已不在processing/中（被收回）时抛出LeaseLostError
+        写入后再检查一次，期间被收回时删除刚写入的租约，不留下孤立的租约文件
+        """
+        if not os.path.exists(job.path):
+            raise LeaseLostError(job.name)
+        
+        now = time.time()
+        lease = _read_json(job.lease_path) if not claimed else None
+        _write_json_atomic(job.lease_path, {
+            'job': job.name,
+            'claim_id': job.claim_id,
+            'owner': self.owner,
+            'attempt': job.attempt,
+            'claimed_at': lease.get('claimed_at', now) if lease else now,
+            'renewed_at': now,
+            'expires_at': now + self.lease_seconds
+        })
+        if not os.path.exists(job.path):
+            try:
+                os.remove(job.lease_path)
+            except FileNotFoundError:
+                pass
+            raise LeaseLostError(job.name)
+    
+    @contextmanager
+    def hold_lease(self, job):
+        """
+        在with语句范围内由后台线程定期续租（每个租期续三次）
+        """
+        stop = threading.Event()
+        lost = threading.Event()
+        
+        def keep_alive():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew_lease(job)
+                except LeaseLostError:
+                    logger.warning(f"任务 {job.name} 的租约已被收回")
+                    lost.set()
+                    return
+                except OSError as e:
+                    logger.warning(f"续租任务 {job.name} 时出错: {e}")
+        
+        thread = threading.Thread(target=keep_alive, name=f"lease-{job.claim_id}", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+    
+    def _finish(self, job, target_dir, extra=None):
+        """
+        将原文档和工作目录中的文件移入done/或failed/
+        先移动原文档：它只在领取者仍持有任务时才存在于processing/中，移动成功即确认了所有权
+        """
+        try:
+            os.rename(job.path, os.path.join(self.dir(target_dir), job.name))
+        except FileNotFoundError:
+            self.discard(job)
+            raise LeaseLostError(job.name)
+        
+        moved = []
+        if os.path.isdir(job.work_dir):
+            for name in sorted(os.listdir(job.work_dir)):
+                os.replace(os.path.join(job.work_dir, name), os.path.join(self.dir(target_dir), name))
+                moved.append(name)
+        if extra:
+            name = f"{job.stem}.{target_dir}.json"
+            _write_json_atomic(os.path.join(self.dir(target_dir), name), extra)
+            moved.append(name)
+        
+        self.discard(job)
+        return moved
+    
+    def discard(self, job):
+        """
+        删除任务的工作目录和租约文件
+        """
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        try:
+            os.remove(job.lease_path)
+        except FileNotFoundError:
+            pass
+    
+    def complete(self, job, result):
+        """
+        处理成功：原文档、格式化后的文档和验证报告一起移入done/
+        """
+        return self._finish(job, 'done', result)
+    
+    def fail(self, job, error):
+        """
+        处理失败：原文档、错误信息（和已生成的验证报告）一起移入failed/
+        """
+        return self._finish(job, 'failed', {
+            'job': job.name,
+            'owner': self.owner,
+            'attempt': job.attempt,
+            'failed_at': datetime.now().isoformat(),
+            'error': error
+        })
+    
+    def release(self, job):
+        """
+        主动归还任务（工作进程停止时），不计入尝试次数
+        """
+        self._requeue(job.path, job.name, job.attempt - 1)
+        self.discard(job)
+    
+    def _requeue(self, path, name, attempts):
+        os.rename(path, os.path.join(self.dir('incoming'), _queued_name(name, attempts)))
+    
+    def reclaim_stale(self):
+        """
+        收回租约已过期的任务：未超过最大尝试次数的重新放回incoming/，否则移入failed/
+        领取后还没来得及写租约就崩溃的任务，按文件状态变化时间判断是否过期
+        返回收回的任务数
+        """
+        now = time.time()
+        reclaimed = 0
+        with os.scandir(self.dir('processing')) as it:
+            entries = [entry for entry in it if entry.name.endswith('.docx') and CLAIM_SEPARATOR in entry.name]
+        
+        for entry in entries:
+            claim_id, queued_name = entry.name.split(CLAIM_SEPARATOR, 1)
+            name, attempts = _parse_queued_name(queued_name)
+            lease = _read_json(f"{entry.path}.lease")
+            try:
+                if lease is not None:
+                    if lease.get('expires_at', 0) > now:
+                        continue
+                elif entry.stat().st_ctime + self.lease_seconds > now:
+                    continue
+            except FileNotFoundError:
+                continue
+            
+            job = SpoolJob(name, claim_id, entry.path, (lease or {}).get('attempt', attempts + 1))
+            owner = (lease or {}).get('owner', '未知')
+            try:
+                if job.attempt >= self.max_attempts:
+                    # 未完成的输出不可信，不随原文档移入failed/
+                    shutil.rmtree(job.work_dir, ignore_errors=True)
+                    self._finish(job, 'failed', {
+                        'job': name,
+                        'owner': owner,
+                        'attempt': job.attempt,
+                        'failed_at': datetime.now().isoformat(),
+                        'error': f"租约过期次数达到上限 {self.max_attempts}（最后持有者 {owner}）"
+                    })
+                    logger.warning(f"任务 {name} 已达到最大尝试次数，移入failed/")
+                else:
+                    self._requeue(entry.path, name, job.attempt)
+                    self.discard(job)
+                    logger.warning(f"收回租约已过期的任务 {name}（持有者 {owner}，第 {job.attempt} 次尝试）")
+                reclaimed += 1
+            except (FileNotFoundError, LeaseLostError):
+                # 其他工作进程已收回或持有者刚好完成
+                continue
+        return reclaimed
+    
+    def status(self):
+        """
+        各目录的任务数和当前租约
+        """
+        counts = {}
+        for name in SPOOL_DIRS:
+            counts[name] = sum(1 for item in os.listdir(self.dir(name))
+                               if item.endswith('.docx') and not item.startswith('.')
+                               and (name != 'done' or not item.endswith('_格式化后.docx')))
+        
+        now = time.time()
+        leases = []
+        for item in sorted(os.listdir(self.dir('processing'))):
+            if item.endswith('.lease'):
+                lease = _read_json(os.path.join(self.dir('processing'), item))
+                if lease:
+                    lease['expires_in_seconds'] = round(lease.get('expires_at', now) - now, 1)
+                    leases.append(lease)
+        return {'spool_dir': self.spool_dir, 'counts': counts, 'leases': leases}
+
+class SpoolWorker:
+    def __init__(self, queue, format_info_path=None, template_path=None, validate=True, poll_seconds=None,
+                 coalesce_runs=None, slim_xml=None, used_styles_only=None):
+        self.queue = queue
+        self.validate = validate
+        self.poll_seconds = poll_seconds or config.SPOOL_POLL_SECONDS
+        if format_info_path is None and template_path is None:
+            format_info_path = config.DYNAMIC_FORMAT_INFO
+        self.pipeline = FormatPipeline(format_info_path, template_path, metrics=StageMetrics(),
+                                       coalesce_runs=coalesce_runs, slim_xml=slim_xml,
+                                       used_styles_only=used_styles_only)
+        self.processed = 0
+        self.failed = 0
+    
+    def process_job(self, job):
+        """
+        处理一个已领取的任务，结果连同验证报告移入done/或failed/
+        """
+        os.makedirs(job.work_dir, exist_ok=True)
+        output_path = os.path.join(job.work_dir, f"{job.stem}_格式化后.docx")
+        report_path = os.path.join(job.work_dir, f"{job.stem}_验证报告.json")
+        
+        with log_context(doc_id=job.name):
+            logger.info(f"开始处理任务 {job.name}（第 {job.attempt} 次尝试）")
+            start = time.perf_counter()
+            with self.queue.hold_lease(job) as lost:
+                report = self.pipeline.process_document(job.path, output_path, report_path, validate=self.validate)
+            duration = round(time.perf_counter() - start, 3)
+            
+            if lost.is_set():
+                self.queue.discard(job)
+                raise LeaseLostError(job.name)
+            
+            if report is None:
+                self.queue.fail(job, '流水线处理失败')
+                self.failed += 1
+                logger.error(f"任务 {job.name} 处理失败，已移入failed/")
+                return False
+            
+            self.queue.complete(job, {
+                'job': job.name,
+                'owner': self.queue.owner,
+                'attempt': job.attempt,
+                'completed_at': datetime.now().isoformat(),
+                'duration_seconds': duration,
+                'output': f"{job.stem}_格式化后.docx",
+                'report': f"{job.stem}_验证报告.json" if self.validate else None,
+                'validation': summarize_validation(report) if report else None
+            })
+            self.processed += 1
+            logger.summary('spool_job', f"任务 {job.name} 已完成（{duration}s）", duration_seconds=duration)
+            return True
+    
+    def run(self, once=False, max_jobs=None):
+        """
+        工作循环：收回过期租约 → 领取任务 → 处理；队列为空时按轮询间隔等待
+        once=True时处理完当前所有任务即退出
+        """
+        if not self.pipeline.load():
+            logger.error("错误：工作进程无法加载格式信息")
+            return False
+        
+        logger.info(f"工作进程 {self.queue.owner} 已启动，队列目录: {self.queue.spool_dir}")
+        job = None
+        try:
+            while max_jobs is None or self.processed + self.failed < max_jobs:
+                self.queue.reclaim_stale()
+                job = self.queue.claim_next()
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(self.poll_seconds)
+                    continue
+                
+                try:
+                    self.process_job(job)
+                except LeaseLostError:
+                    logger.warning(f"任务 {job.name} 的租约已丢失，放弃处理结果")
+                job = None
+        except KeyboardInterrupt:
+            if job is not None:
+                logger.info(f"正在归还任务 {job.name}")
+                try:
+                    self.queue.release(job)
+                except OSError as e:
+                    logger.error(f"归还任务 {job.name} 时出错: {e}")
+        
+        logger.summary('spool_worker', f"工作进程 {self.queue.owner} 退出: 成功 {self.processed}，失败 {self.failed}",
+                       processed=self.processed, failed=self.failed)
+        return True
+
+def _run_worker(spool_dir, format_info_path, template_path, validate, lease_seconds, max_attempts,
+                poll_seconds, once, max_jobs, log_level, log_json, coalesce_runs=None, slim_xml=None,
+                used_styles_only=None):
+    """
+    工作进程入口（-j大于1时每个子进程运行一个工作循环）
+    """
+    configure_logging(log_level, json_format=log_json)
+    queue = SpoolQueue(spool_dir, lease_seconds, max_attempts)
+    worker = SpoolWorker(queue, format_info_path, template_path, validate, poll_seconds,
+                         coalesce_runs=coalesce_runs, slim_xml=slim_xml, used_styles_only=used_styles_only)
+    worker.run(once=once, max_jobs=max_jobs)
+
+def main():
+    """
+    主函数：提交任务、启动工作进程或查看队列状态
+    """
+    parser = argparse.ArgumentParser(description="基于共享目录的格式化任务队列")
+    parser.add_argument('--spool-dir', default=config.SPOOL_DIR, help="队列目录（多台机器共享同一目录）")
+    add_logging_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    submit_parser = subparsers.add_parser('submit', help="提交文档到incoming/")
+    submit_parser.add_argument('inputs', nargs='+', help="文档、目录或通配符")
+    
+    worker_parser = subparsers.add_parser('worker', help="启动工作进程")
+    worker_parser.add_argument('--template', default=None, help="格式模板文档（默认使用格式信息中记录的模板）")
+    worker_parser.add_argument('--format-info', default=None, help="格式信息文件（只指定模板时使用模板格式缓存）")
+    worker_parser.add_argument('-j', '--workers', type=int, default=1, help="本节点的工作进程数")
+    worker_parser.add_argument('--lease-seconds', type=float, default=config.SPOOL_LEASE_SECONDS, help="租期（秒）")
+    worker_parser.add_argument('--max-attempts', type=int, default=config.SPOOL_MAX_ATTEMPTS,
+                               help="租约过期后最多重试的次数")
+    worker_parser.add_argument('--poll-seconds', type=float, default=config.SPOOL_POLL_SECONDS, help="队列为空时的轮询间隔")
+    worker_parser.add_argument('--once', action='store_true', help="处理完当前所有任务后退出")
+    worker_parser.add_argument('--max-jobs', type=int, default=None, help="每个工作进程最多处理的任务数")
+    worker_parser.add_argument('--no-validate', action='store_true', help="跳过格式验证")
+    worker_parser.add_argument('--coalesce-runs', action='store_true', default=None,
+                               help="清理后合并格式相同的相邻run")
+    worker_parser.add_argument('--slim-xml', action='store_true', default=None,
+                               help="加载前删除修订标识、校对标记等不影响排版的XML")
+    worker_parser.add_argument('--used-styles-only', action='store_true', default=None,
+                               help="只应用文档实际使用的样式（及其基础样式链）")
+    
+    subparsers.add_parser('status', help="查看各目录的任务数和当前租约")
+    
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    if args.command == 'submit':
+        from batch_format_runner import collect_input_documents
+        queue = SpoolQueue(args.spool_dir)
+        documents = collect_input_documents(args.inputs)
+        if not documents:
+            print("错误：未找到需要提交的.docx文档")
+            return
+        for path in documents:
+            print(f"已提交: {path} -> {queue.submit(path)}")
+        return
+    
+    if args.command == 'status':
+        print(json.dumps(SpoolQueue(args.spool_dir).status(), ensure_ascii=False, indent=2))
+        return
+    
+    if args.format_info and not os.path.exists(args.format_info):
+        print(f"错误：找不到格式信息文件 {args.format_info}")
+        print("请先运行 dynamic_format_extractor.py 提取格式信息")
+        return
+    
+    if args.template and not args.format_info:
+        # 预热模板格式缓存，避免多个工作进程同时提取
+        if TemplateProfileCache().get_profile(args.template) is None:
+            return
+    
+    worker_args = (args.spool_dir, args.format_info, args.template, not args.no_validate,
+                   args.lease_seconds, args.max_attempts, args.poll_seconds, args.once, args.max_jobs,
+                   args.log_level, args.log_json, args.coalesce_runs, args.slim_xml, args.used_styles_only)
+    if args.workers <= 1:
+        _run_worker(*worker_args)
+        return
+    
+    processes = [multiprocessing.Process(target=_run_worker, args=worker_args) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段性能指标
+功能：记录每个处理阶段（加载、文档默认设置、样式应用、页眉页脚、清除字体、保存、验证等）的
+墙钟时间、CPU时间、tracemalloc峰值内存和处理条目数，并输出为机器可读的JSON
+"""
+
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from format_logging import get_logger, log_context
+
+logger = get_logger('stage_metrics')
+
+class StageMetrics:
+    def __init__(self, enabled=True, trace_memory=False):
+        """
+        enabled: 是否记录（未启用时stage()不做任何计时，供各组件默认使用）
+        trace_memory: 是否用tracemalloc记录峰值内存（开启后处理速度会明显下降）
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.stages = []
+        self.context = {}
+        self._stack = []
+        self._started_tracing = False
+    
+    @contextmanager
+    def stage(self, name, **counts):
+        """
+        记录一个阶段；with语句得到该阶段的计数字典，可在阶段内补充处理条目数
+        阶段可以嵌套，嵌套阶段记录在父阶段的stages中
+        """
+        counts = dict(counts)
+        # 阶段名称同时作为日志的结构化字段
+        with log_context(stage=name):
+            if not self.enabled:
+                yield counts
+                return
+            
+            record = {'name': name, 'counts': counts}
+            parent = self._stack[-1] if self._stack else None
+            
+            memory_start = 0
+            if self.trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                memory_start, peak = tracemalloc.get_traced_memory()
+                # 重置峰值前先把当前峰值计入父阶段，避免嵌套阶段丢失父阶段的峰值
+                if parent is not None:
+                    parent['_peak'] = max(parent['_peak'], peak)
+                tracemalloc.reset_peak()
+                record['_peak'] = memory_start
+            
+            self._stack.append(record)
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                yield counts
+            finally:
+                record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+                record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+                self._stack.pop()
+                
+                if self.trace_memory:
+                    memory_end, peak = tracemalloc.get_traced_memory()
+                    peak = max(peak, record.pop('_peak'))
+                    record['peak_memory_bytes'] = peak - memory_start
+                    record['memory_delta_bytes'] = memory_end - memory_start
+                    if parent is not None:
+                        parent['_peak'] = max(parent['_peak'], peak)
+                
+                if parent is not None:
+                    parent.setdefault('stages', []).append(record)
+                else:
+                    self.stages.append(record)
+    
+    def totals(self):
+        """
+        顶层阶段的总墙钟时间和CPU时间
+        """
+        return {
+            'wall_seconds': round(sum(stage['wall_seconds'] for stage in self.stages), 6),
+            'cpu_seconds': round(sum(stage['cpu_seconds'] for stage in self.stages), 6)
+        }
+    
+    def to_dict(self):
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'trace_memory': self.trace_memory,
+            'context': self.context,
+            'totals': self.totals(),
+            'stages': self.stages
+        }
+    
+    def reset(self):
+        """
+        清空已记录的阶段（同一实例处理下一个文档前调用）
+        """
+        self.stages = []
+        self.context = {}
+        self._stack = []
+    
+    def close(self):
+        """
+        停止由本实例启动的内存跟踪
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+    
+    def save(self, output_path):
+        """
+        将指标写入JSON文件
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return output_path
+    
+    def print_summary(self):
+        """
+        输出各阶段耗时摘要
+        """
+        logger.info("=== 阶段耗时 ===")
+        for stage in self.stages:
+            self._print_stage(stage, 0)
+    
+    def _print_stage(self, stage, level):
+        line = f"{'  ' * level}{stage['name']}: 墙钟 {stage['wall_seconds']:.3f}s, CPU {stage['cpu_seconds']:.3f}s"
+        if 'peak_memory_bytes' in stage:
+            line += f", 峰值内存 {stage['peak_memory_bytes'] / 1024 / 1024:.1f}MB"
+        if stage['counts']:
+            line += f", {stage['counts']}"
+        logger.info(line)
+        for child in stage.get('stages', []):
+            self._print_stage(child, level + 1)
+
+def metrics_path_for(output_path):
+    """
+    输出文档旁边的指标文件路径：xxx.docx -> xxx.metrics.json
+    """
+    return f"{os.path.splitext(output_path)[0]}.metrics.json"
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式Run格式清理器
+功能：不构建python-docx对象树，直接用lxml iterparse逐块流式处理word/document.xml，
+删除run级别的字体、字号、加粗、斜体等格式设置，处理完的节点立即释放，内存占用与文档长度无关
+其他zip成员按原始压缩数据直通复制
+"""
+
+import os
+import argparse
+import zipfile
+from lxml import etree
+from docx.oxml.ns import qn
+from config import config
+from docx_passthrough_writer import copy_member_raw
+from run_format_cleaner import RUN_FORMAT_TAGS
+from format_logging import get_logger, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('streaming_run_cleaner')
+
+DOCUMENT_PART = 'word/document.xml'
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+
+def _strip_root_namespaces(data, root_nsmap):
+    """
+    删除块元素开始标签中与根元素重复的命名空间声明（根元素已声明，块内无需重复）
+    """
+    head_end = data.index(b'>')
+    head = data[:head_end]
+    for prefix, uri in root_nsmap.items():
+        if prefix is None:
+            declaration = f' xmlns="{uri}"'.encode('utf-8')
+        else:
+            declaration = f' xmlns:{prefix}="{uri}"'.encode('utf-8')
+        head = head.replace(declaration, b'', 1)
+    return head + data[head_end:]
+
+def _start_tag(element, root_nsmap, is_root, process_container=None):
+    """
+    序列化容器元素的开始标签（不含子元素）
+    """
+    shallow = etree.Element(element.tag, nsmap=element.nsmap)
+    for name, value in element.attrib.items():
+        shallow.set(name, value)
+    if process_container is not None:
+        process_container(shallow)
+    
+    data = etree.tostring(shallow, encoding='UTF-8', xml_declaration=False)
+    if not is_root:
+        data = _strip_root_namespaces(data, root_nsmap)
+    # 空元素序列化为<x/>，改为开始标签<x>
+    return data[:-2] + b'>'
+
+def _end_tag(element):
+    qname = etree.QName(element)
+    if element.prefix:
+        return f'</{element.prefix}:{qname.localname}>'.encode('utf-8')
+    return f'</{qname.localname}>'.encode('utf-8')
+
+def stream_rewrite_xml(source, target, block_depth, process_block, process_container=None):
+    """
+    流式改写XML：深度小于block_depth的元素作为容器只输出开始/结束标签，
+    深度等于block_depth的元素作为块整体交给process_block处理后写出并立即释放
+    source为可读的二进制流，target为可写的二进制流；返回写出的字节数
+    """
+    written = 0
+    depth = 0
+    root_nsmap = {}
+    
+    target.write(XML_DECLARATION)
+    written += len(XML_DECLARATION)
+    
+    for event, element in etree.iterparse(source, events=('start', 'end'), huge_tree=True):
+        if event == 'start':
+            if depth == 0:
+                root_nsmap = dict(element.nsmap)
+            if depth < block_depth:
+                data = _start_tag(element, root_nsmap, depth == 0, process_container)
+                target.write(data)
+                written += len(data)
+            depth += 1
+            continue
+        
+        depth -= 1
+        if depth == block_depth:
+            if process_block(element) is not False:
+                data = etree.tostring(element, encoding='UTF-8', xml_declaration=False, with_tail=False)
+                data = _strip_root_namespaces(data, root_nsmap)
+                target.write(data)
+                written += len(data)
+            
+            # 释放已处理的块以及之前的兄弟节点
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+        elif depth < block_depth:
+            data = _end_tag(element)
+            target.write(data)
+            written += len(data)
+    
+    return written
+
+def rewrite_docx_members(input_path, output_path, rewriters):
+    """
+    改写docx中的部分XML成员：rewriters为 成员名 -> 函数(源流, 目标流) 的映射，
+    其余成员按原始压缩数据直通复制；返回每个被改写成员的(原始大小, 改写后大小)
+    """
+    sizes = {}
+    output_dir = os.path.dirname(os.fspath(output_path)) if isinstance(output_path, (str, os.PathLike)) else ''
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    with zipfile.ZipFile(input_path) as source_zip, \
+            zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+        for info in source_zip.infolist():
+            rewriter = rewriters.get(info.filename)
+            if rewriter is None:
+                copy_member_raw(source_zip, info, target_zip)
+                continue
+            
+            target_info = zipfile.ZipInfo(info.filename, info.date_time)
+            target_info.compress_type = zipfile.ZIP_DEFLATED
+            target_info.external_attr = info.external_attr
+            with source_zip.open(info) as source, \
+                    target_zip.open(target_info, 'w', force_zip64=True) as target:
+                written = rewriter(source, target)
+            sizes[info.filename] = (info.file_size, written)
+    
+    return sizes
+
+class StreamingRunCleaner:
+    def __init__(self, strip_tags=None, clear_paragraph_fonts=False):
+        """
+        strip_tags: 从run的rPr中删除的子元素（默认与RunFormatCleaner一致）
+        clear_paragraph_fonts: 同时清除段落标记rPr和所有run的rFonts（对应应用器的清除段落字体步骤）
+        """
+        self.strip_tags = tuple(qn(f'w:{tag}') for tag in (strip_tags or RUN_FORMAT_TAGS))
+        self.clear_paragraph_fonts = clear_paragraph_fonts
+        self.cleaned_runs = 0
+        self.total_runs = 0
+        self.cleared_paragraph_fonts = 0
+        self.processed_paragraphs = 0
+    
+    def _run_has_text(self, run):
+        for text in run.iterchildren(qn('w:t')):
+            if text.text and text.text.strip():
+                return True
+        return False
+    
+    def _strip_rpr_children(self, parent, tags):
+        """
+        删除parent/rPr中的指定子元素，rPr为空时一并删除；返回是否删除了内容
+        """
+        rpr = parent.find(qn('w:rPr'))
+        if rpr is None:
+            return False
+        
+        removed = False
+        for child in list(rpr):
+            if child.tag in tags:
+                rpr.remove(child)
+                removed = True
+        
+        if len(rpr) == 0:
+            parent.remove(rpr)
+        return removed
+    
+    def _process_block(self, block):
+        """
+        处理body下的一个顶层块；与RunFormatCleaner一致，只处理body下直接的段落
+        """
+        if block.tag != qn('w:p'):
+            return True
+        
+        runs = list(block.iterchildren(qn('w:r')))
+        text_runs = [run for run in runs if self._run_has_text(run)]
+        
+        # 只处理有内容的段落中有内容的run
+        if text_runs:
+            self.processed_paragraphs += 1
+            for run in text_runs:
+                self.total_runs += 1
+                if self._strip_rpr_children(run, self.strip_tags):
+                    self.cleaned_runs += 1
+        
+        if self.clear_paragraph_fonts:
+            rfonts_tag = (qn('w:rFonts'),)
+            ppr = block.find(qn('w:pPr'))
+            if ppr is not None and self._strip_rpr_children(ppr, rfonts_tag):
+                self.cleared_paragraph_fonts += 1
+            for run in runs:
+                self._strip_rpr_children(run, rfonts_tag)
+        
+        return True
+    
+    def clean_document_xml(self, source, target):
+        """
+        流式清理document.xml：source为可读二进制流，target为可写二进制流，返回写出字节数
+        """
+        # w:document(0) > w:body(1) > 段落/表格(2)
+        return stream_rewrite_xml(source, target, 2, self._process_block)
+    
+    def clean_document_runs(self, input_path, output_path):
+        """
+        流式清理文档中所有run级别的格式设置
+        """
+        try:
+            logger.info(f"=== 流式清理文档run格式: {input_path} ===")
+            
+            self.cleaned_runs = 0
+            self.total_runs = 0
+            self.cleared_paragraph_fonts = 0
+            self.processed_paragraphs = 0
+            
+            rewrite_docx_members(input_path, output_path, {DOCUMENT_PART: self.clean_document_xml})
+            
+            logger.summary('run_cleaning',
+                           f"处理段落数: {self.processed_paragraphs}，总run数: {self.total_runs}，清理的run数: {self.cleaned_runs}",
+                           paragraphs=self.processed_paragraphs, runs=self.total_runs, cleaned_runs=self.cleaned_runs)
+            logger.info(f"清理后的文档已保存到: {output_path}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"流式清理文档run格式时出错: {e}")
+            return False
+
+def main():
+    """
+    主函数：流式清理大文档的run格式
+    """
+    parser = argparse.ArgumentParser(description="流式清理docx的run级别格式（适用于超大文档）")
+    parser.add_argument('input', nargs='?', default=config.TEST_DOCUMENT, help="待清理的文档")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "测试文档_清理后.docx"),
+                        help="清理后的文档路径")
+    parser.add_argument('--clear-paragraph-fonts', action='store_true',
+                        help="同时清除段落标记和所有run的rFonts")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    if not os.path.exists(args.input):
+        print(f"错误：找不到文档 {args.input}")
+        return
+    
+    cleaner = StreamingRunCleaner(clear_paragraph_fonts=args.clear_paragraph_fonts)
+    cleaner.clean_document_runs(args.input, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+样式查找索引
+功能：对文档的样式部件建立一次索引，按样式名称、styleId和本地化别名常数时间查找样式
+替代逐个遍历doc.styles（每次遍历都会新建python-docx代理对象）的线性查找
+也用于找出文档实际使用的样式（被引用的样式及其基础样式链）
+"""
+
+from lxml import etree
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+from docx.styles.style import StyleFactory
+
+# 中文版Word中内置样式的本地化名称 -> 界面名称
+LOCALIZED_STYLE_ALIASES = {
+    '正文': 'Normal',
+    '标题': 'Title',
+    '标题 1': 'Heading 1',
+    '标题 2': 'Heading 2',
+    '标题 3': 'Heading 3',
+    '标题 4': 'Heading 4',
+    '标题 5': 'Heading 5',
+    '标题 6': 'Heading 6',
+    '标题 7': 'Heading 7',
+    '标题 8': 'Heading 8',
+    '标题 9': 'Heading 9',
+    '题注': 'Caption',
+    '页眉': 'Header',
+    '页脚': 'Footer',
+    '正文文本': 'Body Text',
+    '正文文本缩进': 'Body Text Indent',
+    '正文首行缩进 2': 'Body Text First Indent 2',
+    '批注文字': 'annotation text',
+    '脚注文本': 'footnote text',
+    '列出段落': 'List Paragraph',
+    '普通(网站)': 'Normal (Web)',
+    'HTML 预设格式': 'HTML Preformatted',
+}
+# 界面名称 -> 本地化名称（目标文档使用本地化名称时，按界面名称也能找到）
+LOCALIZED_STYLE_NAMES = {ui_name: localized for localized, ui_name in LOCALIZED_STYLE_ALIASES.items()}
+
+# 正文中引用样式的元素：段落样式、字符样式、表格样式
+STYLE_REFERENCE_TAGS = (qn('w:pStyle'), qn('w:rStyle'), qn('w:tblStyle'))
+
+# 除正文外可能引用样式的部件
+STORY_RELATIONSHIPS = (RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES, RT.COMMENTS)
+
+def referenced_style_ids(doc):
+    """
+    一次扫描正文、页眉页脚、脚注尾注和批注，返回其中引用的styleId集合
+    """
+    roots = [doc.element]
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in STORY_RELATIONSHIPS:
+            continue
+        part = rel.target_part
+        # python-docx未建模的部件（如脚注）没有element，解析原始XML
+        roots.append(part.element if hasattr(part, 'element') else etree.fromstring(part.blob))
+    
+    style_ids = set()
+    for root in roots:
+        for reference in root.iter(*STYLE_REFERENCE_TAGS):
+            style_id = reference.get(qn('w:val'))
+            if style_id:
+                style_ids.add(style_id)
+    return style_ids
+
+def style_type(style_element):
+    """
+    样式类型，未声明w:type时按段落样式处理（与python-docx一致）
+    """
+    return style_element.type if style_element.type is not None else WD_STYLE_TYPE.PARAGRAPH
+
+class StyleIndex:
+    def __init__(self, doc):
+        """
+        doc可以是Document对象，也可以是样式部件的根元素（w:styles）
+        """
+        self.styles_element = doc.styles.element if hasattr(doc, 'styles') else doc
+        self.by_name = {}
+        self.by_id = {}
+        self.by_alias = {}
+        self.defaults = {}
+        self._proxies = {}
+        
+        for style_element in self.styles_element.findall(qn('w:style')):
+            self._register(style_element)
+    
+    def _register(self, style_element):
+        """
+        将单个w:style元素登记到各个查找表中（名称和styleId以先出现的为准，与python-docx一致）
+        """
+        style_id = style_element.styleId
+        if style_id and style_id not in self.by_id:
+            self.by_id[style_id] = style_element
+        
+        name = style_element.name_val
+        if name:
+            self.by_name.setdefault(BabelFish.internal2ui(name), style_element)
+            self.by_name.setdefault(name, style_element)
+        
+        aliases = style_element.find(qn('w:aliases'))
+        if aliases is not None and aliases.get(qn('w:val')):
+            for alias in aliases.get(qn('w:val')).split(','):
+                if alias.strip():
+                    self.by_alias.setdefault(alias.strip(), style_element)
+        
+        if style_element.default and style_type(style_element) not in self.defaults:
+            self.defaults[style_type(style_element)] = style_element
+    
+    def find_element(self, name):
+        """
+        按名称、styleId、别名依次查找样式元素，再按本地化名称与界面名称的对应关系双向查找，未找到时返回None
+        """
+        style_element = self.by_name.get(name)
+        if style_element is None:
+            style_element = self.by_id.get(name)
+        if style_element is None:
+            style_element = self.by_alias.get(name)
+        if style_element is None and name in LOCALIZED_STYLE_ALIASES:
+            style_element = self.by_name.get(LOCALIZED_STYLE_ALIASES[name])
+        if style_element is None and name in LOCALIZED_STYLE_NAMES:
+            style_element = self.by_name.get(LOCALIZED_STYLE_NAMES[name])
+        return style_element
+    
+    def get(self, name):
+        """
+        按名称查找样式并返回python-docx样式对象（同一样式只创建一次代理对象）
+        """
+        style_element = self.find_element(name)
+        if style_element is None:
+            return None
+        return self._proxy(style_element)
+    
+    def __contains__(self, name):
+        return self.find_element(name) is not None
+    
+    def __len__(self):
+        return len(self.by_id)
+    
+    def _proxy(self, style_element):
+        key = id(style_element)
+        proxy = self._proxies.get(key)
+        if proxy is None:
+            proxy = StyleFactory(style_element)
+            self._proxies[key] = proxy
+        return proxy
+    
+    def add(self, style):
+        """
+        登记新建的样式（样式对象或w:style元素），保持索引与文档一致
+        """
+        style_element = style.element if hasattr(style, 'element') else style
+        self._register(style_element)
+        return style
+    
+    def used_style_ids(self, style_ids):
+        """
+        文档实际使用的样式：被引用的样式加上各类型的默认样式（未引用样式的段落等使用默认样式），
+        再沿w:basedOn取传递闭包；返回styleId集合
+        """
+        pending = [style_id for style_id in style_ids if style_id in self.by_id]
+        pending.extend(style_element.styleId for style_element in self.defaults.values() if style_element.styleId)
+        used = set()
+        while pending:
+            style_id = pending.pop()
+            if style_id in used:
+                continue
+            used.add(style_id)
+            based_on = self.by_id[style_id].basedOn_val
+            if based_on and based_on in self.by_id and based_on not in used:
+                pending.append(based_on)
+        return used
+    
+    def paragraph_styles(self):
+        """
+        按文档顺序返回所有段落样式对象
+        """
+        return [
+            self._proxy(style_element)
+            for style_element in self.styles_element.findall(qn('w:style'))
+            if style_type(style_element) == WD_STYLE_TYPE.PARAGRAPH
+        ]
+    
+    def paragraph_style_element(self, paragraph):
+        """
+        返回段落实际使用的段落样式元素：与python-docx一致，未引用样式或引用无效时使用默认段落样式
+        """
+        style_id = paragraph._p.style
+        style_element = self.by_id.get(style_id) if style_id else None
+        if style_element is None or style_type(style_element) != WD_STYLE_TYPE.PARAGRAPH:
+            style_element = self.defaults.get(WD_STYLE_TYPE.PARAGRAPH)
+        return style_element
+    
+    def paragraph_style_name(self, paragraph):
+        """
+        返回段落样式的界面名称（等同于paragraph.style.name，但不做线性查找）
+        """
+        style_element = self.paragraph_style_element(paragraph)
+        if style_element is None:
+            return None
+        return BabelFish.internal2ui(style_element.name_val)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带类型的样式记录
+功能：只解析一次styles.xml，将每个段落样式自身设置的格式读成带类型的记录
+（字号为半磅整数，间距和缩进为缇(twip)整数，加粗/斜体为布尔值，对齐方式为枚举字符串），
+按数值和容差逐字段比较，不经过python-docx的代理属性，也不做字符串格式化
+验证大量文档时可以只读取styles.xml部件，不解析document.xml
+"""
+
+import io
+import os
+import time
+import zipfile
+import argparse
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.enum.style import WD_STYLE_TYPE
+from style_index import style_type
+from style_resolver import StyleResolver
+from theme_fonts import theme_font_map_for, read_theme_fonts_from_package, THEME_FONT_MAP
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('style_records')
+
+# 记录字段：(报告中的属性名, 来源(rpr/ppr/fonts), 来源中的键, 类型)
+# 类型：text为字体名称，bool为开关属性，enum为枚举值，half_points为半磅，twips为缇，line为行距值
+STYLE_RECORD_FIELDS = (
+    ('ascii_font', 'fonts', 'ascii', 'text'),
+    ('eastasia_font', 'fonts', 'eastAsia', 'text'),
+    ('cs_font', 'fonts', 'cs', 'text'),
+    ('hansi_font', 'fonts', 'hAnsi', 'text'),
+    ('font_size', 'rpr', 'sz', 'half_points'),
+    ('bold', 'rpr', 'b', 'bool'),
+    ('italic', 'rpr', 'i', 'bool'),
+    ('alignment', 'ppr', 'jc', 'enum'),
+    ('line_rule', 'ppr', 'lineRule', 'enum'),
+    ('line_spacing', 'ppr', 'line', 'line'),
+    ('space_before', 'ppr', 'before', 'twips'),
+    ('space_after', 'ppr', 'after', 'twips'),
+    ('first_line_indent', 'ppr', 'firstLine', 'twips'),
+    ('left_indent', 'ppr', 'left', 'twips')
+)
+
+# 各数值类型的默认比较容差（同单位）
+DEFAULT_TOLERANCES = {
+    'half_points': 0,
+    'twips': 1,
+    'line': 1
+}
+
+# 含义相同的对齐方式写法（w:start/w:end为新版写法）
+ALIGNMENT_SYNONYMS = {
+    'start': 'left',
+    'end': 'right'
+}
+
+class StyleRecord:
+    """
+    单个段落样式自身设置的格式，未设置的字段为None
+    首行缩进为负数时表示悬挂缩进
+    """
+    __slots__ = ('style_id', 'name') + tuple(field for field, _, _, _ in STYLE_RECORD_FIELDS)
+    
+    def __init__(self, style_id, name):
+        self.style_id = style_id
+        self.name = name
+        for field, _, _, _ in STYLE_RECORD_FIELDS:
+            setattr(self, field, None)
+    
+    @classmethod
+    def from_resolved(cls, resolved):
+        """
+        由样式继承解析器的解析结果生成记录（只取样式自身的设置，与模板中定义的内容对应）
+        """
+        record = cls(resolved.style_id, resolved.name)
+        sources = {'fonts': resolved.direct_fonts, 'rpr': resolved.own_rpr, 'ppr': resolved.own_ppr}
+        for field, source, key, kind in STYLE_RECORD_FIELDS:
+            value = sources[source].get(key)
+            if kind == 'enum' and value is not None:
+                value = ALIGNMENT_SYNONYMS.get(value, value)
+            setattr(record, field, value)
+        
+        if record.first_line_indent is None and 'hanging' in resolved.own_ppr:
+            record.first_line_indent = -resolved.own_ppr['hanging']
+        return record
+    
+    def to_dict(self):
+        """
+        报告中使用的字典（数值保持原始单位：字号为半磅，间距和缩进为缇）
+        """
+        info = {'style_name': self.name, 'style_id': self.style_id, 'style_type': 'paragraph'}
+        for field, _, _, _ in STYLE_RECORD_FIELDS:
+            info[field] = getattr(self, field)
+        return info
+
+def read_styles_element(source):
+    """
+    读取样式部件的根元素和主题字体映射：source可以是Document对象、.docx路径、.docx的bytes或w:styles元素
+    路径和bytes只读取word/styles.xml和主题部件，不解析文档正文
+    """
+    if hasattr(source, 'styles'):
+        return source.styles.element, theme_font_map_for(source)
+    if hasattr(source, 'tag'):
+        return source, THEME_FONT_MAP
+    
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        table = read_theme_fonts_from_package(archive)
+        return parse_xml(archive.read('word/styles.xml')), table.as_map() if table else THEME_FONT_MAP
+
+def read_style_records(source, style_index=None):
+    """
+    解析一次样式部件，返回 样式名称 -> StyleRecord（只包含段落样式，按文档顺序）
+    """
+    styles_element, theme_font_map = read_styles_element(source)
+    resolver = StyleResolver(styles_element, style_index, theme_font_map)
+    records = {}
+    for style_element in styles_element.findall(qn('w:style')):
+        if style_type(style_element) != WD_STYLE_TYPE.PARAGRAPH:
+            continue
+        resolved = resolver.resolve(style_element)
+        if resolved is not None and resolved.name not in records:
+            records[resolved.name] = StyleRecord.from_resolved(resolved)
+    return records
+
+def _values_match(kind, template_value, formatted_value, tolerances):
+    if formatted_value is None:
+        return False
+    tolerance = tolerances.get(kind)
+    if tolerance is not None:
+        return abs(template_value - formatted_value) <= tolerance
+    return template_value == formatted_value
+
+def compare_style_records(template_records, formatted_records, tolerances=None):
+    """
+    逐字段比较模板和格式化后文档的样式记录，模板中未设置的字段不比较
+    返回结构与FormatValidator.compare_styles相同：样式名称 -> {status, matches, differences}
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    comparison_result = {}
+    
+    for style_name, template_record in template_records.items():
+        formatted_record = formatted_records.get(style_name)
+        if formatted_record is None:
+            comparison_result[style_name] = {
+                'status': 'missing',
+                'matches': [],
+                'differences': [{'property': 'entire_style', 'template_value': 'exists', 'formatted_value': 'missing'}]
+            }
+            continue
+        
+        matches = []
+        differences = []
+        for field, _, _, kind in STYLE_RECORD_FIELDS:
+            template_value = getattr(template_record, field)
+            if template_value is None:
+                continue
+            formatted_value = getattr(formatted_record, field)
+            if _values_match(kind, template_value, formatted_value, tolerances):
+                matches.append(field)
+            else:
+                differences.append({
+                    'property': field,
+                    'template_value': template_value,
+                    'formatted_value': formatted_value,
+                    'unit': kind
+                })
+        
+        comparison_result[style_name] = {
+            'status': 'matched' if not differences else 'different',
+            'matches': matches,
+            'differences': differences
+        }
+    
+    return comparison_result
+
+def summarize_comparison(comparison):
+    """
+    统计匹配、差异和缺少的样式数
+    """
+    counts = {'matched': 0, 'different': 0, 'missing': 0}
+    for result in comparison.values():
+        counts[result['status']] += 1
+    total = sum(counts.values())
+    counts['match_rate'] = round(counts['matched'] / total * 100, 1) if total else None
+    return counts
+
+def main():
+    """
+    主函数：只比较样式部件，快速验证大量格式化后的文档
+    """
+    parser = argparse.ArgumentParser(description="按带类型的样式记录快速验证格式化后的文档")
+    parser.add_argument('template', help="格式模板文档")
+    parser.add_argument('documents', nargs='+', help="格式化后的文档")
+    args = parser.parse_args()
+    configure_logging()
+    
+    template_records = read_style_records(args.template)
+    start = time.perf_counter()
+    for path in args.documents:
+        if not os.path.exists(path):
+            logger.error(f"错误：找不到文档 {path}")
+            continue
+        try:
+            counts = summarize_comparison(compare_style_records(template_records, read_style_records(path)))
+        except Exception as e:
+            logger.error(f"验证文档 {path} 时出错: {e}")
+            continue
+        logger.info(f"{path}: 匹配 {counts['matched']}，差异 {counts['different']}，缺少 {counts['missing']}，"
+                    f"匹配率 {counts['match_rate']}%")
+    
+    elapsed = time.perf_counter() - start
+    logger.info(f"共验证 {len(args.documents)} 个文档，平均每个 {elapsed / len(args.documents) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
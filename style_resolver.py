@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+样式继承解析器
+功能：按 文档默认设置(docDefaults) → 基础样式链 → 样式自身 的顺序解析样式的字体、字号和段落属性
+每个样式只解析一次并按文档缓存，有共同祖先的样式共享祖先的解析结果
+提取器、应用器和验证器通过同一个解析器得到一致的结果
+"""
+
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+from style_index import StyleIndex, style_type
+from theme_fonts import THEME_FONT_MAP, theme_font_map_for
+
+# rFonts中的四个字体槽位
+FONT_SLOTS = ('ascii', 'hAnsi', 'eastAsia', 'cs')
+
+# 字体槽位对应的主题字体属性（注意cs槽位的属性名为w:cstheme）
+THEME_FONT_ATTRS = {
+    'ascii': 'w:asciiTheme',
+    'hAnsi': 'w:hAnsiTheme',
+    'eastAsia': 'w:eastAsiaTheme',
+    'cs': 'w:cstheme'
+}
+
+# 开关类型的run属性（w:b、w:i等，省略w:val表示开启）
+ON_OFF_RUN_PROPERTIES = ('b', 'bCs', 'i', 'iCs', 'caps', 'smallCaps', 'strike', 'vanish')
+
+# 防止basedOn循环引用导致无限递归
+MAX_BASE_DEPTH = 20
+
+def _on_off(element):
+    """
+    解析开关属性：没有w:val或w:val不是0/false/off时为开启
+    """
+    val = element.get(qn('w:val'))
+    return val is None or val.lower() not in ('0', 'false', 'off')
+
+def _int_attr(element, attr):
+    """
+    读取整数属性，缺失或无法解析时返回None
+    """
+    if element is None:
+        return None
+    val = element.get(qn(attr))
+    if val is None:
+        return None
+    try:
+        return int(val)
+    except ValueError:
+        try:
+            return int(float(val))
+        except ValueError:
+            return None
+
+def read_rfonts(rpr):
+    """
+    读取rPr中rFonts的直接字体设置和主题字体设置，返回(直接字体, 主题字体)两个字典
+    """
+    fonts = {}
+    theme_fonts = {}
+    if rpr is None:
+        return fonts, theme_fonts
+    
+    rfonts = rpr.find(qn('w:rFonts'))
+    if rfonts is None:
+        return fonts, theme_fonts
+    
+    for slot in FONT_SLOTS:
+        font = rfonts.get(qn(f'w:{slot}'))
+        if font:
+            fonts[slot] = font
+        theme = rfonts.get(qn(THEME_FONT_ATTRS[slot]))
+        if theme:
+            theme_fonts[slot] = theme
+    return fonts, theme_fonts
+
+def read_rpr(rpr, theme_font_map=None):
+    """
+    将rPr元素解析为带类型的属性字典：
+    字体槽位为字体名称（直接设置优先，其次为解析后的主题字体），sz/szCs为半磅整数，
+    开关属性为布尔值，color为RRGGBB字符串，u为下划线类型
+    """
+    props = {}
+    if rpr is None:
+        return props
+    
+    if theme_font_map is None:
+        theme_font_map = THEME_FONT_MAP
+    
+    fonts, theme_fonts = read_rfonts(rpr)
+    props.update(fonts)
+    for slot, theme in theme_fonts.items():
+        if slot not in props:
+            props[slot] = theme_font_map.get(theme, theme)
+    
+    for tag in ('sz', 'szCs'):
+        size = _int_attr(rpr.find(qn(f'w:{tag}')), 'w:val')
+        if size is not None:
+            props[tag] = size
+    
+    for tag in ON_OFF_RUN_PROPERTIES:
+        element = rpr.find(qn(f'w:{tag}'))
+        if element is not None:
+            props[tag] = _on_off(element)
+    
+    color = rpr.find(qn('w:color'))
+    if color is not None and color.get(qn('w:val')):
+        props['color'] = color.get(qn('w:val'))
+    
+    underline = rpr.find(qn('w:u'))
+    if underline is not None:
+        props['u'] = underline.get(qn('w:val')) or 'single'
+    
+    return props
+
+def read_ppr(ppr):
+    """
+    将pPr元素解析为带类型的属性字典：
+    jc为对齐方式，before/after/left/right/firstLine/hanging为缇(twip)整数，
+    line为行距值（lineRule为auto时以240为单倍行距），lineRule为行距规则
+    """
+    props = {}
+    if ppr is None:
+        return props
+    
+    jc = ppr.find(qn('w:jc'))
+    if jc is not None and jc.get(qn('w:val')):
+        props['jc'] = jc.get(qn('w:val'))
+    
+    spacing = ppr.find(qn('w:spacing'))
+    if spacing is not None:
+        for attr in ('before', 'after', 'line'):
+            value = _int_attr(spacing, f'w:{attr}')
+            if value is not None:
+                props[attr] = value
+        if spacing.get(qn('w:lineRule')):
+            props['lineRule'] = spacing.get(qn('w:lineRule'))
+        elif 'line' in props:
+            props['lineRule'] = 'auto'
+    
+    ind = ppr.find(qn('w:ind'))
+    if ind is not None:
+        for prop, attrs in (('left', ('w:left', 'w:start')), ('right', ('w:right', 'w:end')),
+                            ('firstLine', ('w:firstLine',)), ('hanging', ('w:hanging',))):
+            for attr in attrs:
+                value = _int_attr(ind, attr)
+                if value is not None:
+                    props[prop] = value
+                    break
+    
+    return props
+
+class ResolvedStyle:
+    """
+    单个样式的解析结果
+    direct_fonts: 样式自身rFonts中直接设置的字体
+    own_fonts: 样式自身的字体（直接设置优先，其次为主题字体）
+    chain_rpr/chain_ppr: 沿基础样式链合并后的属性（不含文档默认设置）
+    rpr/ppr: 文档默认设置 → 基础样式链 → 样式自身 合并后的完整属性
+    """
+    __slots__ = ('style_id', 'name', 'type', 'base_id', 'direct_fonts', 'own_fonts',
+                 'own_rpr', 'own_ppr', 'chain_rpr', 'chain_ppr', 'rpr', 'ppr')
+    
+    def __init__(self, style_id, name, type, base_id):
+        self.style_id = style_id
+        self.name = name
+        self.type = type
+        self.base_id = base_id
+
+class StyleResolver:
+    def __init__(self, doc, style_index=None, theme_font_map=None):
+        """
+        doc可以是Document对象，也可以是样式部件的根元素（w:styles）
+        theme_font_map未提供时，Document对象使用其主题部件解析出的主题字体（按文档缓存），
+        只有样式部件时使用默认映射THEME_FONT_MAP
+        """
+        self.style_index = style_index or StyleIndex(doc)
+        self.styles_element = self.style_index.styles_element
+        self.theme_font_map = theme_font_map or theme_font_map_for(doc)
+        self._resolved = {}
+        self._doc_defaults = None
+    
+    def doc_defaults(self):
+        """
+        解析docDefaults中的默认run属性和段落属性（只解析一次）
+        """
+        if self._doc_defaults is None:
+            rpr = ppr = None
+            doc_defaults = self.styles_element.find(qn('w:docDefaults'))
+            if doc_defaults is not None:
+                rpr_default = doc_defaults.find(qn('w:rPrDefault'))
+                if rpr_default is not None:
+                    rpr = rpr_default.find(qn('w:rPr'))
+                ppr_default = doc_defaults.find(qn('w:pPrDefault'))
+                if ppr_default is not None:
+                    ppr = ppr_default.find(qn('w:pPr'))
+            self._doc_defaults = (read_rpr(rpr, self.theme_font_map), read_ppr(ppr))
+        return self._doc_defaults
+    
+    def resolve(self, style):
+        """
+        返回样式的解析结果；style可以是样式对象、w:style元素、样式名称或styleId
+        样式不存在时返回None
+        """
+        style_element = self._style_element(style)
+        if style_element is None:
+            return None
+        return self._resolve_element(style_element, 0)
+    
+    def _style_element(self, style):
+        if style is None:
+            return None
+        if isinstance(style, str):
+            style_element = self.style_index.by_id.get(style)
+            if style_element is None:
+                style_element = self.style_index.find_element(style)
+            return style_element
+        if hasattr(style, 'element'):
+            return style.element
+        return style
+    
+    def _resolve_element(self, style_element, depth):
+        style_id = style_element.styleId
+        key = style_id if style_id else id(style_element)
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            return resolved
+        
+        base_id = style_element.basedOn_val
+        resolved = ResolvedStyle(style_id, BabelFish.internal2ui(style_element.name_val or ''),
+                                 style_type(style_element), base_id)
+        
+        rpr = style_element.find(qn('w:rPr'))
+        resolved.direct_fonts, _ = read_rfonts(rpr)
+        resolved.own_rpr = read_rpr(rpr, self.theme_font_map)
+        resolved.own_fonts = {slot: resolved.own_rpr[slot] for slot in FONT_SLOTS if slot in resolved.own_rpr}
+        resolved.own_ppr = read_ppr(style_element.find(qn('w:pPr')))
+        
+        # 先解析基础样式（已解析的祖先直接复用）
+        base = None
+        if base_id and base_id != style_id and depth < MAX_BASE_DEPTH:
+            base_element = self.style_index.by_id.get(base_id)
+            if base_element is not None:
+                base = self._resolve_element(base_element, depth + 1)
+        
+        if base is not None:
+            resolved.chain_rpr = dict(base.chain_rpr)
+            resolved.chain_ppr = dict(base.chain_ppr)
+        else:
+            resolved.chain_rpr = {}
+            resolved.chain_ppr = {}
+        resolved.chain_rpr.update(resolved.own_rpr)
+        resolved.chain_ppr.update(resolved.own_ppr)
+        
+        default_rpr, default_ppr = self.doc_defaults()
+        resolved.rpr = dict(default_rpr)
+        resolved.rpr.update(resolved.chain_rpr)
+        resolved.ppr = dict(default_ppr)
+        resolved.ppr.update(resolved.chain_ppr)
+        
+        self._resolved[key] = resolved
+        return resolved
+    
+    def base_of(self, resolved):
+        """
+        返回基础样式的解析结果，没有基础样式时返回None
+        """
+        if not resolved.base_id or resolved.base_id == resolved.style_id:
+            return None
+        return self.resolve(resolved.base_id)
+    
+    def invalidate(self):
+        """
+        样式被修改后清除缓存，下次访问时重新解析
+        """
+        self._resolved.clear()
+        self._doc_defaults = None
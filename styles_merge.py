@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+样式部件合并引擎
+功能：把格式模板中的样式定义整体导入目标文档的styles.xml，而不是只按名称和类型新建空样式
+模板和目标文档的w:style各建立一次styleId/名称索引，从需要的样式出发沿w:basedOn、w:link、w:next
+一次线性遍历得到依赖闭包，深拷贝模板定义并按映射改写styleId和引用；
+样式引用的编号定义（w:num及其w:abstractNum）一并复制到目标文档的numbering.xml并重新编号
+同名样式的冲突按策略处理：keep保留目标文档的定义，replace用模板的定义替换（保留目标的styleId）
+"""
+
+import os
+import copy
+import argparse
+from lxml import etree
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+from config import config
+from docx_passthrough_writer import save_document
+from style_index import StyleIndex
+from stage_metrics import StageMetrics
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('styles_merge')
+
+# 同名样式的冲突策略
+MERGE_POLICIES = ('keep', 'replace')
+
+W_STYLE = qn('w:style')
+W_VAL = qn('w:val')
+W_STYLE_ID = qn('w:styleId')
+W_DEFAULT = qn('w:default')
+W_NUM = qn('w:num')
+W_NUM_ID = qn('w:numId')
+W_ABSTRACT_NUM = qn('w:abstractNum')
+W_ABSTRACT_NUM_ID = qn('w:abstractNumId')
+W_NSID = qn('w:nsid')
+W_PSTYLE = qn('w:pStyle')
+W_NUM_ID_MAC_AT_CLEANUP = qn('w:numIdMacAtCleanup')
+
+# 引用其他样式的子元素：基础样式、链接样式、下一段落样式
+STYLE_REFERENCE_TAGS = (qn('w:basedOn'), qn('w:link'), qn('w:next'))
+
+def _style_references(style_element):
+    """
+    样式引用的其他样式的styleId（按basedOn、link、next的顺序）
+    """
+    for child in style_element.iterchildren(*STYLE_REFERENCE_TAGS):
+        style_id = child.get(W_VAL)
+        if style_id:
+            yield child, style_id
+
+def _numbering_element(doc, create=False):
+    """
+    文档的编号部件根元素（w:numbering）；没有编号部件时返回None，create=True时新建
+    """
+    if create:
+        return doc.part.numbering_part.element
+    try:
+        return doc.part.part_related_by(RT.NUMBERING).element
+    except KeyError:
+        return None
+
+def _insert_before_first(parent, element, following_tags):
+    """
+    按架构顺序插入：放在第一个following_tags元素之前，没有时追加到末尾
+    """
+    for child in parent.iterchildren(*following_tags):
+        child.addprevious(element)
+        return
+    parent.append(element)
+
+def canonical_xml(element):
+    """
+    元素的规范化XML（排他式c14n，不受所在文档声明的命名空间和属性顺序影响），用于比较两个文档中的定义
+    """
+    return etree.tostring(element, method='c14n', exclusive=True)
+
+def _numbering_signature(numbering, num_id, id_map=None):
+    """
+    编号实例的定义摘要：w:num的覆盖设置加上抽象编号定义，不含编号本身和导入时会改写的标识
+    id_map不为空时把抽象编号中关联的段落样式按映射改写（与导入时一致），编号不存在时返回None
+    """
+    num = next((num for num in numbering.iterchildren(W_NUM) if num.get(W_NUM_ID) == num_id), None)
+    if num is None:
+        return None
+    num = copy.deepcopy(num)
+    num.attrib.pop(W_NUM_ID, None)
+    abstract = None
+    abstract_num_id_element = num.find(W_ABSTRACT_NUM_ID)
+    if abstract_num_id_element is not None:
+        abstract_id = abstract_num_id_element.get(W_VAL)
+        num.remove(abstract_num_id_element)
+        abstract = next((abstract for abstract in numbering.iterchildren(W_ABSTRACT_NUM)
+                         if abstract.get(W_ABSTRACT_NUM_ID) == abstract_id), None)
+    if abstract is None:
+        return canonical_xml(num)
+    
+    abstract = copy.deepcopy(abstract)
+    abstract.attrib.pop(W_ABSTRACT_NUM_ID, None)
+    for nsid in abstract.findall(W_NSID):
+        abstract.remove(nsid)
+    if id_map:
+        for pstyle in abstract.iter(W_PSTYLE):
+            mapped = id_map.get(pstyle.get(W_VAL))
+            if mapped:
+                pstyle.set(W_VAL, mapped)
+    return canonical_xml(num) + canonical_xml(abstract)
+
+def _next_free_number(elements, attribute):
+    return max((int(value) for value in (el.get(attribute) for el in elements) if value and value.isdigit()),
+               default=0) + 1
+
+class StylesMerger:
+    def __init__(self, template_doc, policy=None, metrics=None):
+        """
+        template_doc: 已加载的格式模板文档；模板的样式索引只建立一次，可重复合并到多个文档
+        policy: 同名样式的冲突策略（keep或replace），默认使用config.STYLE_MERGE_POLICY
+        """
+        self.policy = policy or config.STYLE_MERGE_POLICY
+        if self.policy not in MERGE_POLICIES:
+            raise ValueError(f"未知的样式冲突策略: {self.policy}（可选: {', '.join(MERGE_POLICIES)}）")
+        self.template_doc = template_doc
+        self.template_index = StyleIndex(template_doc)
+        self.template_numbering = _numbering_element(template_doc)
+        # 模板中的文档顺序，导入的样式按模板中的顺序追加
+        self._template_order = {
+            id(style_element): position
+            for position, style_element in enumerate(self.template_index.styles_element.iterchildren(W_STYLE))
+        }
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
+        # 最近一次合并中实际被替换的目标样式元素
+        self.replaced = []
+    
+    def merge(self, doc, names=None, style_index=None):
+        """
+        把模板中的样式（names为样式名称，默认为模板中的全部样式）及其依赖合并到目标文档
+        style_index为目标文档的样式索引，合并后新导入的样式会登记到其中
+        返回统计：导入、替换、保留的样式数和导入的编号定义数
+        """
+        if style_index is None:
+            style_index = StyleIndex(doc)
+        if names is None:
+            names = [style_element.name_val for style_element in self.template_index.styles_element.iterchildren(W_STYLE)]
+        
+        with self.metrics.stage('styles_merge') as counts:
+            id_map, imports, replacements, kept = self._resolve(names, style_index)
+            self.replaced = []
+            
+            num_map = {}
+            styles_element = style_index.styles_element
+            for template_style in sorted(imports, key=lambda el: self._template_order.get(id(el), 0)):
+                new_style = self._copy_style(doc, template_style, id_map, num_map)
+                new_style.set(W_STYLE_ID, id_map[template_style.styleId])
+                # 目标文档已有自己的默认样式，导入的样式不再作为默认样式
+                new_style.attrib.pop(W_DEFAULT, None)
+                styles_element.append(new_style)
+                style_index.add(new_style)
+            
+            # 内容与模板定义相同的同名样式不替换，按保留计数，已符合模板的文档不会被判为已修改
+            self.replaced = [target_style for template_style, target_style in replacements
+                             if self._replace_style(doc, target_style, template_style, id_map, num_map)]
+            replaced = len(self.replaced)
+            kept += len(replacements) - replaced
+            
+            stats = {
+                'imported_styles': len(imports),
+                'replaced_styles': replaced,
+                'kept_styles': kept,
+                'imported_numbering': len(num_map)
+            }
+            counts.update(stats)
+        
+        if imports or replaced:
+            logger.summary('styles_merge',
+                           f"合并模板样式完成: 导入 {len(imports)} 个，替换 {replaced} 个，"
+                           f"保留 {kept} 个，导入编号定义 {len(num_map)} 个",
+                           **stats)
+        return stats
+    
+    def _resolve(self, names, style_index):
+        """
+        一次遍历确定需要导入的样式闭包和模板styleId到目标styleId的映射
+        目标文档中已有同名样式时按冲突策略处理：keep时使用目标的样式且不再展开它的依赖
+        """
+        template_index = self.template_index
+        id_map = {}
+        imports = []
+        replacements = []
+        kept = 0
+        # 目标文档中已占用或已分配的styleId
+        used_ids = set(style_index.by_id)
+        
+        pending = []
+        for name in names:
+            template_style = template_index.find_element(name)
+            if template_style is None:
+                logger.debug(f"  模板中没有样式: {name}")
+            else:
+                pending.append(template_style)
+        # 按给定的顺序处理（后进先出）
+        pending.reverse()
+        
+        while pending:
+            template_style = pending.pop()
+            template_id = template_style.styleId
+            if template_id in id_map:
+                continue
+            
+            # 与应用格式时的查找一致：按界面名称查找，同时匹配别名和中文版Word的本地化名称
+            name = template_style.name_val
+            target_style = style_index.find_element(BabelFish.internal2ui(name)) if name else None
+            if target_style is not None:
+                id_map[template_id] = target_style.styleId
+                if self.policy == 'keep':
+                    kept += 1
+                    continue
+                replacements.append((template_style, target_style))
+            else:
+                id_map[template_id] = self._allocate_id(template_id, used_ids)
+                imports.append(template_style)
+            
+            for _, referenced_id in _style_references(template_style):
+                referenced = template_index.by_id.get(referenced_id)
+                if referenced is not None and referenced_id not in id_map:
+                    pending.append(referenced)
+        
+        return id_map, imports, replacements, kept
+    
+    def _allocate_id(self, template_id, used_ids):
+        """
+        为导入的样式分配styleId：模板的styleId在目标文档中未被占用时沿用，
+        否则纯数字的styleId（WPS生成的文档）取下一个未占用的数字，其他加数字后缀
+        """
+        style_id = template_id
+        if style_id in used_ids and template_id.isdigit():
+            style_id = str(max(int(used) for used in used_ids if used.isdigit()) + 1)
+        suffix = 1
+        while style_id in used_ids:
+            suffix += 1
+            style_id = f"{template_id}{suffix}"
+        used_ids.add(style_id)
+        return style_id
+    
+    def _copy_style(self, doc, template_style, id_map, num_map, import_numbering=True):
+        """
+        深拷贝模板样式，按映射改写引用的样式和编号定义；引用了模板中不存在的样式时删除该引用
+        import_numbering=False时不复制编号定义，numId保持模板中的取值
+        """
+        new_style = copy.deepcopy(template_style)
+        for reference, referenced_id in list(_style_references(new_style)):
+            if referenced_id in id_map:
+                reference.set(W_VAL, id_map[referenced_id])
+            else:
+                new_style.remove(reference)
+        
+        if not import_numbering:
+            return new_style
+        
+        for num_id_element in new_style.iter(W_NUM_ID):
+            num_id = num_id_element.get(W_VAL)
+            # numId为0表示取消继承的编号，不需要导入
+            if num_id and num_id != '0':
+                new_num_id = self._import_numbering(doc, num_id, id_map, num_map)
+                if new_num_id is not None:
+                    num_id_element.set(W_VAL, new_num_id)
+        return new_style
+    
+    def _replace_style(self, doc, target_style, template_style, id_map, num_map):
+        """
+        用模板的定义替换目标样式的内容，保留目标的styleId和默认样式标记，索引中的元素保持不变
+        先按规范化XML比较，目标样式已与模板定义相同时不替换（也不导入编号定义），返回是否替换
+        """
+        new_style = self._copy_style(doc, template_style, id_map, num_map, import_numbering=False)
+        candidate = copy.deepcopy(new_style)
+        self._match_numbering(doc, candidate, id_map)
+        for attribute in (W_STYLE_ID, W_DEFAULT):
+            candidate.attrib.pop(attribute, None)
+            if target_style.get(attribute) is not None:
+                candidate.set(attribute, target_style.get(attribute))
+        if canonical_xml(candidate) == canonical_xml(target_style):
+            return False
+        
+        # 目标文档中已有等价的编号定义时直接引用，避免重复替换时每次都复制一份编号
+        self._match_numbering(doc, new_style, id_map, num_map)
+        for attribute in list(target_style.attrib):
+            if attribute not in (W_STYLE_ID, W_DEFAULT):
+                del target_style.attrib[attribute]
+        for attribute, value in new_style.attrib.items():
+            if attribute not in (W_STYLE_ID, W_DEFAULT):
+                target_style.set(attribute, value)
+        target_style[:] = list(new_style)
+        return True
+    
+    def _match_numbering(self, doc, style, id_map, num_map=None):
+        """
+        把样式中模板的numId改为目标文档中定义等价的numId；找不到时传入了num_map则导入模板的编号定义，
+        否则置空（与目标样式比较时视为不同）
+        """
+        target_numbering = _numbering_element(doc)
+        target_signatures = None
+        for num_id_element in style.iter(W_NUM_ID):
+            num_id = num_id_element.get(W_VAL)
+            if not num_id or num_id == '0':
+                continue
+            if target_signatures is None:
+                target_signatures = {} if target_numbering is None else {
+                    _numbering_signature(target_numbering, num.get(W_NUM_ID)): num.get(W_NUM_ID)
+                    for num in target_numbering.iterchildren(W_NUM)
+                }
+            matched = None
+            if self.template_numbering is not None:
+                signature = _numbering_signature(self.template_numbering, num_id, id_map)
+                matched = target_signatures.get(signature) if signature is not None else None
+            if matched is None and num_map is not None:
+                # 模板中也没有该编号时与导入样式一样保留原numId
+                matched = self._import_numbering(doc, num_id, id_map, num_map) or num_id
+            num_id_element.set(W_VAL, matched or '')
+    
+    def _import_numbering(self, doc, num_id, id_map, num_map):
+        """
+        把模板中的编号实例（w:num）及其抽象编号定义复制到目标文档，返回目标文档中的numId
+        同一合并中多次引用的编号只复制一次
+        """
+        if num_id in num_map:
+            return num_map[num_id]
+        if self.template_numbering is None:
+            return None
+        
+        template_num = next((num for num in self.template_numbering.iterchildren(W_NUM)
+                             if num.get(W_NUM_ID) == num_id), None)
+        if template_num is None:
+            logger.warning(f"  警告：模板中没有编号定义 numId={num_id}")
+            return None
+        
+        numbering = _numbering_element(doc, create=True)
+        new_num = copy.deepcopy(template_num)
+        new_num_id = str(_next_free_number(numbering.iterchildren(W_NUM), W_NUM_ID))
+        new_num.set(W_NUM_ID, new_num_id)
+        
+        abstract_num_id_element = new_num.find(W_ABSTRACT_NUM_ID)
+        if abstract_num_id_element is not None:
+            template_abstract_id = abstract_num_id_element.get(W_VAL)
+            template_abstract = next((abstract for abstract in self.template_numbering.iterchildren(W_ABSTRACT_NUM)
+                                      if abstract.get(W_ABSTRACT_NUM_ID) == template_abstract_id), None)
+            if template_abstract is not None:
+                new_abstract = copy.deepcopy(template_abstract)
+                new_abstract_id = str(_next_free_number(numbering.iterchildren(W_ABSTRACT_NUM), W_ABSTRACT_NUM_ID))
+                new_abstract.set(W_ABSTRACT_NUM_ID, new_abstract_id)
+                # nsid相同的列表会被Word视为同一列表，复制的定义不保留
+                for nsid in new_abstract.findall(W_NSID):
+                    new_abstract.remove(nsid)
+                # 编号级别关联的段落样式改为目标文档中的styleId
+                for pstyle in new_abstract.iter(W_PSTYLE):
+                    mapped = id_map.get(pstyle.get(W_VAL))
+                    if mapped:
+                        pstyle.set(W_VAL, mapped)
+                _insert_before_first(numbering, new_abstract, (W_NUM, W_NUM_ID_MAC_AT_CLEANUP))
+                abstract_num_id_element.set(W_VAL, new_abstract_id)
+        
+        _insert_before_first(numbering, new_num, (W_NUM_ID_MAC_AT_CLEANUP,))
+        num_map[num_id] = new_num_id
+        return new_num_id
+    
+    def merge_document(self, input_path, output_path, names=None):
+        """
+        合并模板样式到文档并保存
+        """
+        try:
+            logger.info(f"=== 合并模板样式: {input_path} ===")
+            
+            with self.metrics.stage('load'):
+                doc = Document(input_path)
+            
+            stats = self.merge(doc, names)
+            
+            # 未修改的图片等成员直通复制
+            with self.metrics.stage('save'):
+                save_document(doc, output_path, source=input_path)
+            
+            logger.info(f"合并后的文档已保存到: {output_path}")
+            
+            return stats
+        
+        except Exception as e:
+            logger.error(f"合并模板样式时出错: {e}")
+            return None
+
+def main():
+    """
+    主函数：把格式模板的样式定义合并到文档
+    """
+    parser = argparse.ArgumentParser(description="把格式模板中的样式定义（含依赖样式和编号定义）合并到文档")
+    parser.add_argument('input', nargs='?', default=config.TEST_DOCUMENT, help="目标文档")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "测试文档_合并样式后.docx"),
+                        help="合并后的文档路径")
+    parser.add_argument('--template', default=config.TEMPLATE_FILE, help="格式模板文档")
+    parser.add_argument('--policy', choices=MERGE_POLICIES, default=config.STYLE_MERGE_POLICY,
+                        help="目标文档已有同名样式时的处理方式")
+    parser.add_argument('--styles', nargs='+', default=None, help="只合并指定的样式（默认合并模板中的全部样式）")
+    args = parser.parse_args()
+    configure_logging()
+    
+    for path in (args.input, args.template):
+        if not os.path.exists(path):
+            print(f"错误：找不到文档 {path}")
+            return
+    
+    config.ensure_output_dir()
+    merger = StylesMerger(Document(args.template), policy=args.policy)
+    stats = merger.merge_document(args.input, args.output, args.styles)
+    if stats:
+        print(f"导入 {stats['imported_styles']} 个样式，替换 {stats['replaced_styles']} 个，"
+              f"保留 {stats['kept_styles']} 个，导入编号定义 {stats['imported_numbering']} 个")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板格式信息缓存
+功能：以模板文件内容的SHA-256摘要和提取器版本作为键缓存提取结果
+命中缓存时直接读取格式信息，无需再解析模板docx；模板内容变化时自动重新提取
+"""
+
+import os
+import json
+import argparse
+from config import config
+from dynamic_format_extractor import DynamicFormatExtractor, EXTRACTOR_VERSION, compute_template_digest
+from format_profile import FormatProfile, ProfileSchemaError
+from profile_store import load_profile, save_profile, PROFILE_EXTENSION
+from format_logging import get_logger, configure_logging
+
+logger = get_logger('template_profile_cache')
+
+class TemplateProfileCache:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or config.PROFILE_CACHE_DIR
+        # 进程内缓存：键 -> 格式信息，常驻进程重复请求时不再读取文件
+        self._profiles = {}
+        # 键 -> 带类型的格式信息（每个模板只解析一次，多个应用器共用）
+        self._format_profiles = {}
+    
+    def cache_key(self, template_digest):
+        """
+        缓存键：模板内容摘要 + 提取器版本
+        """
+        return f"{template_digest}-v{EXTRACTOR_VERSION}"
+    
+    def profile_path(self, cache_key):
+        """
+        缓存键对应的格式信息文件路径
+        """
+        return os.path.join(self.cache_dir, f"{cache_key}.json")
+    
+    def binary_path(self, cache_key):
+        """
+        缓存键对应的二进制格式信息文件路径（加载时优先读取，JSON文件保留供人工查看）
+        """
+        return os.path.join(self.cache_dir, f"{cache_key}{PROFILE_EXTENSION}")
+    
+    def lookup(self, template_path):
+        """
+        只查询缓存，不提取；未命中时返回None
+        """
+        key = self.cache_key(compute_template_digest(template_path))
+        return self._load_cached(key)
+    
+    def get_profile(self, template_path, refresh=False):
+        """
+        获取模板的格式信息：命中缓存时直接返回，未命中（或refresh=True）时提取并写入缓存
+        """
+        if not os.path.exists(template_path):
+            logger.error(f"错误：模板文件不存在: {template_path}")
+            return None
+        
+        key = self.cache_key(compute_template_digest(template_path))
+        
+        if not refresh:
+            profile = self._load_cached(key)
+            if profile is not None:
+                return profile
+        
+        logger.info(f"模板格式缓存未命中，开始提取: {template_path}")
+        profile = self._extract_to_cache(template_path, key)
+        if profile is not None:
+            self._profiles[key] = profile
+        return profile
+    
+    def format_profile(self, profile):
+        """
+        格式信息对应的带类型模型，按缓存键只解析一次
+        """
+        key = self.cache_key(profile['template_sha256'])
+        format_profile = self._format_profiles.get(key)
+        if format_profile is None:
+            format_profile = FormatProfile.from_format_info(profile)
+            self._format_profiles[key] = format_profile
+        return format_profile
+    
+    def _load_cached(self, key):
+        """
+        按缓存键读取格式信息，先查进程内缓存，再查缓存目录中的二进制文件，最后查JSON文件
+        """
+        if key in self._profiles:
+            return self._profiles[key]
+        
+        binary_path = self.binary_path(key)
+        if os.path.exists(binary_path):
+            try:
+                format_profile = load_profile(binary_path)
+            except (OSError, ProfileSchemaError) as e:
+                logger.warning(f"读取二进制模板格式缓存 {binary_path} 时出错，改为读取JSON: {e}")
+            else:
+                profile = format_profile.to_dict()
+                self._profiles[key] = profile
+                self._format_profiles[key] = format_profile
+                return profile
+        
+        path = self.profile_path(key)
+        if not os.path.exists(path):
+            return None
+        
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except Exception as e:
+            logger.error(f"读取模板格式缓存 {path} 时出错: {e}")
+            return None
+        
+        # 只有JSON的旧缓存补写二进制文件，下次直接读取
+        self._save_binary(key, profile)
+        self._profiles[key] = profile
+        return profile
+    
+    def _save_binary(self, key, profile):
+        """
+        把格式信息转换为带类型模型并保存为二进制文件；失败时只记录警告（仍可使用JSON缓存）
+        """
+        try:
+            format_profile = FormatProfile.from_format_info(profile)
+            save_profile(format_profile, self.binary_path(key))
+        except (OSError, ProfileSchemaError) as e:
+            logger.warning(f"保存二进制模板格式缓存时出错: {e}")
+            return None
+        self._format_profiles[key] = format_profile
+        return format_profile
+    
+    def _extract_to_cache(self, template_path, key):
+        """
+        提取模板格式信息，先写临时文件再原子替换，避免并发进程读到半写入的缓存
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        final_path = self.profile_path(key)
+        temp_path = f"{final_path}.{os.getpid()}.tmp"
+        
+        extractor = DynamicFormatExtractor(template_path)
+        profile = extractor.extract_template_formats(template_path, output_path=temp_path)
+        if profile is None or not os.path.exists(temp_path):
+            return None
+        
+        os.replace(temp_path, final_path)
+        self._save_binary(key, profile)
+        return profile
+    
+    def clear(self):
+        """
+        清空缓存目录和进程内缓存
+        """
+        self._profiles.clear()
+        self._format_profiles.clear()
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.json', PROFILE_EXTENSION)):
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+def main():
+    """
+    主函数：预热或查询模板格式缓存
+    """
+    parser = argparse.ArgumentParser(description="模板格式信息缓存（按模板内容摘要）")
+    parser.add_argument('templates', nargs='*', default=[config.TEMPLATE_FILE], help="格式模板文档")
+    parser.add_argument('--cache-dir', default=config.PROFILE_CACHE_DIR, help="缓存目录")
+    parser.add_argument('--refresh', action='store_true', help="忽略已有缓存，重新提取")
+    parser.add_argument('--clear', action='store_true', help="清空缓存目录")
+    args = parser.parse_args()
+    configure_logging()
+    
+    cache = TemplateProfileCache(args.cache_dir)
+    
+    if args.clear:
+        print(f"已清除 {cache.clear()} 个缓存的格式信息")
+        return
+    
+    for template_path in args.templates:
+        profile = cache.get_profile(template_path, refresh=args.refresh)
+        if profile:
+            key = cache.cache_key(profile['template_sha256'])
+            print(f"{template_path}: {cache.profile_path(key)}（{len(profile.get('styles', {}))} 个样式）")
+
+if __name__ == "__main__":
+    main()
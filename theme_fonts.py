@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+主题字体解析
+功能：读取文档主题部件（word/theme/theme1.xml）的字体方案，建立
+主要/次要字体 × 西文(latin)/东亚(ea)/复杂文种(cs) 的字体表（含<a:font script="Hans">等按文种指定的字体），
+结合settings.xml中的w:themeFontLang，把样式中的asciiTheme/eastAsiaTheme等主题字体解析为实际字体名称
+每个文档只读取一次主题部件，结果按文档缓存；文档没有主题部件时使用默认映射THEME_FONT_MAP
+"""
+
+import io
+import weakref
+import zipfile
+import posixpath
+from lxml import etree
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+DRAWINGML_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+PACKAGE_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# 主题字体名称到实际字体名称的默认映射（文档没有主题部件时使用）
+THEME_FONT_MAP = {
+    'majorHAnsi': 'Calibri Light',
+    'minorHAnsi': 'Calibri',
+    'majorBidi': 'Times New Roman',
+    'minorBidi': 'Arial'
+}
+
+# 主题字体名称（w:asciiTheme等属性的取值） -> (主要/次要, 字体槽位)
+THEME_FONT_SLOTS = {
+    'majorAscii': ('major', 'latin'),
+    'majorHAnsi': ('major', 'latin'),
+    'majorEastAsia': ('major', 'ea'),
+    'majorBidi': ('major', 'cs'),
+    'minorAscii': ('minor', 'latin'),
+    'minorHAnsi': ('minor', 'latin'),
+    'minorEastAsia': ('minor', 'ea'),
+    'minorBidi': ('minor', 'cs')
+}
+
+# 语言 -> 字体方案中<a:font script>的文种代码（先按完整语言标记查找，再按语言前缀）
+SCRIPT_BY_LANGUAGE = {
+    'zh-CN': 'Hans', 'zh-SG': 'Hans',
+    'zh-TW': 'Hant', 'zh-HK': 'Hant', 'zh-MO': 'Hant',
+    'zh': 'Hans', 'ja': 'Jpan', 'ko': 'Hang',
+    'ar': 'Arab', 'he': 'Hebr', 'fa': 'Arab', 'ur': 'Arab', 'th': 'Thai', 'vi': 'Viet'
+}
+
+# 未设置w:themeFontLang时东亚字体使用的语言
+DEFAULT_EAST_ASIA_LANGUAGE = 'zh-CN'
+
+def script_for_language(language):
+    if not language:
+        return None
+    return SCRIPT_BY_LANGUAGE.get(language) or SCRIPT_BY_LANGUAGE.get(language.split('-')[0])
+
+class ThemeFontTable:
+    """
+    解析后的主题字体表
+    fonts: (major/minor, latin/ea/cs) -> 字体名称（字体方案中为空的槽位不记录）
+    scripts: (major/minor, 文种代码) -> 字体名称
+    """
+    def __init__(self, fonts=None, scripts=None, east_asia_language=None, bidi_language=None, scheme_name=None):
+        self.fonts = fonts or {}
+        self.scripts = scripts or {}
+        self.east_asia_language = east_asia_language or DEFAULT_EAST_ASIA_LANGUAGE
+        self.bidi_language = bidi_language
+        self.scheme_name = scheme_name
+        self._map = None
+    
+    @classmethod
+    def from_theme_xml(cls, theme_xml, east_asia_language=None, bidi_language=None):
+        """
+        从主题部件的XML（bytes）解析字体方案
+        """
+        root = etree.fromstring(theme_xml)
+        scheme = root.find(f'.//{{{DRAWINGML_NS}}}fontScheme')
+        if scheme is None:
+            return cls(east_asia_language=east_asia_language, bidi_language=bidi_language)
+        
+        fonts = {}
+        scripts = {}
+        for group, tag in (('major', 'majorFont'), ('minor', 'minorFont')):
+            font_group = scheme.find(f'{{{DRAWINGML_NS}}}{tag}')
+            if font_group is None:
+                continue
+            for slot in ('latin', 'ea', 'cs'):
+                element = font_group.find(f'{{{DRAWINGML_NS}}}{slot}')
+                if element is not None and element.get('typeface'):
+                    fonts[(group, slot)] = element.get('typeface')
+            for element in font_group.findall(f'{{{DRAWINGML_NS}}}font'):
+                if element.get('script') and element.get('typeface'):
+                    scripts[(group, element.get('script'))] = element.get('typeface')
+        
+        return cls(fonts, scripts, east_asia_language, bidi_language, scheme.get('name'))
+    
+    def resolve(self, theme_font):
+        """
+        将主题字体名称（如minorEastAsia）解析为实际字体名称，无法解析时返回None
+        东亚/复杂文种槽位为空时，按themeFontLang对应文种的<a:font script>字体
+        """
+        slot = THEME_FONT_SLOTS.get(theme_font)
+        if slot is None:
+            return None
+        
+        font = self.fonts.get(slot)
+        if font:
+            return font
+        
+        group, kind = slot
+        if kind == 'ea':
+            script = script_for_language(self.east_asia_language)
+        elif kind == 'cs':
+            script = script_for_language(self.bidi_language) or 'Arab'
+        else:
+            script = None
+        if script:
+            font = self.scripts.get((group, script))
+        return font or THEME_FONT_MAP.get(theme_font)
+    
+    def as_map(self):
+        """
+        主题字体名称 -> 实际字体名称的映射（与THEME_FONT_MAP格式相同，供read_rpr使用）
+        """
+        if self._map is None:
+            self._map = dict(THEME_FONT_MAP)
+            for theme_font in THEME_FONT_SLOTS:
+                font = self.resolve(theme_font)
+                if font:
+                    self._map[theme_font] = font
+        return self._map
+    
+    def to_dict(self):
+        return {
+            'scheme_name': self.scheme_name,
+            'east_asia_language': self.east_asia_language,
+            'bidi_language': self.bidi_language,
+            'fonts': {f"{group}.{slot}": font for (group, slot), font in sorted(self.fonts.items())},
+            'resolved': dict(sorted(self.as_map().items()))
+        }
+
+def _theme_languages(settings_element):
+    """
+    settings.xml中w:themeFontLang的东亚和复杂文种语言
+    """
+    if settings_element is None:
+        return None, None
+    theme_font_lang = settings_element.find(qn('w:themeFontLang'))
+    if theme_font_lang is None:
+        return None, None
+    return theme_font_lang.get(qn('w:eastAsia')), theme_font_lang.get(qn('w:bidi'))
+
+# 按文档部件缓存解析结果，文档释放后自动清除
+_table_cache = weakref.WeakKeyDictionary()
+
+def read_theme_fonts(doc):
+    """
+    读取Document对象的主题字体表（每个文档只读取一次主题部件）
+    文档没有主题部件时返回None
+    """
+    part = doc.part
+    if part in _table_cache:
+        return _table_cache[part]
+    
+    theme_part = settings_part = None
+    for rel in part.rels.values():
+        if rel.is_external:
+            continue
+        if rel.reltype == RT.THEME:
+            theme_part = rel.target_part
+        elif rel.reltype == RT.SETTINGS:
+            settings_part = rel.target_part
+    
+    table = None
+    if theme_part is not None:
+        east_asia, bidi = _theme_languages(getattr(settings_part, 'element', None))
+        table = ThemeFontTable.from_theme_xml(theme_part.blob, east_asia, bidi)
+    
+    _table_cache[part] = table
+    return table
+
+def read_theme_fonts_from_package(source):
+    """
+    直接从.docx（路径、bytes或已打开的ZipFile）读取主题字体表，不加载整个文档
+    """
+    if isinstance(source, zipfile.ZipFile):
+        return _read_theme_fonts_from_zip(source)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        return _read_theme_fonts_from_zip(archive)
+
+def _read_theme_fonts_from_zip(archive):
+    names = set(archive.namelist())
+    theme_name = None
+    if 'word/_rels/document.xml.rels' in names:
+        rels = etree.fromstring(archive.read('word/_rels/document.xml.rels'))
+        for rel in rels.findall(f'{{{PACKAGE_RELS_NS}}}Relationship'):
+            if rel.get('Type') == RT.THEME and rel.get('TargetMode') != 'External':
+                theme_name = posixpath.normpath(posixpath.join('word', rel.get('Target')))
+                break
+    if theme_name is None or theme_name not in names:
+        return None
+    
+    settings = etree.fromstring(archive.read('word/settings.xml')) if 'word/settings.xml' in names else None
+    east_asia, bidi = _theme_languages(settings)
+    return ThemeFontTable.from_theme_xml(archive.read(theme_name), east_asia, bidi)
+
+def theme_font_map_for(doc):
+    """
+    文档的主题字体映射：doc为Document对象时读取（并缓存）其主题部件，
+    其他情况（只有样式部件）或文档没有主题部件时返回默认映射THEME_FONT_MAP
+    """
+    if hasattr(doc, 'part') and hasattr(doc, 'styles'):
+        table = read_theme_fonts(doc)
+        if table is not None:
+            return table.as_map()
+    return THEME_FONT_MAP
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+XML精简器
+功能：在加载文档之前，一次流式处理所有正文部件（document.xml、页眉页脚、脚注尾注、批注），
+删除修订标识属性（w:rsidR、w:rsidRPr、w:rsidP等）、校对标记w:proofErr和w:lastRenderedPageBreak，
+并删除settings.xml中的修订标识表w:rsids；这些内容不影响排版，Word打开时会重新生成
+经过多人编辑的稿件中这类内容往往占document.xml的三到五成，精简后解析、格式化和保存都更快
+其他zip成员按原始压缩数据直通复制
+"""
+
+import io
+import os
+import zipfile
+import argparse
+from lxml import etree
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.oxml.ns import qn
+from config import config
+from streaming_run_cleaner import stream_rewrite_xml, rewrite_docx_members
+from docx_passthrough_writer import read_source_bytes
+from stage_metrics import StageMetrics
+from format_logging import get_logger, add_logging_arguments, configure_logging_from_args
+
+logger = get_logger('xml_slimmer')
+
+CONTENT_TYPES_PART = '[Content_Types].xml'
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+
+# 正文部件的内容类型 -> 流式处理的块深度
+# document.xml: w:document(0) > w:body(1) > 段落/表格(2)；页眉页脚等: 根元素(0) > 段落/表格/脚注/批注(1)
+STORY_BLOCK_DEPTHS = {
+    CT.WML_DOCUMENT_MAIN: 2,
+    'application/vnd.ms-word.document.macroEnabled.main+xml': 2,
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.template.main+xml': 2,
+    'application/vnd.ms-word.template.macroEnabledTemplate.main+xml': 2,
+    CT.WML_HEADER: 1,
+    CT.WML_FOOTER: 1,
+    CT.WML_FOOTNOTES: 1,
+    CT.WML_ENDNOTES: 1,
+    CT.WML_COMMENTS: 1
+}
+
+# 删除的修订标识属性
+RSID_ATTRIBUTES = tuple(qn(f'w:{name}') for name in
+                        ('rsidR', 'rsidRPr', 'rsidRDefault', 'rsidP', 'rsidDel', 'rsidSect', 'rsidTr'))
+
+# 删除的元素：校对标记、上次渲染时的分页位置
+NOISE_ELEMENTS = (qn('w:proofErr'), qn('w:lastRenderedPageBreak'))
+
+W_RSIDS = qn('w:rsids')
+
+def read_content_types(archive):
+    """
+    读取[Content_Types].xml中按部件指定的内容类型：成员名 -> 内容类型
+    """
+    root = etree.fromstring(archive.read(CONTENT_TYPES_PART))
+    content_types = {}
+    for override in root.iterfind(f'{{{CONTENT_TYPES_NS}}}Override'):
+        content_types[override.get('PartName').lstrip('/')] = override.get('ContentType')
+    return content_types
+
+class XmlSlimmer:
+    def __init__(self, metrics=None, strip_settings_rsids=True):
+        """
+        strip_settings_rsids: 同时删除settings.xml中的修订标识表w:rsids
+        """
+        self.strip_settings_rsids = strip_settings_rsids
+        self.removed_elements = 0
+        # 分阶段性能指标（未传入时不记录）
+        self.metrics = metrics or StageMetrics(enabled=False)
+    
+    def _slim_container(self, element):
+        etree.strip_attributes(element, *RSID_ATTRIBUTES)
+    
+    def _slim_block(self, block):
+        """
+        处理一个块：删除其中所有元素的修订标识属性和噪声元素；块本身是噪声元素时整体丢弃
+        """
+        if block.tag in NOISE_ELEMENTS:
+            self.removed_elements += 1
+            return False
+        
+        self.removed_elements += sum(1 for _ in block.iter(*NOISE_ELEMENTS))
+        etree.strip_elements(block, *NOISE_ELEMENTS, with_tail=False)
+        etree.strip_attributes(block, *RSID_ATTRIBUTES)
+        return True
+    
+    def _slim_settings_block(self, block):
+        if block.tag == W_RSIDS:
+            self.removed_elements += len(block) + 1
+            return False
+        return True
+    
+    def _story_rewriter(self, block_depth):
+        def rewrite(source, target):
+            return stream_rewrite_xml(source, target, block_depth, self._slim_block, self._slim_container)
+        return rewrite
+    
+    def _settings_rewriter(self, source, target):
+        # w:settings(0) > 各项设置(1)
+        return stream_rewrite_xml(source, target, 1, self._slim_settings_block)
+    
+    def _rewriters(self, source):
+        """
+        按内容类型确定需要精简的成员
+        """
+        with zipfile.ZipFile(source) as archive:
+            content_types = read_content_types(archive)
+        
+        rewriters = {}
+        for name, content_type in content_types.items():
+            block_depth = STORY_BLOCK_DEPTHS.get(content_type)
+            if block_depth is not None:
+                rewriters[name] = self._story_rewriter(block_depth)
+            elif content_type == CT.WML_SETTINGS and self.strip_settings_rsids:
+                rewriters[name] = self._settings_rewriter
+        return rewriters
+    
+    def slim_docx(self, source, target):
+        """
+        精简docx：source为路径或可读的二进制文件对象，target为路径或可写的二进制文件对象
+        返回统计：各部件精简前后的大小、总共节省的字节数和删除的元素数
+        """
+        self.removed_elements = 0
+        with self.metrics.stage('xml_slimming') as counts:
+            rewriters = self._rewriters(source)
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            sizes = rewrite_docx_members(source, target, rewriters)
+            
+            bytes_before = sum(before for before, _ in sizes.values())
+            bytes_after = sum(after for _, after in sizes.values())
+            counts['parts'] = len(sizes)
+            counts['bytes_before'] = bytes_before
+            counts['bytes_after'] = bytes_after
+            counts['bytes_saved'] = bytes_before - bytes_after
+            counts['removed_elements'] = self.removed_elements
+        
+        saved = bytes_before - bytes_after
+        ratio = saved / bytes_before * 100 if bytes_before else 0.0
+        logger.summary('xml_slimming',
+                       f"精简XML完成: {len(sizes)} 个部件，{bytes_before} → {bytes_after} 字节，"
+                       f"节省 {saved} 字节（{ratio:.1f}%），删除元素 {self.removed_elements} 个",
+                       parts=len(sizes), bytes_before=bytes_before, bytes_after=bytes_after,
+                       bytes_saved=saved, removed_elements=self.removed_elements)
+        
+        return {
+            'parts': {name: {'bytes_before': before, 'bytes_after': after} for name, (before, after) in sizes.items()},
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'bytes_saved': saved,
+            'removed_elements': self.removed_elements
+        }
+    
+    def slim_bytes(self, data):
+        """
+        在内存中精简：data为.docx的路径、bytes或文件对象，返回精简后文档的bytes
+        """
+        if not isinstance(data, (str, os.PathLike)):
+            data = io.BytesIO(read_source_bytes(data))
+        buffer = io.BytesIO()
+        self.slim_docx(data, buffer)
+        return buffer.getvalue()
+    
+    def slim_document(self, input_path, output_path):
+        """
+        精简文档并保存
+        """
+        try:
+            logger.info(f"=== 精简文档XML: {input_path} ===")
+            self.slim_docx(input_path, output_path)
+            logger.info(f"精简后的文档已保存到: {output_path}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"精简文档XML时出错: {e}")
+            return False
+
+def main():
+    """
+    主函数：删除文档中的修订标识、校对标记等不影响排版的XML
+    """
+    parser = argparse.ArgumentParser(description="删除docx中的修订标识属性、校对标记和上次渲染分页标记")
+    parser.add_argument('input', nargs='?', default=config.TEST_DOCUMENT, help="要精简的文档")
+    parser.add_argument('-o', '--output', default=os.path.join(config.OUTPUT_DIR, "测试文档_精简后.docx"),
+                        help="精简后的文档路径")
+    parser.add_argument('--keep-settings-rsids', action='store_true', help="保留settings.xml中的修订标识表")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    
+    if not os.path.exists(args.input):
+        print(f"错误：找不到文档 {args.input}")
+        return
+    
+    XmlSlimmer(strip_settings_rsids=not args.keep_settings_rsids).slim_document(args.input, args.output)
+
+if __name__ == "__main__":
+    main()